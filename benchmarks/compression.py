@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure CPU time spent against bytes saved when compressing the `message`
+and serialized model fields of existing access log entries.
+
+    DJANGO_SETTINGS_MODULE=myproject.settings \\
+        python benchmarks/compression.py [--limit 10000] [--threshold 1024] [--dictionary path] [--train path]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_payloads(limit):
+    from timberjack import compression
+    from timberjack.documents import ObjectAccessLog
+    from timberjack.fields import ModelField
+
+    payloads = []
+    entries = ObjectAccessLog.objects.only('message', 'user', 'content_type').limit(limit).as_pymongo()
+    for entry in entries:
+        message = entry.get('message')
+        if compression.is_compressed(message):
+            message = compression.decompress(message).decode('utf-8')
+        if message:
+            payloads.append(message.encode('utf-8'))
+        for name in ('user', 'content_type'):
+            value = entry.get(name)
+            if isinstance(value, dict) and ModelField.COMPRESSED_KEY in value:
+                value = ModelField.decompress(value)
+            if isinstance(value, dict) and isinstance(value.get('fields'), dict):
+                payloads.append(json.dumps(value['fields'], sort_keys=True).encode('utf-8'))
+    return payloads
+
+
+def train_dictionary(payloads, path, size):
+    import zstandard
+    dictionary = zstandard.train_dictionary(size, payloads)
+    with open(path, 'wb') as f:
+        f.write(dictionary.as_bytes())
+    return path
+
+
+def get_configs(threshold, dictionary):
+    from timberjack import compression
+
+    configs = []
+    for level in (1, 6, 9):
+        configs.append({'algorithm': 'zlib', 'level': level, 'threshold': threshold, 'dictionary': None})
+    if compression.zstandard is not None:
+        for level in (1, 3, 9):
+            configs.append({'algorithm': 'zstd', 'level': level, 'threshold': threshold, 'dictionary': None})
+    if dictionary:
+        for config in list(configs):
+            configs.append(dict(config, dictionary=dictionary))
+    return configs
+
+
+def measure(payloads, config):
+    from django.test.utils import override_settings
+    from timberjack import compression
+
+    with override_settings(TIMBERJACK_COMPRESSION=config):
+        config = compression.get_config()
+        start = time.process_time()
+        compressed = [compression.compress(payload, config) for payload in payloads]
+        compress_time = time.process_time() - start
+
+        start = time.process_time()
+        for value in compressed:
+            if value is not None:
+                compression.decompress(value)
+        decompress_time = time.process_time() - start
+
+    original = sum(len(payload) for payload in payloads)
+    stored = sum(len(value) if value is not None else len(payload)
+                 for payload, value in zip(payloads, compressed))
+    return {
+        'compressed': sum(1 for value in compressed if value is not None),
+        'original': original,
+        'stored': stored,
+        'compress_ms': compress_time * 1000,
+        'decompress_ms': decompress_time * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--limit', type=int, default=10000)
+    parser.add_argument('--threshold', type=int, default=1024)
+    parser.add_argument('--dictionary', help='Path to an existing shared dictionary.')
+    parser.add_argument('--train', metavar='PATH', help='Train a zstd dictionary from the payloads and save it to PATH.')
+    parser.add_argument('--dictionary-size', type=int, default=112640)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    import django
+    django.setup()
+
+    payloads = load_payloads(args.limit)
+    if not payloads:
+        print('No payloads found.')
+        return
+
+    dictionary = args.dictionary
+    if args.train:
+        dictionary = train_dictionary(payloads, args.train, args.dictionary_size)
+
+    print('{count} payloads, {size} bytes, {above} above the threshold of {threshold} bytes'.format(
+        count=len(payloads), size=sum(len(payload) for payload in payloads),
+        above=sum(1 for payload in payloads if len(payload) >= args.threshold), threshold=args.threshold))
+
+    for config in get_configs(args.threshold, dictionary):
+        result = measure(payloads, config)
+        saved = result['original'] - result['stored']
+        print('{algorithm:<5} level {level}  dict {dictionary:<3}  compressed {compressed:>7}  '
+              'saved {saved:>10} bytes ({ratio:5.1f}%)  compress {compress_ms:8.2f} ms  '
+              'decompress {decompress_ms:8.2f} ms  {per_kb:6.3f} ms CPU per KB saved'.format(
+                  algorithm=config['algorithm'], level=config['level'],
+                  dictionary='yes' if config['dictionary'] else 'no', saved=saved,
+                  ratio=100.0 * saved / result['original'],
+                  per_kb=(result['compress_ms'] + result['decompress_ms']) / max(saved / 1024.0, 1e-9),
+                  **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the cost of importing timberjack modules in a fresh interpreter.
+
+    python benchmarks/import_time.py [--runs 10] [module ...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    'timberjack.constants',
+    'timberjack.mixins',
+    'timberjack.compat.rest_framework.mixins',
+]
+
+HEAVY_MODULES = [
+    'mongoengine',
+    'pymongo',
+    'django.core.serializers',
+    'django.contrib.admin.models',
+    'django.forms',
+]
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def measure(module, runs):
+    timings, loaded = [], ''
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+                                         cwd=ROOT, universal_newlines=True)
+        lines = output.splitlines()
+        timings.append(float(lines[0]) * 1000)
+        loaded = lines[1] if len(lines) > 1 else ''
+    return timings, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        timings, loaded = measure(module, args.runs)
+        print('{module:<45} median {median:8.2f} ms   min {min:8.2f} ms   heavy: {loaded}'.format(
+            module=module, median=statistics.median(timings), min=min(timings), loaded=loaded or '-'))
+
+
+if __name__ == '__main__':
+    main()
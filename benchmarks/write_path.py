@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the cost of preparing an access log entry for insertion as a full
+`ObjectAccessLog` document and as a slotted `AccessRecord`. Nothing is
+written to MongoDB; the user and content type are serialized once up front.
+
+    python benchmarks/write_path.py [--entries 10000] [--runs 5]
+"""
+
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_fixtures():
+    from django.contrib.auth import get_user_model
+    from django.contrib.contenttypes.models import ContentType
+    from timberjack.records import serialize_model
+
+    user_model = get_user_model()
+    user = user_model(pk=1, username='benchmark@example.com', first_name='Bench', last_name='Mark')
+    content_type = ContentType(pk=1, app_label='auth', model='user')
+    return {
+        'user': serialize_model(user),
+        'content_type': serialize_model(content_type),
+        'object_repr': 'benchmark@example.com',
+        'action_flag': 2,
+        'ip_address': '10.0.0.1',
+    }
+
+
+def build_document(fixtures, object_pk):
+    from timberjack.documents import ObjectAccessLog, SubMessage
+
+    document = ObjectAccessLog(object_pk=object_pk,
+                               change_message=[SubMessage(action='changed', fields=['email', 'username'])],
+                               **fixtures)
+    document.validate()
+    return document
+
+
+def build_record(fixtures, object_pk):
+    from timberjack.records import AccessRecord
+
+    record = AccessRecord(object_pk=object_pk, change_message=[{'changed': {'fields': ['email', 'username']}}],
+                          **fixtures)
+    record.validate()
+    return record
+
+
+def measure(build, fixtures, entries, runs):
+    timings = []
+    for _ in range(runs):
+        gc.collect()
+        start = time.perf_counter()
+        for object_pk in range(entries):
+            build(fixtures, object_pk).to_mongo()
+        timings.append((time.perf_counter() - start) * 1e6 / entries)
+
+    # Memory blocks and bytes held by each entry before it is converted,
+    # excluding the shared fixtures.
+    gc.collect()
+    tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot()
+    built = [build(fixtures, object_pk) for object_pk in range(entries)]
+    stats = tracemalloc.take_snapshot().compare_to(snapshot, 'filename')
+    tracemalloc.stop()
+    del built
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    return timings, blocks / float(entries), size / float(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    import django
+    django.setup()
+
+    fixtures = get_fixtures()
+    for name, build in (('ObjectAccessLog', build_document), ('AccessRecord', build_record)):
+        timings, blocks, size = measure(build, fixtures, args.entries, args.runs)
+        print('{name:<16} median {median:8.2f} us/entry   min {min:8.2f} us/entry   '
+              '{blocks:8.1f} blocks/entry   {size:9.1f} bytes/entry'.format(
+                  name=name, median=statistics.median(timings), min=min(timings), blocks=blocks, size=size))
+
+
+if __name__ == '__main__':
+    main()
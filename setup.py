@@ -8,7 +8,7 @@ try:
 except ImportError:
     from ez_setup import use_setuptools
     use_setuptools()
-    from setuptools import setup
+    from setuptools import setup, find_packages
 
 
 def get_version(package):
@@ -28,9 +28,7 @@ setup(
     url='https://github.com/rhblind/django-timberjack',
     download_url='https://github.com/rhblind/django-timberjack.git',
     license='MIT License',
-    packages=[
-        'timberjack',
-    ],
+    packages=find_packages(exclude=('tests', 'tests.*')),
     include_package_data=True,
     install_requires=[
         'Django>=1.8.0',
@@ -63,7 +63,11 @@ MONGO_CONNECTIONS = {
     'default': {
         'NAME': 'default',
         'HOST': os.environ.get('MONGO_HOST', 'localhost')
-    }
+    },
+    'tenant': {
+        'NAME': 'tenant',
+        'HOST': os.environ.get('MONGO_HOST', 'localhost')
+    },
 }
 
 AUTH_PASSWORD_VALIDATORS = []
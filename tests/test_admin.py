@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory, TestCase, override_settings
+
+from timberjack import policy
+from timberjack.buckets import ReadBucket
+from timberjack.documents import ObjectAccessLog
+
+USER_MODEL = get_user_model()
+
+
+class TimberjackHistoryViewTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        cache.clear()
+        self.user = USER_MODEL.objects.create_superuser('admin', 'admin@example.com', 'test123.')
+        self.client.login(username='admin', password='test123.')
+        self.url = reverse('admin:auth_user_timberjack_history', args=[self.user.pk])
+
+    def log_read(self):
+        return ObjectAccessLog.objects.log_action(user=self.user, content_type=ContentType.objects.get_for_model(self.user),
+                                                  object_pk=self.user.pk, object_repr=repr(self.user),
+                                                  action_flag=ObjectAccessLog.READ_ACTION)
+
+    def skip_history_reads(self):
+        model_admin = admin.site._registry[USER_MODEL]
+        model_admin.timberjack_log_history_reads = False
+        self.addCleanup(delattr, model_admin, 'timberjack_log_history_reads')
+
+    def test_history_view_logs_reads(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.user).actions(ObjectAccessLog.READ_ACTION).count(), 1)
+        self.assertEqual(response.context['history_count'], 1)
+        self.assertNotIn('action_list', response.context)
+
+        # Conditional requests are audited too.
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.user).count(), 2)
+
+    def test_views_which_log_reads_are_not_cached(self):
+        model_admin = admin.site._registry[USER_MODEL]
+        latest = self.log_read()
+        self.client.get(self.url)
+        self.assertIsNone(cache.get(model_admin.get_history_cache_key(self.user, latest)))
+
+    def test_if_modified_since_within_the_second(self):
+        self.skip_history_reads()
+        self.log_read()
+        response = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_history_view_without_reads(self):
+        self.skip_history_reads()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.user).count(), 0)
+        self.assertContains(response, "This object doesn't have a change history.")
+
+    def test_conditional_get(self):
+        self.skip_history_reads()
+        self.log_read()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.log_read()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_history_is_cached_until_a_newer_entry(self):
+        self.skip_history_reads()
+        model_admin = admin.site._registry[USER_MODEL]
+        latest = self.log_read()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'change-history')
+        self.assertEqual(cache.get(model_admin.get_history_cache_key(self.user, latest)),
+                         (response.context['history_table'], 1))
+
+        newer = self.log_read()
+        self.assertNotEqual(model_admin.get_history_cache_key(self.user, newer),
+                            model_admin.get_history_cache_key(self.user, latest))
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['history_count'], 2)
+
+
+class TimberjackReadLoggingTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        self.user = USER_MODEL.objects.create_superuser('admin', 'admin@example.com', 'test123.')
+        self.client.login(username='admin', password='test123.')
+        self.group = Group.objects.create(name='group')
+        self.model_admin = admin.site._registry[Group]
+        self.url = reverse('admin:auth_group_change', args=[self.group.pk])
+
+    def get_reads(self):
+        return ObjectAccessLog.objects.for_object(self.group).actions(ObjectAccessLog.READ_ACTION)
+
+    def test_reads_are_logged_once_per_request(self):
+        request = RequestFactory().get(self.url)
+        request.user = self.user
+        self.model_admin.get_object(request, str(self.group.pk))
+        self.model_admin.get_object(request, str(self.group.pk))
+        self.assertEqual(self.get_reads().count(), 1)
+
+        self.client.get(self.url)
+        self.assertEqual(self.get_reads().count(), 2)
+
+    def test_read_before_write(self):
+        self.client.post(self.url, data={'name': 'changed'})
+        self.assertEqual(self.get_reads().count(), 1)
+
+    def test_suppress_read_before_write(self):
+        self.model_admin.timberjack_suppress_read_before_write = True
+        self.addCleanup(delattr, self.model_admin, 'timberjack_suppress_read_before_write')
+
+        self.client.post(self.url, data={'name': 'changed'})
+        self.assertEqual(self.get_reads().count(), 0)
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.group).count(), 1)
+
+        # Invalid forms aren't saved, so the read is logged.
+        self.client.post(self.url, data={'name': ''})
+        self.assertEqual(self.get_reads().count(), 1)
+
+
+class TimberjackDashboardViewTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        ReadBucket.drop_collection()
+        cache.clear()
+        self.user = USER_MODEL.objects.create_superuser('admin', 'admin@example.com', 'test123.')
+        self.group = Group.objects.create(name='group')
+        self.client.login(username='admin', password='test123.')
+        self.url = reverse('timberjack_dashboard')
+        for obj, action_flag in ((self.user, ObjectAccessLog.READ_ACTION), (self.group, ObjectAccessLog.READ_ACTION),
+                                 (self.group, ObjectAccessLog.UPDATE_ACTION)):
+            ObjectAccessLog.objects.log_action(user=self.user, content_type=ContentType.objects.get_for_model(obj),
+                                               object_pk=obj.pk, object_repr=str(obj), action_flag=action_flag)
+
+    def test_dashboard(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total'], 3)
+        self.assertEqual(dict(response.context['by_action']), {'Read': 2, 'Updated': 1})
+        self.assertEqual(response.context['by_user'], [('admin', 3)])
+        self.assertEqual(response.context['top_objects'][0][1:], (self.group.pk, 'group', 2))
+        self.assertEqual(sum(count for hour, count, width in response.context['by_hour']), 3)
+
+    def test_filters(self):
+        content_type = ContentType.objects.get_for_model(Group)
+        response = self.client.get(self.url, {'days': 7, 'model': content_type.pk})
+        self.assertEqual(response.context['by_model'], [(content_type.pk, content_type, 2)])
+        response = self.client.get(self.url, {'user': 'nobody'})
+        self.assertEqual(response.context['by_action'], [])
+        self.assertEqual(self.client.get(self.url, {'days': 2}).status_code, 404)
+
+    def test_results_are_cached(self):
+        self.client.get(self.url)
+        ObjectAccessLog.objects.log_action(user=self.user, content_type=ContentType.objects.get_for_model(self.user),
+                                           object_pk=self.user.pk, object_repr='admin',
+                                           action_flag=ObjectAccessLog.READ_ACTION)
+        self.assertEqual(self.client.get(self.url).context['by_user'], [('admin', 3)])
+
+    def test_permission_required(self):
+        USER_MODEL.objects.create_user('staff', 'staff@example.com', 'test123.', is_staff=True)
+        self.client.login(username='staff', password='test123.')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(TIMBERJACK_POLICIES={'auth.group': {'bucket_reads': True}})
+    def test_bucketed_reads(self):
+        self.addCleanup(policy.invalidate)
+        content_type = ContentType.objects.get_for_model(Group)
+        for i in range(2):
+            ObjectAccessLog.objects.log_action(user=self.user, content_type=content_type, object_pk=self.group.pk,
+                                               object_repr='renamed', action_flag=ObjectAccessLog.READ_ACTION)
+        self.assertEqual(ReadBucket.objects.count(), 1)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['total'], 5)
+        self.assertEqual(dict(response.context['by_action']), {'Read': 4, 'Updated': 1})
+        self.assertEqual(response.context['by_user'], [('admin', 5)])
+        self.assertEqual(response.context['top_objects'][0][1:], (self.group.pk, 'renamed', 4))
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import DatabaseError, transaction
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+from timberjack import audit
+from timberjack.documents import ObjectAccessLog
+from tests.testapp.models import AuditedGroup
+
+USER_MODEL = get_user_model()
+
+
+# Entries are written once the transaction commits, which never
+# happens within a TestCase.
+class AuditedQuerySetTestCase(TransactionTestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.')
+        self.groups = [AuditedGroup.objects.create(name='group %d' % i) for i in range(3)]
+        audit.register(AuditedGroup)
+        self.addCleanup(audit.unregister, AuditedGroup)
+
+    @override_settings(TIMBERJACK_AUDIT_ACTOR=None)
+    def test_not_logged_without_actor(self):
+        AuditedGroup.objects.all().update(name='changed')
+        self.assertEqual(ObjectAccessLog.objects.count(), 0)
+
+    def test_system_actor_without_actor(self):
+        AuditedGroup.objects.filter(pk=self.groups[0].pk).update(name='changed')
+        entry = ObjectAccessLog.objects.get()
+        self.assertEqual(entry.user.username, 'system')
+        self.assertIsNone(entry.ip_address)
+
+    @override_settings(TIMBERJACK_AUDIT_ACTOR='test@example.com')
+    def test_system_actor_is_looked_up(self):
+        AuditedGroup.objects.filter(pk=self.groups[0].pk).update(name='changed')
+        self.assertEqual(ObjectAccessLog.objects.get().user.pk, self.user.pk)
+
+    def test_request_actor(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.2')
+        request.user = AnonymousUser()
+        with audit.request_actor(request):
+            # Authenticated after the block was entered.
+            request.user = self.user
+            AuditedGroup.objects.filter(pk=self.groups[0].pk).update(name='changed')
+        entry = ObjectAccessLog.objects.get()
+        self.assertEqual(entry.user.pk, self.user.pk)
+        self.assertEqual(entry.ip_address, '10.0.0.2')
+
+    def test_anonymous_request_uses_system_actor(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with audit.request_actor(request):
+            AuditedGroup.objects.filter(pk=self.groups[0].pk).update(name='changed')
+        self.assertEqual(ObjectAccessLog.objects.get().user.username, 'system')
+
+    def test_distinct_is_not_locked(self):
+        with audit.actor(self.user):
+            AuditedGroup.objects.distinct().filter(pk=self.groups[0].pk).delete()
+        self.assertEqual(ObjectAccessLog.objects.actions(ObjectAccessLog.DELETE_ACTION).count(), 1)
+
+    def test_not_logged_unless_registered(self):
+        audit.unregister(AuditedGroup)
+        with audit.actor(self.user):
+            AuditedGroup.objects.all().update(name='changed')
+        self.assertEqual(ObjectAccessLog.objects.count(), 0)
+
+    def test_update(self):
+        with audit.actor(self.user, ip_address='10.0.0.1'):
+            self.assertEqual(AuditedGroup.objects.filter(pk__in=[self.groups[0].pk, self.groups[1].pk]).update(
+                name='changed'), 2)
+
+        entries = ObjectAccessLog.objects.actions(ObjectAccessLog.UPDATE_ACTION)
+        self.assertEqual({entry.object_pk for entry in entries}, {self.groups[0].pk, self.groups[1].pk})
+        self.assertEqual(entries.first().change_message[0].fields, ['name'])
+        self.assertEqual(entries.first().ip_address, '10.0.0.1')
+        self.assertEqual(entries.first().user.pk, self.user.pk)
+
+    def test_delete(self):
+        with audit.actor(self.user):
+            AuditedGroup.objects.filter(pk=self.groups[0].pk).delete()
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.groups[0]).actions(
+            ObjectAccessLog.DELETE_ACTION).count(), 1)
+
+    def test_bulk_create(self):
+        with audit.actor(self.user):
+            AuditedGroup.objects.bulk_create([AuditedGroup(pk=100, name='created')])
+        entry = ObjectAccessLog.objects.actions(ObjectAccessLog.CREATE_ACTION).get()
+        self.assertEqual(entry.object_pk, 100)
+        self.assertEqual(entry.object_repr, 'created')
+
+    def test_single_entry(self):
+        audit.register(AuditedGroup, single_entry=True)
+        with audit.actor(self.user):
+            AuditedGroup.objects.all().update(name='changed')
+        entry = ObjectAccessLog.objects.get()
+        self.assertEqual(sorted(entry.object_pk), sorted(group.pk for group in self.groups))
+
+    @skipUnless(hasattr(transaction, 'on_commit'), 'Django 1.8 has no on_commit.')
+    def test_not_logged_on_rollback(self):
+        with audit.actor(self.user):
+            try:
+                with transaction.atomic():
+                    AuditedGroup.objects.all().update(name='changed')
+                    AuditedGroup.objects.filter(pk=self.groups[0].pk).delete()
+                    raise DatabaseError()
+            except DatabaseError:
+                pass
+        self.assertEqual(ObjectAccessLog.objects.count(), 0)
+
+    @skipUnless(hasattr(transaction, 'on_commit'), 'Django 1.8 has no on_commit.')
+    def test_logged_on_commit_after_the_actor_block(self):
+        with transaction.atomic():
+            with audit.actor(self.user):
+                AuditedGroup.objects.all().update(name='changed')
+            self.assertEqual(ObjectAccessLog.objects.count(), 0)
+        self.assertEqual(ObjectAccessLog.objects.count(), 3)
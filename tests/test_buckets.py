@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from timberjack import policy, spool
+from timberjack.buckets import ReadBucket, get_bucket_match
+from timberjack.documents import ObjectAccessLog
+
+USER_MODEL = get_user_model()
+
+
+@override_settings(TIMBERJACK_POLICIES={'auth.user': {'bucket_reads': True}}, TIMBERJACK_READ_BUCKET_SIZE=2)
+class ReadBucketTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        ReadBucket.drop_collection()
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.')
+        self.content_type = ContentType.objects.get_for_model(self.user)
+        self.addCleanup(policy.invalidate)
+
+    def log(self, action_flag=ObjectAccessLog.READ_ACTION):
+        return ObjectAccessLog.objects.log_action(user=self.user, content_type=self.content_type,
+                                                  object_pk=self.user.pk, object_repr='user',
+                                                  action_flag=action_flag, ip_address='10.0.0.1')
+
+    def test_reads_are_bucketed(self):
+        records = [self.log() for i in range(3)]
+        self.log(ObjectAccessLog.UPDATE_ACTION)
+
+        self.assertEqual(ObjectAccessLog.objects.count(), 1)
+        self.assertEqual(sorted(bucket.count for bucket in ReadBucket.objects), [1, 2])
+
+        entries = ObjectAccessLog.objects.for_object(self.user).with_read_buckets()
+        self.assertEqual(entries.count(), 4)
+        self.assertEqual([entry.pk for entry in entries][1:], [record.pk for record in reversed(records)])
+        entry = entries[:2].first()
+        self.assertTrue(entry.is_update_action)
+        event = list(entries[:2])[1]
+        self.assertTrue(event.is_read_action)
+        self.assertEqual(event.ip_address, '10.0.0.1')
+        self.assertEqual(event.user.get_username(), 'test@example.com')
+        self.assertEqual(event.get_content_object(), self.user)
+
+    def test_filters_apply_to_events(self):
+        self.log()
+        queryset = ObjectAccessLog.objects.for_object(self.user)
+        self.assertEqual(queryset.actions(ObjectAccessLog.UPDATE_ACTION).with_read_buckets().count(), 0)
+        self.assertEqual(queryset.actions(ObjectAccessLog.READ_ACTION).with_read_buckets().count(), 1)
+        self.assertEqual(ObjectAccessLog.objects.for_user('other').with_read_buckets().count(), 0)
+        self.assertEqual(queryset.between(end=timezone.now() - timedelta(hours=2)).with_read_buckets().count(), 0)
+
+    def test_object_history_includes_buckets(self):
+        self.log()
+        self.log(ObjectAccessLog.UPDATE_ACTION)
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.user).count(), 2)
+        self.assertEqual(ObjectAccessLog.objects.history(self.content_type, self.user.pk).count(), 2)
+        entries = ObjectAccessLog.objects.for_object(self.user).actions(ObjectAccessLog.READ_ACTION)
+        self.assertEqual([entry.action_flag for entry in entries], [ObjectAccessLog.READ_ACTION])
+        # Other helpers only return entries.
+        self.assertEqual(ObjectAccessLog.objects.for_model(USER_MODEL).count(), 1)
+
+    def test_reads_are_written_while_the_circuit_is_open(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(TIMBERJACK_SPOOL_DIR=directory, TIMBERJACK_SPOOL_REPLAY_INTERVAL=None):
+            self.addCleanup(spool._writers.clear)
+            writer = spool.get_writer()
+            for i in range(writer.breaker.threshold):
+                writer.breaker.failure()
+            self.assertRaises(spool.CircuitOpenError, spool.call, max, 1, 2)
+            self.log()
+            writer.close()
+        # The read is spooled as a single entry instead.
+        self.assertEqual(ReadBucket.objects.count(), 0)
+        self.assertEqual(len(spool.get_ready_files(directory)), 1)
+
+    def test_get_bucket_match(self):
+        now = timezone.now()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(get_bucket_match({'content_type.pk': 1, 'object_pk': 2, 'timestamp': {'$gte': now}}),
+                         {'content_type.pk': 1, 'object_pk': 2, 'hour': {'$gte': hour}})
+        self.assertEqual(get_bucket_match({'user.pk': 1}), {'events.user.pk': 1})
+        self.assertIsNone(get_bucket_match({'action_flag': ObjectAccessLog.UPDATE_ACTION}))
+        self.assertIsNone(get_bucket_match({'action_flag': {'$in': [ObjectAccessLog.CREATE_ACTION]}}))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+
+from timberjack import compression
+from timberjack.documents import ObjectAccessLog
+from timberjack.fields import ModelField
+
+USER_MODEL = get_user_model()
+COMPRESSION = {'algorithm': 'zlib', 'threshold': 100}
+
+
+class CompressionTestCase(TestCase):
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(compression.compress(b'a' * 10000))
+
+    @override_settings(TIMBERJACK_COMPRESSION=COMPRESSION)
+    def test_threshold(self):
+        self.assertIsNone(compression.compress(b'a' * 99))
+        value = compression.compress(b'a' * 1000)
+        self.assertTrue(compression.is_compressed(value))
+        self.assertEqual(compression.decompress(value), b'a' * 1000)
+
+    @override_settings(TIMBERJACK_COMPRESSION=COMPRESSION)
+    def test_incompressible(self):
+        self.assertIsNone(compression.compress(os.urandom(1000)))
+
+    def test_shared_dictionary(self):
+        with tempfile.NamedTemporaryFile(suffix='.dict', delete=False) as f:
+            f.write(b'"first_name": "", "last_name": "", "is_staff": false, "is_superuser": false')
+        self.addCleanup(os.unlink, f.name)
+
+        data = b'{"first_name": "", "is_staff": false, "is_superuser": false, "last_name": ""}' * 2
+        with self.settings(TIMBERJACK_COMPRESSION=dict(COMPRESSION, dictionary=f.name)):
+            value = compression.compress(data)
+            self.assertEqual(compression.decompress(value), data)
+
+    @override_settings(TIMBERJACK_COMPRESSION={'algorithm': 'lzma'})
+    def test_invalid_algorithm(self):
+        self.assertRaises(ValueError, compression.get_config)
+
+
+@override_settings(TIMBERJACK_COMPRESSION=COMPRESSION)
+class CompressedFieldsTestCase(TestCase):
+
+    def setUp(self):
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.',
+                                                   first_name='x' * 200)
+        self.ctype = ContentType.objects.get_for_model(self.user)
+
+    def test_compressed_message(self):
+        message = 'Changed ' + ', '.join('field_%d' % i for i in range(100)) + '.'
+        instance = ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                                      object_pk=self.user.pk, object_repr=repr(self.user),
+                                                      action_flag=2, message=message)
+
+        raw = ObjectAccessLog._get_collection().find_one({'_id': instance.pk})
+        self.assertTrue(compression.is_compressed(raw['message']))
+
+        entry = ObjectAccessLog.objects.get(pk=instance.pk)
+        self.assertTrue(compression.is_compressed(entry._data['message']))
+        self.assertEqual(entry.message, message)
+        self.assertEqual(entry._data['message'], message)
+
+    def test_short_message_is_not_compressed(self):
+        instance = ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                                      object_pk=self.user.pk, object_repr=repr(self.user),
+                                                      action_flag=2, message='test message')
+        raw = ObjectAccessLog._get_collection().find_one({'_id': instance.pk})
+        self.assertEqual(raw['message'], 'test message')
+
+    def test_compressed_model_field(self):
+        instance = ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                                      object_pk=self.user.pk, object_repr=repr(self.user),
+                                                      action_flag=4)
+
+        raw = ObjectAccessLog._get_collection().find_one({'_id': instance.pk})
+        self.assertIn(ModelField.COMPRESSED_KEY, raw['user'])
+        self.assertEqual(raw['user']['fields'], {'username': 'test@example.com'})
+        self.assertEqual(ObjectAccessLog.objects(user__fields__username='test@example.com').count(), 1)
+
+        entry = ObjectAccessLog.objects.get(pk=instance.pk)
+        self.assertEqual(entry.user.pk, self.user.pk)
+        self.assertEqual(entry.user.first_name, 'x' * 200)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase, override_settings
+from mongoengine.connection import _connection_settings, _connections, disconnect, get_connection
+from pymongo.read_preferences import SecondaryPreferred
+
+from timberjack import connection
+from timberjack.documents import ObjectAccessLog
+
+
+class ConnectionTestCase(TestCase):
+
+    def forget(self, alias):
+        disconnect(alias)
+        _connection_settings.pop(alias, None)
+        connection._created.discard(alias)
+        connection._registered.discard(alias)
+
+    @override_settings(TIMBERJACK_CONNECTION_OPTIONS={'maxPoolSize': 7},
+                       MONGO_CONNECTIONS={'timberjack': {'NAME': 'timberjack', 'HOST': 'localhost'}})
+    def test_register_connection_options(self):
+        self.addCleanup(self.forget, 'timberjack')
+        connection.register('timberjack')
+        self.assertNotIn('timberjack', _connections)
+        self.assertEqual(_connection_settings['timberjack']['name'], 'timberjack')
+        self.assertEqual(_connection_settings['timberjack']['maxPoolSize'], 7)
+        self.assertFalse(_connection_settings['timberjack']['connect'])
+
+    @override_settings(TIMBERJACK_CONNECTION_OPTIONS={'maxPoolSize': 7})
+    def test_project_connection_is_kept(self):
+        client = get_connection('default')
+        project_settings = dict(_connection_settings['default'])
+        connection.register('default')
+        self.assertIs(get_connection('default'), client)
+        self.assertEqual(_connection_settings['default'], project_settings)
+        self.assertNotIn('default', connection._created)
+
+    def test_check_fork_discards_inherited_client(self):
+        connection.register('default')
+        called = []
+        callback = connection.register_after_fork(lambda: called.append(True))
+        try:
+            ObjectAccessLog.objects.count()
+            client = get_connection('default')
+
+            connection._pid = -1  # Pretend we're in a forked child.
+            connection.check_fork()
+
+            self.assertNotIn('default', _connections)
+            self.assertIsNone(ObjectAccessLog._collection)
+            self.assertEqual(called, [True])
+            self.assertIsNot(get_connection('default'), client)
+        finally:
+            connection._after_fork_callbacks.remove(callback)
+
+    def test_check_fork_replaces_held_lock(self):
+        # A lock held by another thread of the parent is never released in the child.
+        connection._lock.acquire()
+        connection._pid = -1
+        connection.check_fork()
+        self.assertTrue(connection._lock.acquire(False))
+        connection._lock.release()
+
+
+class ReadPreferenceTestCase(TestCase):
+
+    @override_settings(TIMBERJACK_READ_PREFERENCES={
+        'history': 'secondaryPreferred',
+        'export': {'mode': 'secondaryPreferred', 'max_staleness': 120, 'alias': 'default'}
+    })
+    def test_get_read_options(self):
+        read_preference, alias = connection.get_read_options('history')
+        self.assertIsInstance(read_preference, SecondaryPreferred)
+        self.assertIsNone(alias)
+
+        read_preference, alias = connection.get_read_options('export')
+        self.assertEqual(read_preference.max_staleness, 120)
+        self.assertEqual(alias, 'default')
+
+        self.assertEqual(connection.get_read_options('aggregation'), (None, None))
+
+    @override_settings(TIMBERJACK_READ_PREFERENCES={'history': 'secondaryPreferred'})
+    def test_queryset_for_read(self):
+        queryset = ObjectAccessLog.objects.for_read('history')
+        self.assertIsInstance(queryset._read_preference, SecondaryPreferred)
+        self.assertIsNone(ObjectAccessLog.objects.for_read('export')._read_preference)
+
+    @override_settings(TIMBERJACK_READ_PREFERENCES={'history': 'invalid'})
+    def test_invalid_mode(self):
+        self.assertRaises(ValueError, connection.get_read_options, 'history')
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 
+from django.contrib.admin.models import ADDITION, CHANGE, DELETION
 from django.test import TestCase
 
+from timberjack import constants
+
 
 class ConstantsTestCase(TestCase):
 
-    pass
+    def test_action_flags_django_compatibility(self):
+        self.assertEqual(constants.CREATE_ACTION, ADDITION)
+        self.assertEqual(constants.UPDATE_ACTION, CHANGE)
+        self.assertEqual(constants.DELETE_ACTION, DELETION)
+        self.assertEqual(constants.READ_ACTION, 4)
@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import warnings
+
 from django.contrib.admin.models import ADDITION, CHANGE, DELETION, LogEntry
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command, CommandError
 from django.test import TestCase
+from django.utils import timezone
+
+from mongoengine.context_managers import query_counter
 
-from timberjack.documents import LOG_LEVEL, ObjectAccessLog
+from timberjack.documents import CollectionScanWarning, LOG_LEVEL, ObjectAccessLog, SubMessage, UserSnapshot, _message_cache
+from timberjack.utils import get_routing_key
 
 USER_MODEL = get_user_model()
 
@@ -96,3 +103,183 @@ class ObjectAccessQuerySetTestCase(TestCase):
                                                       object_pk=self.user.pk, object_repr=repr(self.user),
                                                       action_flag=1, message='test message')
         self.assertIsInstance(instance, ObjectAccessLog)
+
+    def test_queryset_log_action_structured_message(self):
+        instance = ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                                      object_pk=self.user.pk, object_repr=repr(self.user),
+                                                      action_flag=2, message=[{'changed': {
+                                                          'name': 'user', 'object': 'test@example.com',
+                                                          'fields': ['email', 'username']}}])
+        self.assertEqual(instance.message, '')
+        self.assertEqual(instance.change_message[0].action, 'changed')
+        self.assertEqual(instance.change_message[0].fields, ['email', 'username'])
+        self.assertEqual(instance.get_log_message(),
+                         'Changed email and username for user "test@example.com".')
+
+    def test_queryset_changed_fields(self):
+        ObjectAccessLog.drop_collection()
+        for fields in (['email'], ['username'], ['email', 'first_name']):
+            ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                               object_pk=self.user.pk, object_repr=repr(self.user),
+                                               action_flag=2, message=[{'changed': {'fields': fields}}])
+        self.assertEqual(ObjectAccessLog.objects.changed_fields('email').count(), 2)
+        self.assertEqual(ObjectAccessLog.objects.changed_fields('username', 'first_name').count(), 2)
+
+    def test_legacy_json_message(self):
+        instance = ObjectAccessLog(user=self.user, content_type=self.ctype, object_pk=self.user.pk,
+                                   object_repr=repr(self.user), action_flag=4,
+                                   message='[{"read": {"name": "user", "object": "test@example.com"}}]')
+        self.assertTrue(instance.has_change_message)
+        self.assertEqual(instance.get_log_message(), 'Read user "test@example.com".')
+
+    def test_queryset_in_network(self):
+        ObjectAccessLog.drop_collection()
+        for ip_address in ('10.20.0.1', '10.20.255.254', '10.21.0.1', '2001:db8::1', '2001:db9::1'):
+            ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                               object_pk=self.user.pk, object_repr=repr(self.user),
+                                               action_flag=4, ip_address=ip_address)
+        self.assertEqual(ObjectAccessLog.objects.in_network('10.20.0.0/16').count(), 2)
+        self.assertEqual(ObjectAccessLog.objects.in_network('10.0.0.0/8').count(), 3)
+        self.assertEqual(ObjectAccessLog.objects.in_network('2001:db8::/32').count(), 1)
+
+    def test_queryset_history(self):
+        ObjectAccessLog.drop_collection()
+        other = USER_MODEL.objects.create_user(username='other@example.com', password='test123.')
+        for user in (self.user, other, self.user):
+            ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype, object_pk=user.pk,
+                                               object_repr=repr(user), action_flag=4)
+        self.assertEqual(ObjectAccessLog.objects.history(self.ctype, self.user.pk).count(), 2)
+        self.assertNotIn('routing_key', ObjectAccessLog.objects.history(self.ctype, self.user.pk)._query)
+
+    def test_queryset_helpers(self):
+        ObjectAccessLog.drop_collection()
+        ObjectAccessLog.ensure_indexes()
+        other = USER_MODEL.objects.create_user(username='other@example.com', password='test123.')
+        start = timezone.now()
+        for user, action_flag in ((self.user, 4), (other, 2), (self.user, 2)):
+            ObjectAccessLog.objects.log_action(user=user, content_type=self.ctype, object_pk=user.pk,
+                                               object_repr=repr(user), action_flag=action_flag)
+        end = timezone.now()
+
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.user).count(), 2)
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.user).actions(2).count(), 1)
+        self.assertEqual(ObjectAccessLog.objects.for_model(USER_MODEL).count(), 3)
+        self.assertEqual(ObjectAccessLog.objects.for_model(self.ctype, LogEntry).count(), 3)
+        self.assertEqual(ObjectAccessLog.objects.for_user(other).count(), 1)
+        self.assertEqual(ObjectAccessLog.objects.for_user('other@example.com').count(), 1)
+        self.assertEqual(ObjectAccessLog.objects.actions(2, 4).count(), 3)
+        self.assertEqual(ObjectAccessLog.objects.between(start, end).count(), 3)
+        self.assertEqual(ObjectAccessLog.objects.between(end=start).count(), 0)
+
+        timestamps = [entry.timestamp for entry in ObjectAccessLog.objects.for_model(USER_MODEL)]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+
+    def test_queryset_helpers_are_indexed(self):
+        ObjectAccessLog.drop_collection()
+        ObjectAccessLog.ensure_indexes()
+        ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype, object_pk=self.user.pk,
+                                           object_repr=repr(self.user), action_flag=4)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CollectionScanWarning)
+            ObjectAccessLog.objects.for_object(self.user).explain()
+            ObjectAccessLog.objects.for_model(USER_MODEL).explain()
+            ObjectAccessLog.objects.for_user(self.user).explain()
+            ObjectAccessLog.objects.for_user('test@example.com').explain()
+            ObjectAccessLog.objects.between(timezone.now()).explain()
+            self.assertRaises(CollectionScanWarning, ObjectAccessLog.objects(object_repr='test').explain)
+        self.assertFalse(ObjectAccessLog.objects(object_repr='test').is_indexed())
+
+    def test_username_index_follows_username_field(self):
+        fields = [spec['fields'] for spec in ObjectAccessLog._meta['index_specs']]
+        self.assertIn([('user.fields.%s' % USER_MODEL.USERNAME_FIELD, 1), ('timestamp', -1)], fields)
+
+    def test_queryset_history_sharding(self):
+        with self.settings(TIMBERJACK_SHARDING=True):
+            instance = ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                                          object_pk=self.user.pk, object_repr=repr(self.user),
+                                                          action_flag=4)
+            self.assertEqual(instance.routing_key, get_routing_key(self.ctype.pk, self.user.pk))
+            queryset = ObjectAccessLog.objects.history(self.ctype, self.user.pk)
+            self.assertEqual(queryset._query['routing_key'], instance.routing_key)
+            self.assertIn(instance, queryset)
+
+    def test_shard_command_requires_sharding(self):
+        self.assertRaises(CommandError, call_command, 'timberjack_shard')
+
+    def test_deduplicated_user_snapshots(self):
+        ObjectAccessLog.drop_collection()
+        UserSnapshot.drop_collection()
+        self.user.email = 'test@example.com'
+        self.user.save()
+
+        with self.settings(TIMBERJACK_DEDUPLICATE_USERS=True):
+            for i in range(3):
+                ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                                   object_pk=self.user.pk, object_repr=repr(self.user),
+                                                   action_flag=4)
+            self.user.first_name = 'Changed'
+            self.user.save()
+            ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                               object_pk=self.user.pk, object_repr=repr(self.user),
+                                               action_flag=4)
+
+        self.assertEqual(UserSnapshot.objects.count(), 2)
+        entries = list(ObjectAccessLog.objects.order_by('timestamp'))
+        self.assertEqual(len({entry.user_snapshot for entry in entries}), 2)
+
+        raw = ObjectAccessLog._get_collection().find_one({'_id': entries[0].pk})
+        self.assertEqual(raw['user']['fields'], {'username': 'test@example.com'})
+        self.assertEqual(entries[0].user.pk, self.user.pk)
+        self.assertEqual(entries[0].get_user_snapshot().email, 'test@example.com')
+        self.assertEqual(entries[0].get_user_snapshot().first_name, '')
+        self.assertEqual(entries[-1].get_user_snapshot().first_name, 'Changed')
+
+    def test_rendered_message_is_cached(self):
+        _message_cache.clear()
+        message = [{'deleted': {'name': 'user', 'object': 'test@example.com'}}]
+        for i in range(3):
+            instance = ObjectAccessLog(user=self.user, content_type=self.ctype, object_pk=self.user.pk,
+                                       object_repr=repr(self.user), action_flag=3, message='',
+                                       change_message=[SubMessage.from_dict(message[0])])
+            self.assertEqual(instance.get_log_message(), 'Deleted user "test@example.com".')
+        self.assertEqual(len(_message_cache), 1)
+
+
+class ObjectAccessQuerySetPrefetchTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        self.ctype = ContentType.objects.get_for_model(USER_MODEL)
+        self.users = [USER_MODEL.objects.create_user(username='user%d@example.com' % i, password='test123.')
+                      for i in range(5)]
+        for user in self.users:
+            ObjectAccessLog.objects.log_action(user=user, content_type=self.ctype, object_pk=user.pk,
+                                               object_repr=repr(user), action_flag=2, message='test message',
+                                               write_admin_log=True)
+
+    def test_prefetch_content_objects(self):
+        entries = list(ObjectAccessLog.objects.prefetch_content_objects())
+        with self.assertNumQueries(0):
+            self.assertEqual({entry.get_content_object() for entry in entries}, set(self.users))
+
+    def test_prefetch_admin_logs(self):
+        entries = list(ObjectAccessLog.objects.prefetch_admin_logs())
+        with self.assertNumQueries(0):
+            for entry in entries:
+                self.assertIsInstance(entry.get_admin_log_object(), LogEntry)
+
+    def test_prefetch_referrers(self):
+        referrer = ObjectAccessLog.objects.first()
+        ObjectAccessLog.objects.filter(pk__ne=referrer.pk).update(set__referrer=referrer)
+        entries = list(ObjectAccessLog.objects.filter(pk__ne=referrer.pk).prefetch_referrers())
+
+        with query_counter() as count:
+            for entry in entries:
+                self.assertEqual(entry.referrer, referrer)
+            self.assertEqual(count, 0)
+
+    def test_prefetch_deleted_content_object(self):
+        self.users[0].delete()
+        entry = ObjectAccessLog.objects.filter(object_pk=self.users[0].pk).prefetch_content_objects()[0:1]
+        self.assertRaises(USER_MODEL.DoesNotExist, list(entry)[0].get_content_object)
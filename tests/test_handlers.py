@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+
+from timberjack import policy
+from timberjack.documents import ObjectAccessLog
+from timberjack.handlers import TimberjackHandler, get_action_flag
+
+USER_MODEL = get_user_model()
+
+
+class TimberjackHandlerTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.')
+        self.handler = TimberjackHandler(batch_size=2, flush_interval=0.01)
+        self.logger = logging.getLogger('tests.audit')
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.addCleanup(self.handler.close)
+
+    def test_get_action_flag(self):
+        self.assertEqual(get_action_flag('read'), ObjectAccessLog.READ_ACTION)
+        self.assertEqual(get_action_flag(ObjectAccessLog.UPDATE_ACTION), ObjectAccessLog.UPDATE_ACTION)
+        self.assertIsNone(get_action_flag('unknown'))
+
+    def test_records_are_written(self):
+        for i in range(3):
+            self.logger.info('Exported %s', 'user', extra={'user': self.user, 'object': self.user, 'action': 'read',
+                                                         'ip_address': '10.0.0.1'})
+        self.logger.warning('Changed user', extra={'user': self.user, 'action': 'update',
+                                                   'content_type': ContentType.objects.get_for_model(self.user),
+                                                   'object_pk': self.user.pk, 'object_repr': 'user',
+                                                   'changes': ['email']})
+        self.handler.flush()
+
+        self.assertEqual(ObjectAccessLog.objects.actions(ObjectAccessLog.READ_ACTION).count(), 3)
+        entry = ObjectAccessLog.objects.actions(ObjectAccessLog.READ_ACTION).first()
+        self.assertEqual(entry.message, 'Exported user')
+        self.assertEqual(entry.ip_address, '10.0.0.1')
+        self.assertEqual(entry.get_content_object(), self.user)
+
+        entry = ObjectAccessLog.objects.actions(ObjectAccessLog.UPDATE_ACTION).get()
+        self.assertEqual(entry.log_level, logging.WARNING)
+        self.assertEqual(entry.change_message[0].fields, ['email'])
+
+    def test_records_without_extras_are_ignored(self):
+        self.logger.info('Not an audit event')
+        self.logger.info('Missing object', extra={'user': self.user, 'action': 'read'})
+        self.logger.info('Username', extra={'user': self.user.get_username(), 'object': self.user, 'action': 'read'})
+        self.handler.flush()
+        self.assertEqual(ObjectAccessLog.objects.count(), 0)
+
+    def test_policy_applies(self):
+        self.addCleanup(policy.invalidate)
+        with override_settings(TIMBERJACK_POLICIES={'auth.user': {'actions': ('update',), 'level': 40}}):
+            for action in ('read', 'update'):
+                self.logger.info('Accessed user', extra={'user': self.user, 'object': self.user, 'action': action})
+            self.handler.flush()
+        entry = ObjectAccessLog.objects.get()
+        self.assertEqual(entry.action_flag, ObjectAccessLog.UPDATE_ACTION)
+        self.assertEqual(entry.log_level, 40)
+
+    def test_invalid_records_dont_fail_the_batch(self):
+        self.logger.info('Invalid', extra={'user': self.user, 'object': self.user, 'action': 'read',
+                                           'ip_address': 'invalid'})
+        self.logger.info('Valid', extra={'user': self.user, 'object': self.user, 'action': 'read'})
+        self.handler.flush()
+        self.assertEqual(ObjectAccessLog.objects.get().message, 'Valid')
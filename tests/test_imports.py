@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+from django.test import SimpleTestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ImportTestCase(SimpleTestCase):
+    """
+    Importing the view mixins should neither require a configured django
+    project nor pull in mongoengine, serializers or the admin models.
+    """
+    heavy_modules = ('mongoengine', 'django.core.serializers', 'django.contrib.admin.models')
+
+    def get_loaded_modules(self, module):
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; import {module}; print(",".join(name for name in {heavy!r} if name in sys.modules))'.format(
+                module=module, heavy=self.heavy_modules)
+        ], cwd=ROOT, env=env, universal_newlines=True)
+        return [name for name in output.strip().split(',') if name]
+
+    def test_import_mixins(self):
+        self.assertEqual(self.get_loaded_modules('timberjack.mixins'), [])
+
+    def test_import_rest_framework_mixins(self):
+        self.assertEqual(self.get_loaded_modules('timberjack.compat.rest_framework.mixins'), [])
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import apps
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+
+from timberjack.mixins import get_form_class, get_changed_fields, take_snapshot, clear_form_classes
+
+
+class FormClassCacheTestCase(TestCase):
+
+    def setUp(self):
+        clear_form_classes()
+
+    def test_form_class_is_cached(self):
+        self.assertIs(get_form_class(User), get_form_class(User))
+        self.assertIsNot(get_form_class(User), get_form_class(Group))
+        self.assertIsNot(get_form_class(User), get_form_class(User, fields=['username']))
+
+    def test_clear_form_classes(self):
+        form_class = get_form_class(User)
+        clear_form_classes()
+        self.assertIsNot(form_class, get_form_class(User))
+
+    def test_stale_model_classes_are_not_cached(self):
+        form_class = get_form_class(User)
+        # Pretend the registry holds another class for the label.
+        apps.all_models['auth']['user'] = Group
+        self.addCleanup(apps.all_models['auth'].__setitem__, 'user', User)
+        self.assertIsNot(get_form_class(User), form_class)
+        self.assertIsNot(get_form_class(User), get_form_class(User))
+
+    def test_deferred_models_share_the_form_class(self):
+        form_class = get_form_class(User)
+        User.objects.create_user('testuser', 'testuser@example.com', 'test123.')
+        # Django < 1.10 creates a deferred model class here.
+        deferred = User.objects.only('username').get()
+        self.assertIs(get_form_class(type(deferred)), form_class)
+        with self.settings(DEBUG=True):
+            self.assertIs(get_form_class(User), form_class)
+
+
+class ChangeTrackingTestCase(TestCase):
+
+    def test_changed_fields(self):
+        user = User.objects.create_user('testuser', 'testuser@example.com', 'test123.')
+        snapshot = take_snapshot(user)
+        self.assertEqual(get_changed_fields(user, snapshot), [])
+
+        user.email = 'changed@example.com'
+        user.first_name = 'Test'
+        self.assertEqual(get_changed_fields(user, snapshot), ['first_name', 'email'])
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from timberjack import policy
+from timberjack.documents import ObjectAccessLog
+
+USER_MODEL = get_user_model()
+
+
+class PolicyTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.')
+        self.content_type = ContentType.objects.get_for_model(self.user)
+        self.addCleanup(policy.invalidate)
+
+    def log(self, action_flag=ObjectAccessLog.READ_ACTION, user=None, log_level=20):
+        return ObjectAccessLog.objects.log_action(user=user or self.user, content_type=self.content_type,
+                                                  object_pk=self.user.pk, object_repr='user',
+                                                  action_flag=action_flag, log_level=log_level)
+
+    def test_default_policy_audits_everything(self):
+        model_policy = policy.get_policy(self.content_type)
+        for action_flag in (ObjectAccessLog.CREATE_ACTION, ObjectAccessLog.READ_ACTION,
+                            ObjectAccessLog.UPDATE_ACTION, ObjectAccessLog.DELETE_ACTION):
+            self.assertTrue(model_policy.audits(action_flag, self.user))
+        self.assertIsNotNone(self.log())
+
+    def test_precedence(self):
+        with override_settings(TIMBERJACK_POLICIES={
+            '*': {'enabled': False},
+            'auth.*': {'actions': ('create', 'update', 'delete')},
+            'auth.group': {'level': 30},
+        }):
+            self.assertTrue(policy.get_policy(Group).audits(ObjectAccessLog.READ_ACTION))
+            self.assertEqual(policy.get_policy(Group).get_level(20), 30)
+            self.assertFalse(policy.get_policy(self.user).audits(ObjectAccessLog.READ_ACTION))
+            self.assertTrue(policy.get_policy(self.user).audits(ObjectAccessLog.UPDATE_ACTION))
+            self.assertFalse(policy.get_policy(ContentType).enabled)
+
+    def test_invalid_policies(self):
+        with override_settings(TIMBERJACK_POLICIES={'auth.user': {'actions': ('view',)}}):
+            self.assertRaises(ImproperlyConfigured, policy.get_policy, self.user)
+        with override_settings(TIMBERJACK_POLICIES={'auth.user': {'level': 40, 'unknown': True}}):
+            self.assertRaises(ImproperlyConfigured, policy.get_policy, self.user)
+        with override_settings(TIMBERJACK_POLICIES={'auth.user': {'actions': (ObjectAccessLog.READ_ACTION,)}}):
+            self.assertTrue(policy.get_policy(self.user).audits(ObjectAccessLog.READ_ACTION))
+
+    def test_load_returns_the_tables(self):
+        table, default = policy.load()
+        self.assertIs(policy.get_policy(Group), table['auth', 'group'])
+        self.assertIs(policy.get_policy(ContentType), table['contenttypes', 'contenttype'])
+
+    def test_settings_override_decorator(self):
+        policy.register(enabled=False)(Group)
+        self.addCleanup(policy._registered.pop, 'auth.group')
+        self.assertFalse(policy.get_policy(Group).enabled)
+        with override_settings(TIMBERJACK_POLICIES={'auth.group': {'level': 40}}):
+            self.assertTrue(policy.get_policy(Group).enabled)
+            self.assertEqual(policy.get_policy(Group).get_level(20), 40)
+
+    def test_log_action_skips_actions(self):
+        with override_settings(TIMBERJACK_POLICIES={'auth.user': {'actions': ('update',)}}):
+            self.assertIsNone(self.log(ObjectAccessLog.READ_ACTION))
+            self.assertIsNotNone(self.log(ObjectAccessLog.UPDATE_ACTION))
+        self.assertEqual(ObjectAccessLog.objects.count(), 1)
+
+    def test_log_action_excludes_users(self):
+        other = USER_MODEL.objects.create_user(username='service@example.com', password='test123.')
+        with override_settings(TIMBERJACK_POLICIES={'auth.user': {'exclude_users': ('service@example.com',)}}):
+            self.assertIsNone(self.log(user=other))
+            self.assertIsNotNone(self.log())
+
+    def test_log_action_level(self):
+        with override_settings(TIMBERJACK_POLICIES={'auth.user': {'level': 40}}):
+            self.assertEqual(self.log().log_level, 40)
+
+    def test_sampling(self):
+        with override_settings(TIMBERJACK_POLICIES={'auth.user': {'sample_rate': 0}}):
+            self.assertTrue(policy.get_policy(self.user).audits(ObjectAccessLog.READ_ACTION))
+            self.assertIsNone(self.log())
+            self.assertEqual(ObjectAccessLog.objects.log_actions(self.user, self.content_type, [self.user],
+                                                                 ObjectAccessLog.READ_ACTION), [])
+        self.assertEqual(ObjectAccessLog.objects.count(), 0)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+
+from mongoengine import ValidationError
+
+from timberjack.documents import ObjectAccessLog, SubMessage
+from timberjack.records import AccessRecord
+from timberjack.utils import get_routing_key, pack_ip_address
+
+USER_MODEL = get_user_model()
+
+
+class AccessRecordTestCase(TestCase):
+
+    def setUp(self):
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.')
+        self.ctype = ContentType.objects.get_for_model(self.user)
+
+    def get_record(self, **kwargs):
+        return AccessRecord(**dict(dict(user=self.user, content_type=self.ctype, object_pk=self.user.pk,
+                                        object_repr=repr(self.user), action_flag=4), **kwargs))
+
+    def test_slots(self):
+        self.assertRaises(AttributeError, setattr, self.get_record(), 'extra', 1)
+
+    def test_to_mongo_matches_document(self):
+        record = self.get_record(change_message=[{'changed': {'fields': ['email']}}], ip_address='10.0.0.1')
+        record.validate()
+        document = ObjectAccessLog(id=record.id, user=self.user, content_type=self.ctype, object_pk=self.user.pk,
+                                   object_repr=repr(self.user), action_flag=4, ip_address='10.0.0.1',
+                                   change_message=[SubMessage(action='changed', fields=['email'])],
+                                   timestamp=record.timestamp)
+        document.validate()
+        self.assertEqual(record.to_mongo(), document.to_mongo().to_dict())
+        self.assertEqual(bytes(record.to_mongo()['ip_address_packed']), pack_ip_address('10.0.0.1'))
+
+    def test_validate(self):
+        self.assertRaises(ValidationError, self.get_record(action_flag=5).validate)
+        self.assertRaises(ValidationError, self.get_record(log_level=15).validate)
+        self.assertRaises(ValidationError, self.get_record(ip_address='invalid').validate)
+        self.assertRaises(ValidationError, self.get_record(object_pk=None).validate)
+        self.assertRaises(ValidationError, self.get_record(user='test@example.com').validate)
+
+    @override_settings(TIMBERJACK_SHARDING=True)
+    def test_routing_key(self):
+        record = self.get_record()
+        record.validate()
+        self.assertEqual(record.routing_key, get_routing_key(self.ctype.pk, self.user.pk))
+
+    def test_to_document(self):
+        document = self.get_record().to_document()
+        self.assertIsInstance(document, ObjectAccessLog)
+        self.assertEqual(document.user, self.user)
+        self.assertEqual(document.content_type, self.ctype)
+
+    def test_human_message_matches_document(self):
+        for kwargs in ({}, {'action_flag': 2, 'message': 'email'}, {'ip_address': '10.0.0.1'},
+                       {'change_message': [{'changed': {'fields': ['email']}}]}):
+            record = self.get_record(**kwargs)
+            record.validate()
+            self.assertEqual(record.get_human_message(),
+                             record.to_document().get_human_message(include_context=True))
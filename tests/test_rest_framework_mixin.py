@@ -11,6 +11,8 @@ from rest_framework.routers import DefaultRouter
 from rest_framework.serializers import ModelSerializer
 from rest_framework.viewsets import ModelViewSet
 
+from mongoengine.context_managers import query_counter
+
 from timberjack.documents import ObjectAccessLog
 from timberjack.compat.rest_framework import mixins
 
@@ -27,8 +29,23 @@ class UserViewSet(mixins.AccessLogModelViewMixin, ModelViewSet):
     queryset = User.objects.all()
 
 
+class TrackedUserViewSet(UserViewSet):
+    track_changes = True
+
+
+class AuditedListUserViewSet(UserViewSet):
+    list_audit_mode = 'entries'
+
+
+class BulkAuditedListUserViewSet(UserViewSet):
+    list_audit_mode = 'bulk'
+
+
 router = DefaultRouter()
 router.register(r'users', viewset=UserViewSet)
+router.register(r'tracked-users', viewset=TrackedUserViewSet, base_name='tracked-user')
+router.register(r'audited-users', viewset=AuditedListUserViewSet, base_name='audited-user')
+router.register(r'bulk-audited-users', viewset=BulkAuditedListUserViewSet, base_name='bulk-audited-user')
 urlpatterns = [
     url(r'^', include(router.urls)),
     url(r'^auth/', include('rest_framework.urls', namespace='rest_framework'))
@@ -51,6 +68,41 @@ class AccessLogModelViewMixinTestCase(APITestCase):
         instance = ObjectAccessLog.objects.filter(action_flag=ObjectAccessLog.READ_ACTION).first()
         self.assertEqual(instance.get_content_object(), self.user)
 
+    def test_list_is_not_logged_by_default(self):
+        ObjectAccessLog.drop_collection()
+
+        response = self.client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ObjectAccessLog.objects.count(), 0)
+
+    def test_list_entries_are_logged(self):
+        ObjectAccessLog.drop_collection()
+        ObjectAccessLog._get_collection()  # Create the indexes up front
+        other = User.objects.create_user('other', 'other@example.com', 'test123.')
+
+        with query_counter() as queries:
+            response = self.client.get(reverse('audited-user-list'))
+            self.assertEqual(queries, 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+        entries = ObjectAccessLog.objects.actions(ObjectAccessLog.READ_ACTION)
+        self.assertEqual({entry.get_content_object() for entry in entries}, {self.user, other})
+        self.assertEqual(entries.first().change_message[0].action, 'read')
+
+    def test_list_bulk_entry_is_logged(self):
+        ObjectAccessLog.drop_collection()
+        other = User.objects.create_user('other', 'other@example.com', 'test123.')
+
+        response = self.client.get(reverse('bulk-audited-user-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(ObjectAccessLog.objects.count(), 1)
+        entry = ObjectAccessLog.objects.first()
+        self.assertTrue(entry.is_bulk_entry)
+        self.assertEqual(set(entry.get_content_objects()), {self.user, other})
+        self.assertIn(entry, ObjectAccessLog.objects.for_object(other))
+
     def test_post_object_is_logged(self):
         ObjectAccessLog.drop_collection()
 
@@ -75,6 +127,18 @@ class AccessLogModelViewMixinTestCase(APITestCase):
         instance = ObjectAccessLog.objects.filter(action_flag=ObjectAccessLog.UPDATE_ACTION).first()
         self.assertEqual(instance.get_content_object(), self.user)
 
+    def test_patch_object_changed_fields_are_tracked(self):
+        ObjectAccessLog.drop_collection()
+
+        response = self.client.patch(reverse('tracked-user-detail', kwargs={'pk': self.user.pk}), data={
+            'username': self.user.username,
+            'email': 'changed-user@example.com'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        instance = ObjectAccessLog.objects.filter(action_flag=ObjectAccessLog.UPDATE_ACTION).first()
+        self.assertEqual(instance.change_message[0].fields, ['email'])
+
     def test_put_object_is_logged(self):
         ObjectAccessLog.drop_collection()
 
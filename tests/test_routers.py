@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+
+from timberjack import routers
+from timberjack.documents import ObjectAccessLog
+
+USER_MODEL = get_user_model()
+
+
+class GroupRouter(routers.BaseRouter):
+
+    def db_for_write(self, content_type, **hints):
+        if content_type is not None and content_type.model == 'group':
+            return 'tenant'
+
+    db_for_read = db_for_write
+
+
+class TenantReadRouter(routers.BaseRouter):
+
+    def db_for_read(self, content_type, **hints):
+        if hints.get('username') == 'test@example.com' or len(hints.get('content_types', [])) > 1:
+            return 'tenant'
+
+
+@override_settings(TIMBERJACK_ROUTERS=['tests.test_routers.GroupRouter'])
+class RouterTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        ObjectAccessLog.objects.using('tenant').delete()
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.')
+        self.group = Group.objects.create(name='group')
+
+    def log(self, obj):
+        return ObjectAccessLog.objects.log_action(user=self.user, content_type=ContentType.objects.get_for_model(obj),
+                                                  object_pk=obj.pk, object_repr=str(obj),
+                                                  action_flag=ObjectAccessLog.READ_ACTION)
+
+    def test_writes_are_routed(self):
+        self.log(self.user)
+        record = self.log(self.group)
+        self.assertEqual(ObjectAccessLog.objects.count(), 1)
+        self.assertEqual(ObjectAccessLog.objects.using('tenant').get().pk, record.pk)
+
+    def test_using_takes_precedence(self):
+        ObjectAccessLog.objects.using('default').log_action(
+            user=self.user, content_type=ContentType.objects.get_for_model(self.group), object_pk=self.group.pk,
+            object_repr='group', action_flag=ObjectAccessLog.READ_ACTION)
+        self.assertEqual(ObjectAccessLog.objects.count(), 1)
+
+    def test_reads_are_routed(self):
+        record = self.log(self.group)
+        self.assertEqual(ObjectAccessLog.objects.for_object(self.group).get().pk, record.pk)
+        self.assertEqual(ObjectAccessLog.objects.for_model(Group).count(), 1)
+        self.assertEqual(ObjectAccessLog.objects.for_user(self.user).count(), 0)
+
+    def test_save_is_routed(self):
+        ObjectAccessLog(user=self.user, content_type=ContentType.objects.get_for_model(self.group),
+                        object_pk=self.group.pk, object_repr='group', action_flag=ObjectAccessLog.READ_ACTION).save()
+        self.assertEqual(ObjectAccessLog.objects.count(), 0)
+        self.assertEqual(ObjectAccessLog.objects.using('tenant').count(), 1)
+
+    def test_reads_of_several_models_and_usernames_are_routed(self):
+        with override_settings(TIMBERJACK_ROUTERS=['tests.test_routers.TenantReadRouter']):
+            self.assertEqual(ObjectAccessLog.objects.for_model(Group, USER_MODEL)._alias, 'tenant')
+            self.assertEqual(ObjectAccessLog.objects.for_user('test@example.com')._alias, 'tenant')
+            self.assertIsNone(ObjectAccessLog.objects.for_user('other')._alias)
+
+    def test_referrers_are_read_from_the_entries_alias(self):
+        referrer = self.log(self.group)
+        entry = self.log(self.group)
+        ObjectAccessLog.objects.using('tenant').filter(pk=entry.pk).update(set__referrer=referrer)
+        entry = ObjectAccessLog.objects.using('tenant').filter(pk=entry.pk).prefetch_referrers().get()
+        self.assertEqual(entry.referrer.pk, referrer.pk)
+
+    def test_collections_are_cached(self):
+        self.assertIs(routers.get_collection(ObjectAccessLog, 'tenant'),
+                      routers.get_collection(ObjectAccessLog, 'tenant'))
+        self.assertEqual(routers.get_collection(ObjectAccessLog, 'tenant').database.name, 'tenant')
+        self.assertIsNot(ObjectAccessLog.objects.using('tenant')._collection, ObjectAccessLog._get_collection())
+
+    def test_routers_setting_changes(self):
+        with override_settings(TIMBERJACK_ROUTERS=[]):
+            self.assertIsNone(routers.db_for_write(ContentType.objects.get_for_model(self.group)))
+        self.assertEqual(routers.db_for_write(ContentType.objects.get_for_model(self.group)), 'tenant')
+
+    def test_default_alias_is_never_switched(self):
+        stop = threading.Event()
+
+        def route():
+            while not stop.is_set():
+                routers._collections.clear()
+                routers.get_collection(ObjectAccessLog, 'tenant')
+
+        thread = threading.Thread(target=route)
+        thread.start()
+        try:
+            for i in range(200):
+                self.assertEqual(ObjectAccessLog._meta['db_alias'], 'default')
+                self.assertEqual(ObjectAccessLog._get_collection().database.name, 'default')
+                self.log(self.user)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(ObjectAccessLog.objects.count(), 200)
+        self.assertEqual(ObjectAccessLog.objects.using('tenant').count(), 0)
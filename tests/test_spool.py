@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+from pymongo.errors import AutoReconnect
+
+from timberjack import spool
+from timberjack.documents import ObjectAccessLog, UserSnapshot
+
+USER_MODEL = get_user_model()
+
+
+class FailingCollection(object):
+
+    def insert_one(self, document):
+        raise AutoReconnect('unavailable')
+
+    def insert_many(self, documents, ordered=True):
+        raise AutoReconnect('unavailable')
+
+
+class CircuitBreakerTestCase(TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = spool.CircuitBreaker(threshold=2, reset_timeout=60)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+    def test_half_open(self):
+        breaker = spool.CircuitBreaker(threshold=1, reset_timeout=0)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertTrue(breaker.allow())
+
+
+class SpoolTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.')
+        self.ctype = ContentType.objects.get_for_model(self.user)
+
+    def get_writer(self):
+        with self.settings(TIMBERJACK_SPOOL_DIR=self.directory, TIMBERJACK_BREAKER_THRESHOLD=1,
+                           TIMBERJACK_SPOOL_REPLAY_INTERVAL=None):
+            return spool.SpoolingWriter()
+
+    def test_write_without_spool(self):
+        self.assertRaises(AutoReconnect, spool.write, FailingCollection(), [{'a': 1}])
+
+    def test_spool_and_replay(self):
+        writer = self.get_writer()
+        records = [ObjectAccessLog.objects.log_record(user=self.user, content_type=self.ctype,
+                                                      object_pk=self.user.pk, object_repr=repr(self.user),
+                                                      action_flag=4) for i in range(2)]
+        ObjectAccessLog.drop_collection()
+
+        writer.write(FailingCollection(), [record.to_mongo() for record in records])
+        self.assertEqual(writer.breaker.state, writer.breaker.OPEN)
+        writer.close()
+        self.assertEqual(len(spool.get_ready_files(self.directory)), 1)
+
+        # Replaying is idempotent; an entry which is already stored is skipped.
+        spool.insert(ObjectAccessLog._get_collection(), [records[0].to_mongo()])
+        self.assertEqual(spool.replay(ObjectAccessLog._get_collection(), self.directory), 2)
+        self.assertEqual(ObjectAccessLog.objects.count(), 2)
+        self.assertEqual(spool.get_ready_files(self.directory), [])
+
+    def test_call(self):
+        writer = self.get_writer()
+        self.assertEqual(writer.call(max, 1, 2), 2)
+        self.assertRaises(AutoReconnect, writer.call, FailingCollection().insert_one, {'a': 1})
+        self.assertRaises(spool.CircuitOpenError, writer.call, max, 1, 2)
+
+    def test_replay_claims_files(self):
+        writer = self.get_writer()
+        writer.write(FailingCollection(), [{'a': 1}])
+        writer.close()
+        path = spool.get_ready_files(self.directory)[0]
+
+        # A file claimed by another replay is skipped.
+        os.rename(path, path + spool.REPLAYING_SUFFIX)
+        self.assertEqual(spool.replay(ObjectAccessLog._get_collection(), self.directory), 0)
+        spool.recover_claimed_files(self.directory)
+
+        # A file which fails to replay is released again.
+        self.assertRaises(AutoReconnect, spool.replay, FailingCollection(), self.directory)
+        self.assertEqual(spool.get_ready_files(self.directory), [path])
+
+    def test_replay_skips_partly_written_entries(self):
+        writer = self.get_writer()
+        writer.write(FailingCollection(), [{'a': 1}, {'a': 2}])
+        writer.close()
+        path = spool.get_ready_files(self.directory)[0]
+        with open(path, 'ab') as f:
+            f.write(b'\x10\x00')
+        self.assertEqual(spool.replay(ObjectAccessLog._get_collection(), self.directory), 2)
+
+    def test_append_drops_entries_when_the_disk_fails(self):
+        path = os.path.join(self.directory, 'file')
+        open(path, 'w').close()
+        # The spool directory can't be created below a file.
+        failing = spool.Spool(os.path.join(path, 'spool'), max_bytes=1024, fsync_interval=60)
+        failing.append([{'a': 1}])
+        self.assertIsNone(failing._file)
+
+    def test_rotation(self):
+        directory = os.path.join(self.directory, 'spool')
+        rotating = spool.Spool(directory, max_bytes=1, fsync_interval=60)
+        rotating.append([{'a': 1}])
+        time.sleep(0.01)
+        rotating.append([{'a': 2}])
+        self.assertEqual(len(spool.get_ready_files(directory)), 2)
+
+    def test_replay_command(self):
+        record = ObjectAccessLog.objects.log_record(user=self.user, content_type=self.ctype,
+                                                    object_pk=self.user.pk, object_repr=repr(self.user),
+                                                    action_flag=4)
+        ObjectAccessLog.drop_collection()
+        writer = self.get_writer()
+        writer.write(FailingCollection(), [record.to_mongo()])
+        writer.close()
+
+        out = StringIO()
+        with override_settings(TIMBERJACK_SPOOL_DIR=self.directory):
+            call_command('timberjack_replay', stdout=out)
+        self.assertIn('Replayed 1 entries.', out.getvalue())
+        self.assertEqual(ObjectAccessLog.objects.get().pk, record.pk)
+
+
+class SpooledWritesTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        UserSnapshot.drop_collection()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.user = USER_MODEL.objects.create_user(username='test@example.com', password='test123.')
+        self.ctype = ContentType.objects.get_for_model(self.user)
+        settings = self.settings(TIMBERJACK_SPOOL_DIR=self.directory, TIMBERJACK_SPOOL_REPLAY_INTERVAL=None,
+                                 TIMBERJACK_DEDUPLICATE_USERS=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(spool._writers.clear)
+        # Open the circuit, as if MongoDB were unavailable.
+        self.writer = spool.get_writer()
+        for i in range(self.writer.breaker.threshold):
+            self.writer.breaker.failure()
+
+    def test_user_snapshot_is_embedded_while_the_circuit_is_open(self):
+        record = ObjectAccessLog.objects.log_record(user=self.user, content_type=self.ctype,
+                                                    object_pk=self.user.pk, object_repr=repr(self.user),
+                                                    action_flag=4)
+        self.assertIsNone(record.user_snapshot)
+        self.assertEqual(record.user['fields']['email'], self.user.email)
+        self.assertEqual(UserSnapshot.objects.count(), 0)
+
+    def test_save_is_spooled(self):
+        entry = ObjectAccessLog(user=self.user, content_type=self.ctype, object_pk=self.user.pk,
+                                object_repr=repr(self.user), action_flag=4)
+        entry.save()
+        self.assertIsNotNone(entry.pk)
+        self.writer.close()
+        self.assertEqual(ObjectAccessLog.objects.count(), 0)
+        self.assertEqual(spool.replay(ObjectAccessLog._get_collection(), self.directory), 1)
+        self.assertEqual(ObjectAccessLog.objects.get().pk, entry.pk)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from timberjack.documents import ObjectAccessLog
+from timberjack.tail import tail, _prefix_query
+
+
+class TailTestCase(TestCase):
+
+    def setUp(self):
+        ObjectAccessLog.drop_collection()
+        self.user = get_user_model().objects.create_user(username='test@example.com', password='test123.')
+        self.ctype = ContentType.objects.get_for_model(self.user)
+
+    def log(self, action_flag):
+        return ObjectAccessLog.objects.log_action(user=self.user, content_type=self.ctype,
+                                                  object_pk=self.user.pk, object_repr=repr(self.user),
+                                                  action_flag=action_flag)
+
+    def test_prefix_query(self):
+        self.assertEqual(_prefix_query({'action_flag': 3, '$or': [{'user.pk': 1}]}, 'fullDocument'),
+                         {'fullDocument.action_flag': 3, '$or': [{'fullDocument.user.pk': 1}]})
+
+    def test_poll_new_entries(self):
+        first = self.log(ObjectAccessLog.READ_ACTION)
+        entries = tail(resume_after=first.pk, poll_interval=0.01, use_change_stream=False)
+        second = self.log(ObjectAccessLog.READ_ACTION)
+        third = self.log(ObjectAccessLog.DELETE_ACTION)
+
+        self.assertEqual(next(entries), (second.pk, second))
+        self.assertEqual(next(entries), (third.pk, third))
+
+    def test_poll_filtered_entries(self):
+        first = self.log(ObjectAccessLog.READ_ACTION)
+        queryset = ObjectAccessLog.objects.filter(action_flag=ObjectAccessLog.DELETE_ACTION)
+        entries = tail(queryset, resume_after=first.pk, poll_interval=0.01, use_change_stream=False)
+        self.log(ObjectAccessLog.READ_ACTION)
+        deleted = self.log(ObjectAccessLog.DELETE_ACTION)
+
+        self.assertEqual(next(entries), (deleted.pk, deleted))
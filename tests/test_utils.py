@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase, RequestFactory, override_settings
+
+from timberjack.utils import LRUCache, get_client_ip, pack_ip_address, pack_ip_network
+
+
+class LRUCacheTestCase(TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 2), 2)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_callable_maxsize(self):
+        cache = LRUCache(maxsize=lambda: 1)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(len(cache), 1)
+
+
+class IPAddressTestCase(TestCase):
+
+    def test_pack_ip_address(self):
+        self.assertEqual(len(pack_ip_address('10.0.0.1')), 16)
+        self.assertEqual(len(pack_ip_address('fe80::1')), 16)
+        self.assertLess(pack_ip_address('10.0.0.1'), pack_ip_address('10.0.0.2'))
+        self.assertLess(pack_ip_address('9.255.255.255'), pack_ip_address('10.0.0.0'))
+        self.assertRaises(ValueError, pack_ip_address, '10.0.0.1, 10.0.0.2')
+
+    def test_pack_ip_network(self):
+        first, last = pack_ip_network('10.20.0.0/16')
+        self.assertEqual(first, pack_ip_address('10.20.0.0'))
+        self.assertEqual(last, pack_ip_address('10.20.255.255'))
+
+    def test_client_ip_without_trusted_proxies(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(get_client_ip(request), '10.0.0.1')
+
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.2')
+        self.assertEqual(get_client_ip(request), '1.1.1.1')
+
+    @override_settings(TIMBERJACK_TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_client_ip_with_trusted_proxies(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1',
+                                       HTTP_X_FORWARDED_FOR='6.6.6.6, 1.1.1.1, 10.0.0.2')
+        self.assertEqual(get_client_ip(request), '1.1.1.1')
+
+        # Untrusted peers can't spoof the header
+        request = RequestFactory().get('/', REMOTE_ADDR='2.2.2.2', HTTP_X_FORWARDED_FOR='1.1.1.1')
+        self.assertEqual(get_client_ip(request), '2.2.2.2')
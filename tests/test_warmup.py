@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from timberjack.documents import ObjectAccessLog
+from timberjack.mixins import _form_classes, clear_form_classes
+from timberjack.warmup import get_warmup_models, warm_up
+
+
+class WarmUpTestCase(TestCase):
+
+    def test_get_warmup_models(self):
+        models = get_warmup_models()
+        self.assertIn(User, models)
+        self.assertIn(Group, models)
+        self.assertIn(ContentType, models)
+
+    @override_settings(TIMBERJACK_WARMUP_MODELS=['auth.Permission'])
+    def test_get_warmup_models_setting(self):
+        self.assertIn(Permission, get_warmup_models())
+
+    def test_warm_up(self):
+        clear_form_classes()
+        ContentType.objects.clear_cache()
+        models = warm_up()
+        self.assertEqual(len(_form_classes), len(set(model._meta.concrete_model for model in models)))
+        with self.assertNumQueries(0):
+            ContentType.objects.get_for_model(User)
+
+    def test_ensure_indexes_command(self):
+        ObjectAccessLog.drop_collection()
+        out = StringIO()
+        call_command('timberjack_ensure_indexes', stdout=out)
+        self.assertIn('Created the indexes of object_access_log.', out.getvalue())
+        self.assertGreater(len(ObjectAccessLog._get_collection().index_information()), 1)
@@ -1,3 +1,10 @@
-from django.db import models
+from django.contrib.auth.models import Group
 
-# Create your models here.
+from timberjack.audit import AuditedManager
+
+
+class AuditedGroup(Group):
+    objects = AuditedManager()
+
+    class Meta:
+        proxy = True
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
-from django.conf.urls import url
+from django.conf.urls import include, url
 from django.contrib import admin
 
+from timberjack.admin import get_dashboard_urls
+
 urlpatterns = [
+    url(r'^admin/', include(get_dashboard_urls())),
     url(r'^admin/', admin.site.urls),
 ]
@@ -1,17 +1,31 @@
 # -*- coding: utf-8 -*-
 
+import calendar
+import hashlib
+from functools import partial
+
 from django.conf.urls import url
+from django.contrib import admin
 from django.contrib.admin.options import get_content_type_for_model
 from django.contrib.admin.utils import unquote
+from django.core.cache import caches
 from django.core.exceptions import PermissionDenied
-from django.http import Http404
+from django.http import Http404, HttpResponseNotModified
 from django.template.defaultfilters import capfirst
+from django.template.loader import render_to_string
 from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.encoding import force_text
 from django.utils.html import escape
-from django.utils.translation import ugettext_lazy as _
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language, ugettext_lazy as _
 
+from timberjack import audit, dashboard, policy
+from timberjack.conf import settings
+from timberjack.constants import ACTIONS
 from timberjack.documents import ObjectAccessLog
+from timberjack.utils import get_client_ip
 
 
 class TimberjackMixin(object):
@@ -20,9 +34,17 @@ class TimberjackMixin(object):
     change_form_template = 'admin/timberjack/change_form.html'
     timberjack_max_history_items = 100
     timberjack_history_template = 'admin/timberjack/object_history.html'
+    timberjack_history_table_template = 'admin/timberjack/object_history_table.html'
+    # Viewing the history is a read of the object. The read is logged after
+    # the freshness of the history is determined, but it still makes the
+    # next view stale, so views which log a read are not cached.
+    timberjack_log_history_reads = True
+    # Don't log a read of an object fetched to handle a POST if
+    # the same request goes on to write the object.
+    timberjack_suppress_read_before_write = False
 
     def _get_request_address(self, request):
-        return request.META.get('HTTP_X_FORWARDED_FOR') or request.META.get('REMOTE_ADDR')
+        return get_client_ip(request)
 
     def _update_message(self, action, object, message):
         """
@@ -43,26 +65,100 @@ class TimberjackMixin(object):
         ] + super(TimberjackMixin, self).get_urls()
         return urlpatterns
 
+    def _get_request_reads(self, request):
+        # Maps (content type pk, object pk) to a pending read, or None
+        # once the object has been logged in this request.
+        reads = getattr(request, '_timberjack_reads', None)
+        if reads is None:
+            reads = request._timberjack_reads = {}
+        return reads
+
+    def _get_object_key(self, object):
+        return get_content_type_for_model(object).pk, force_text(object.pk)
+
     def get_object(self, request, object_id, from_field=None):
+        """
+        Log a read of the object once per request. Reads for POST requests
+        are deferred until the view returns if `timberjack_suppress_read_before_write`
+        is set, and dropped if the object is written in the meantime.
+        """
         instance = super(TimberjackMixin, self).get_object(request, object_id, from_field)
         if instance:
-            self.log_read(request, instance, force_text(instance))
+            self._log_request_read(request, instance)
         return instance
 
+    def _log_request_read(self, request, instance):
+        # Returns True if a read was logged by this call.
+        reads = self._get_request_reads(request)
+        key = self._get_object_key(instance)
+        if key in reads:
+            return False
+        if not self.is_audited(request, instance, ObjectAccessLog.READ_ACTION):
+            reads[key] = None
+        elif self.timberjack_suppress_read_before_write and request.method == 'POST':
+            reads[key] = (instance, force_text(instance))
+        else:
+            reads[key] = None
+            self.log_read(request, instance, force_text(instance))
+            return True
+        return False
+
+    def is_audited(self, request, object, action_flag):
+        """
+        Return True if the audit policy of the model logs `action_flag` by the user.
+        """
+        return policy.get_policy(get_content_type_for_model(object)).audits(action_flag, request.user)
+
+    def _mark_written(self, request, object):
+        self._get_request_reads(request)[self._get_object_key(object)] = None
+
+    def flush_reads(self, request):
+        """
+        Log the deferred reads of the request.
+        """
+        reads = self._get_request_reads(request)
+        for key, pending in list(reads.items()):
+            if pending is not None:
+                reads[key] = None
+                self.log_read(request, *pending)
+
+    def changeform_view(self, request, *args, **kwargs):
+        try:
+            with audit.request_actor(request):
+                return super(TimberjackMixin, self).changeform_view(request, *args, **kwargs)
+        finally:
+            self.flush_reads(request)
+
+    def delete_view(self, request, *args, **kwargs):
+        try:
+            with audit.request_actor(request):
+                return super(TimberjackMixin, self).delete_view(request, *args, **kwargs)
+        finally:
+            self.flush_reads(request)
+
+    def changelist_view(self, request, *args, **kwargs):
+        # Admin actions run bulk operations, such as `delete_selected`.
+        with audit.request_actor(request):
+            return super(TimberjackMixin, self).changelist_view(request, *args, **kwargs)
+
     def log_addition(self, request, object, message):
         """
         Log that an object has been successfully added.
         Overrides default behaviour, but will write an `admin.LogEntry` entry
         for the action as well.
         """
+        if not self.is_audited(request, object, ObjectAccessLog.CREATE_ACTION):
+            return super(TimberjackMixin, self).log_addition(request, object, message)
         if isinstance(message, list):
             message = self._update_message('added', object, message)
-        ObjectAccessLog.objects.log_action(user=request.user, content_type=get_content_type_for_model(object),
+        self._mark_written(request, object)
+        ObjectAccessLog.objects.log_record(user=request.user, content_type=get_content_type_for_model(object),
                                            object_pk=object.pk, object_repr=force_text(object),
                                            log_level=self.default_log_level,
                                            ip_address=self._get_request_address(request),
                                            action_flag=ObjectAccessLog.CREATE_ACTION,
-                                           message=message, write_admin_log=True)
+                                           message=message, write_admin_log=True,
+                                           hints={'request': request})
 
     def log_change(self, request, object, message):
         """
@@ -70,14 +166,18 @@ class TimberjackMixin(object):
         Overrides default behaviour, but will write an `admin.LogEntry` entry
         for the action as well.
         """
+        if not self.is_audited(request, object, ObjectAccessLog.UPDATE_ACTION):
+            return super(TimberjackMixin, self).log_change(request, object, message)
         if isinstance(message, list):
             message = self._update_message('changed', object, message)
-        ObjectAccessLog.objects.log_action(user=request.user, content_type=get_content_type_for_model(object),
+        self._mark_written(request, object)
+        ObjectAccessLog.objects.log_record(user=request.user, content_type=get_content_type_for_model(object),
                                            object_pk=object.pk, object_repr=force_text(object),
                                            log_level=self.default_log_level,
                                            ip_address=self._get_request_address(request),
                                            action_flag=ObjectAccessLog.UPDATE_ACTION,
-                                           message=message, write_admin_log=True)
+                                           message=message, write_admin_log=True,
+                                           hints={'request': request})
 
     def log_deletion(self, request, object, object_repr):
         """
@@ -85,13 +185,17 @@ class TimberjackMixin(object):
         Overrides default behaviour, but will write an `admin.LogEntry` entry
         for the action as well.
         """
+        if not self.is_audited(request, object, ObjectAccessLog.DELETE_ACTION):
+            return super(TimberjackMixin, self).log_deletion(request, object, object_repr)
+        self._mark_written(request, object)
         message = self._update_message('deleted', object, message=[{'deleted': {}}])
-        ObjectAccessLog.objects.log_action(user=request.user, content_type=get_content_type_for_model(object),
+        ObjectAccessLog.objects.log_record(user=request.user, content_type=get_content_type_for_model(object),
                                            object_pk=object.pk, object_repr=object_repr,
                                            log_level=self.default_log_level,
                                            ip_address=self._get_request_address(request),
                                            action_flag=ObjectAccessLog.DELETE_ACTION,
-                                           message=message, write_admin_log=True)
+                                           message=message, write_admin_log=True,
+                                           hints={'request': request})
 
     def log_read(self, request, object, object_repr):
         """
@@ -100,17 +204,41 @@ class TimberjackMixin(object):
         No entry will be written to `admin.LogEntry` since it does not support read
         actions.
         """
+        if not self.is_audited(request, object, ObjectAccessLog.READ_ACTION):
+            return
         message = self._update_message('read', object, message=[{'read': {}}])
-        ObjectAccessLog.objects.log_action(user=request.user, content_type=get_content_type_for_model(object),
+        ObjectAccessLog.objects.log_record(user=request.user, content_type=get_content_type_for_model(object),
                                            object_pk=object.pk, object_repr=object_repr,
                                            log_level=self.default_log_level,
                                            ip_address=self._get_request_address(request),
                                            action_flag=ObjectAccessLog.READ_ACTION,
-                                           message=message, write_admin_log=False)
+                                           message=message, write_admin_log=False,
+                                           hints={'request': request})
+
+    def _is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        # Dates have a resolution of seconds, and a newer entry may have
+        # been written within the second of `last_modified`.
+        return bool(last_modified and if_modified_since and last_modified < if_modified_since)
+
+    def get_history_cache_key(self, instance, latest):
+        """
+        Return a cache key for the rendered history of `instance`, which
+        changes whenever a newer entry is written for the object.
+        """
+        freshness = '%s.%s' % (latest.timestamp.isoformat(), latest.pk) if latest else 'empty'
+        key = ':'.join(force_text(value) for value in (
+            get_content_type_for_model(instance).pk, instance.pk, freshness, get_language(),
+            timezone.get_current_timezone_name(), self.timberjack_max_history_items))
+        return 'timberjack:history:%s' % hashlib.md5(key.encode('utf-8')).hexdigest()
 
     def timberjack_history_view(self, request, object_pk):
         model = self.model
-        instance = self.get_object(request, unquote(object_pk))
+        instance = super(TimberjackMixin, self).get_object(request, unquote(object_pk))
         if instance is None:
             raise Http404(_('%(name)s object with primary key %(key)r does not exist.') % {
                 'name': force_text(model._meta.verbose_name),
@@ -120,21 +248,121 @@ class TimberjackMixin(object):
         if not self.has_change_permission(request, instance):
             raise PermissionDenied
 
-        ctype = get_content_type_for_model(model)
-        action_list = ObjectAccessLog.objects.filter(
-            object_pk=instance.pk,
-            content_type__fields__model=ctype.model,
-            content_type__fields__app_label=ctype.app_label
-        ).order_by('-timestamp')[:self.timberjack_max_history_items]  # TODO: Create a proper pagination for results!
-
-        context = dict(
-            self.admin_site.each_context(request),
-            title=_('Access history: %s') % force_text(instance),
-            action_list=action_list,
-            opts=model._meta,
-            module_name=capfirst(force_text(model._meta.verbose_name_plural)),
-            object=instance,
-            preserved_filters=self.get_preserved_filters(request)
-        )
-
-        return TemplateResponse(request, self.timberjack_history_template, context=context)
+        queryset = ObjectAccessLog.objects.route(get_content_type_for_model(instance), request=request)
+        # Includes bucketed reads for models which bucket them.
+        queryset = queryset.for_read('history').for_object(instance)
+        latest = queryset.only('timestamp').first()
+        # Log the read once the freshness is known, so the read this request
+        # logs doesn't change its own ETag, but before answering with 304 or
+        # from cache, so every view is audited.
+        logged_read = self.timberjack_log_history_reads and self._log_request_read(request, instance)
+        cache_key = self.get_history_cache_key(instance, latest)
+        # The page also renders user specific parts of the admin.
+        etag = hashlib.md5(('%s:%s' % (cache_key, request.user.pk)).encode('utf-8')).hexdigest()
+        last_modified = calendar.timegm(latest.timestamp.utctimetuple()) if latest else None
+
+        if self._is_not_modified(request, etag, last_modified):
+            response = HttpResponseNotModified()
+        else:
+            cache = caches[settings.HISTORY_CACHE] if settings.HISTORY_CACHE else None
+            cached = cache.get(cache_key) if cache is not None else None
+            if cached is None:
+                # TODO: Create a proper pagination for results!
+                action_list = queryset[:self.timberjack_max_history_items]
+                table = render_to_string(self.timberjack_history_table_template,
+                                         {'action_list': action_list}, request=request)
+                cached = (table, queryset.count())
+                # The logged read is newer than `latest`, so the key won't be used again.
+                if cache is not None and not logged_read:
+                    cache.set(cache_key, cached, settings.HISTORY_CACHE_TIMEOUT)
+
+            context = dict(
+                self.admin_site.each_context(request),
+                title=_('Access history: %s') % force_text(instance),
+                history_table=mark_safe(cached[0]),
+                history_count=cached[1],
+                history_limit=self.timberjack_max_history_items,
+                opts=model._meta,
+                module_name=capfirst(force_text(model._meta.verbose_name_plural)),
+                object=instance,
+                preserved_filters=self.get_preserved_filters(request)
+            )
+            response = TemplateResponse(request, self.timberjack_history_template, context=context)
+
+        response['ETag'] = quote_etag(etag)
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+DASHBOARD_PERIODS = (1, 7, 30)
+
+
+def dashboard_view(request, admin_site=None):
+    """
+    Show the number of access log entries by action, user, model and hour,
+    and the most accessed objects, for the last day, week or month. The
+    `user` and `model` (a content type pk) query parameters narrow it down.
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    if not request.user.has_perm('admin.change_logentry'):
+        raise PermissionDenied
+
+    try:
+        days = int(request.GET.get('days', DASHBOARD_PERIODS[0]))
+    except ValueError:
+        days = None
+    if days not in DASHBOARD_PERIODS:
+        raise Http404(_('Invalid period.'))
+    username = request.GET.get('user') or None
+    content_type = None
+    if request.GET.get('model'):
+        try:
+            content_type = ContentType.objects.get_for_id(int(request.GET['model']))
+        except (ValueError, ContentType.DoesNotExist):
+            raise Http404(_('Invalid model.'))
+
+    stats = dashboard.get_stats(dashboard.get_queryset(request), days, username, content_type)
+
+    def get_content_type(pk):
+        try:
+            return ContentType.objects.get_for_id(pk)
+        except ContentType.DoesNotExist:
+            return None
+
+    labels = dict(ACTIONS)
+    busiest = max([count for hour, count in stats['by_hour']] or [1])
+    admin_site = admin_site or admin.site
+    context = dict(
+        admin_site.each_context(request),
+        title=_('Access log dashboard'),
+        days=days,
+        periods=DASHBOARD_PERIODS,
+        username=username,
+        content_type=content_type,
+        total=stats['total'],
+        start=stats['start'],
+        by_action=[(labels.get(flag, flag), count) for flag, count in stats['by_action']],
+        by_user=stats['by_user'],
+        by_model=[(pk, get_content_type(pk), count) for pk, count in stats['by_model']],
+        by_hour=[(hour, count, 100 * count // busiest) for hour, count in stats['by_hour']],
+        top_objects=[(get_content_type(pk), object_pk, object_repr, count)
+                     for pk, object_pk, object_repr, count in stats['top_objects']],
+    )
+    return TemplateResponse(request, 'admin/timberjack/dashboard.html', context=context)
+
+
+def get_dashboard_urls(admin_site=None):
+    """
+    Return the URL patterns of the dashboard, to be included next to
+    the URLs of `admin_site`:
+
+        url(r'^admin/', include(get_dashboard_urls())),
+        url(r'^admin/', admin.site.urls),
+    """
+    admin_site = admin_site or admin.site
+    return [
+        url(r'^timberjack/dashboard/$', admin_site.admin_view(partial(dashboard_view, admin_site=admin_site)),
+            name='timberjack_dashboard'),
+    ]
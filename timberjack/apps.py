@@ -6,3 +6,20 @@ from django.apps import AppConfig
 class TimberJackConfig(AppConfig):
     name = 'timberjack'
     label = 'timberjack'
+
+    def ready(self):
+        from timberjack import connection, policy
+        from timberjack.conf import settings
+        from timberjack.documents import update_username_index
+
+        update_username_index()
+
+        if settings.MANAGE_CONNECTION:
+            for alias in {settings.DB_ALIAS} | connection.get_read_aliases():
+                connection.register(alias)
+
+        policy.load()
+
+        if settings.WARMUP:
+            from timberjack.warmup import warm_up
+            warm_up()
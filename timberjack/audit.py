@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.utils.encoding import force_text
+
+from timberjack.conf import settings
+from timberjack.constants import CREATE_ACTION, DELETE_ACTION, UPDATE_ACTION
+from timberjack.utils import get_client_ip
+
+_registry = {}
+_local = threading.local()
+
+
+def register(model=None, single_entry=False, log_level=20):
+    """
+    Enable auditing of bulk operations for `model`, which must use an
+    `AuditedManager` or `AuditedQuerySet`. With `single_entry`, each statement
+    is logged as one entry listing the affected pks. Can be used as a class
+    decorator.
+    """
+    def decorator(model):
+        _registry[model] = {'single_entry': single_entry, 'log_level': log_level}
+        return model
+    return decorator(model) if model is not None else decorator
+
+
+def unregister(model):
+    _registry.pop(model, None)
+
+
+def is_registered(model):
+    return model in _registry
+
+
+@contextmanager
+def actor(user, ip_address=None):
+    """
+    Attribute bulk operations within the block to `user`, which may be a
+    callable returning the user. Operations outside of an actor block are
+    attributed to the `AUDIT_ACTOR`.
+    """
+    stack = _local.__dict__.setdefault('actors', [])
+    stack.append((user, ip_address))
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def request_actor(request):
+    """
+    Attribute bulk operations within the block to the user and client IP
+    of `request`. The user is looked up when an operation is logged, so
+    users authenticated later, as by django rest framework, are recorded.
+    """
+    return actor(lambda: getattr(request, 'user', None), ip_address=get_client_ip(request))
+
+
+def get_system_actor():
+    """
+    Return the `(user, None)` pair for the `AUDIT_ACTOR` username, or None.
+    An unsaved user is recorded if no user has that username.
+    """
+    username = settings.AUDIT_ACTOR
+    if username is None:
+        return None
+    model = get_user_model()
+    try:
+        user = model._default_manager.get_by_natural_key(username)
+    except model.DoesNotExist:
+        user = model(**{model.USERNAME_FIELD: username})
+    return user, None
+
+
+def get_actor():
+    """
+    Return the current `(user, ip_address)`, or the system actor if no
+    authenticated user is set.
+    """
+    stack = getattr(_local, 'actors', None)
+    if stack:
+        user, ip_address = stack[-1]
+        if callable(user) and not isinstance(user, models.Model):
+            user = user()
+        if user is not None and (not isinstance(user, models.Model) or user.is_authenticated()):
+            return user, ip_address
+    return get_system_actor()
+
+
+def log_bulk_action(model, objects, action_flag, message=None, actor=None):
+    """
+    Log `action_flag` for `objects`, model instances or `(pk, repr)` pairs,
+    with a single insert. `actor` is a `(user, ip_address)` pair, and
+    defaults to the current actor. Does nothing unless the model is
+    registered and there is an actor.
+    """
+    current = actor or get_actor()
+    if current is None or not is_registered(model) or not objects:
+        return
+
+    from django.contrib.contenttypes.models import ContentType
+    from timberjack.documents import ObjectAccessLog
+
+    options = _registry[model]
+    user, ip_address = current
+    ObjectAccessLog.objects.log_actions(user=user, content_type=ContentType.objects.get_for_model(
+                                            model, for_concrete_model=False),
+                                        objects=objects, action_flag=action_flag, message=message,
+                                        log_level=options['log_level'], ip_address=ip_address,
+                                        single_entry=options['single_entry'])
+
+
+def on_commit(func, using=None):
+    """
+    Call `func` once the current transaction is committed, or right away
+    outside of a transaction. Django 1.8 has no `on_commit`, so `func` is
+    always called right away there.
+    """
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(func, using=using)
+    else:
+        func()
+
+
+def get_object_repr(model, pk):
+    return '%s object (%s)' % (model.__name__, pk)
+
+
+class AuditedQuerySet(models.QuerySet):
+    """
+    QuerySet which logs `update()`, `delete()`, `bulk_create()` and
+    `bulk_update()` for registered models once the transaction commits.
+    Affected pks are locked and read with a single `values_list()` query,
+    without loading the instances.
+    """
+    def _is_audited(self):
+        return is_registered(self.model) and get_actor() is not None
+
+    def _get_pks(self):
+        queryset = self
+        if not self.query.distinct:
+            # Lock the rows, so no row is added to or removed from the
+            # selection between reading the pks and the statement. Some
+            # databases don't support locking with DISTINCT.
+            queryset = queryset.select_for_update()
+        return list(queryset.values_list('pk', flat=True))
+
+    def _log_on_commit(self, objects, action_flag, message=None):
+        # The actor block may be left before the transaction commits.
+        current = get_actor()
+        on_commit(lambda: log_bulk_action(self.model, objects, action_flag, message=message, actor=current),
+                  using=self.db)
+
+    def update(self, **kwargs):
+        if not self._is_audited():
+            return super(AuditedQuerySet, self).update(**kwargs)
+        with transaction.atomic(using=self.db):
+            pks = self._get_pks()
+            rows = super(AuditedQuerySet, self).update(**kwargs)
+            self._log_on_commit([(pk, get_object_repr(self.model, pk)) for pk in pks], UPDATE_ACTION,
+                                message=[{'changed': {'fields': sorted(kwargs)}}])
+        return rows
+    update.alters_data = True
+
+    def delete(self):
+        if not self._is_audited():
+            return super(AuditedQuerySet, self).delete()
+        with transaction.atomic(using=self.db):
+            pks = self._get_pks()
+            result = super(AuditedQuerySet, self).delete()
+            self._log_on_commit([(pk, get_object_repr(self.model, pk)) for pk in pks], DELETE_ACTION)
+        return result
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super(AuditedQuerySet, self).bulk_create(objs, *args, **kwargs)
+        if self._is_audited():
+            # Only some database backends set the pks of created objects.
+            self._log_on_commit([(obj.pk, force_text(obj)) for obj in objs if obj.pk is not None], CREATE_ACTION)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        # Available from Django 2.2.
+        objs = list(objs)
+        rows = super(AuditedQuerySet, self).bulk_update(objs, fields, *args, **kwargs)
+        if self._is_audited():
+            self._log_on_commit([(obj.pk, force_text(obj)) for obj in objs], UPDATE_ACTION,
+                                message=[{'changed': {'fields': sorted(fields)}}])
+        return rows
+    bulk_update.alters_data = True
+
+
+AuditedManager = models.Manager.from_queryset(AuditedQuerySet)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+from concurrent.futures import TimeoutError
+
+from mongoengine import *
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from timberjack import connection, routers, spool
+from timberjack.conf import settings
+from timberjack.constants import READ_ACTION
+from timberjack.documents import ObjectAccessLog
+from timberjack.fields import ModelField
+
+logger = logging.getLogger(__name__)
+
+# Fields stored once per bucket, and per event.
+BUCKET_FIELDS = ('content_type', 'object_pk', 'object_repr')
+EVENT_FIELDS = ('_id', 'user', 'message', 'change_message', 'log_level', 'ip_address', 'ip_address_packed',
+                'user_snapshot', 'timestamp')
+
+
+class ReadBucket(Document):
+    """
+    The read events of one object within one hour, up to `READ_BUCKET_SIZE`
+    events. Read by `ObjectAccessLogQuerySet.with_read_buckets()`, which
+    unwinds the events into `ObjectAccessLog` entries.
+    """
+    content_type = ModelField(required=True)
+    object_pk = DynamicField(required=True)
+    object_repr = StringField(max_length=200)
+    hour = DateTimeField(required=True)
+    count = IntField(default=0)
+    events = ListField(DictField())
+
+    meta = {
+        'db_alias': settings.DB_ALIAS,
+        'collection': 'object_access_log_read_bucket',
+        'indexes': [
+            ('content_type.pk', 'object_pk', '-hour'),
+            ('events.user.pk', '-hour'),
+            '-hour',
+        ]
+    }
+
+    @classmethod
+    def get_collection(cls, using=None, read_preference=None):
+        collection = cls._get_collection() if using is None else routers.get_collection(cls, using)
+        if read_preference is not None:
+            collection = collection.with_options(read_preference=read_preference)
+        return collection
+
+    @classmethod
+    def add(cls, records, using=None):
+        """
+        Append validated read `records` to the bucket of their object and hour,
+        starting a new bucket once it holds `READ_BUCKET_SIZE` events. The write
+        shares the circuit breaker and `WRITE_TIMEOUT` of the spooling writer of
+        the alias. Returns the records which could not be added.
+        """
+        requests = []
+        for record in records:
+            data = record.to_mongo()
+            hour = floor_hour(record.timestamp)
+            # Set the content type field by field; 'content_type.pk' is set from the query.
+            on_insert = dict(('content_type.%s' % key, value) for key, value in data['content_type'].items()
+                             if key != 'pk')
+            on_insert['object_repr'] = record.object_repr
+            requests.append(UpdateOne(
+                {'content_type.pk': data['content_type']['pk'], 'object_pk': record.object_pk, 'hour': hour,
+                 'count': {'$lt': settings.READ_BUCKET_SIZE}},
+                {'$push': {'events': dict((key, data[key]) for key in EVENT_FIELDS if key in data)},
+                 '$inc': {'count': 1},
+                 '$setOnInsert': on_insert},
+                upsert=True))
+        try:
+            if requests:
+                spool.call(cls.get_collection(using).bulk_write, requests, ordered=False, alias=using)
+        except spool.CircuitOpenError:
+            return records
+        except BulkWriteError as e:
+            logger.warning('Could not add %d reads to buckets: %r', len(records), e)
+            if e.details.get('writeConcernErrors'):
+                return records
+            failed = set(error['index'] for error in e.details.get('writeErrors', []))
+            return [record for index, record in enumerate(records) if index in failed]
+        except (PyMongoError, TimeoutError) as e:
+            # A write which times out may still complete, so its reads
+            # may then be counted twice.
+            logger.warning('Could not add %d reads to buckets: %r', len(records), e)
+            return records
+        return []
+
+
+@connection.register_after_fork
+def reset_collection():
+    ReadBucket._collection = None
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def get_bucket_match(query):
+    """
+    Translate the query of an `ObjectAccessLog` queryset into a query for the
+    buckets which may hold matching events, or None if none can. The events
+    themselves are matched with the original query once unwound.
+    """
+    action_flag = query.get('action_flag')
+    if isinstance(action_flag, dict):
+        if '$in' in action_flag and READ_ACTION not in action_flag['$in']:
+            return None
+    elif action_flag is not None and action_flag != READ_ACTION:
+        return None
+
+    match = {}
+    for key, value in query.items():
+        if key in ('content_type.pk', 'object_pk'):
+            match[key] = value
+        elif key.startswith('user.'):
+            match['events.' + key] = value
+        elif key == 'timestamp':
+            if isinstance(value, dict):
+                hour = {}
+                for operator, bound in value.items():
+                    if operator in ('$gt', '$gte'):
+                        hour['$gte'] = floor_hour(bound)
+                    elif operator in ('$lt', '$lte'):
+                        hour[operator] = bound
+                if hour:
+                    match['hour'] = hour
+            else:
+                match['hour'] = floor_hour(value)
+    return match
+
+
+def get_events_pipeline(query):
+    """
+    Return the aggregation pipeline which unwinds the bucketed events matching
+    the query of an `ObjectAccessLog` queryset into entries, or None if no
+    bucket can hold a matching event.
+    """
+    bucket_match = get_bucket_match(query)
+    if bucket_match is None:
+        return None
+    # Give each event the shape of an entry, so the query applies to it as is.
+    project = dict((key, '$events.%s' % key) for key in EVENT_FIELDS)
+    project.update((key, 1) for key in BUCKET_FIELDS)
+    project['action_flag'] = {'$literal': READ_ACTION}
+    return [
+        {'$match': bucket_match},
+        {'$unwind': '$events'},
+        {'$project': project},
+        {'$match': query},
+    ]
+
+
+class BucketedEntries(object):
+    """
+    The entries of an `ObjectAccessLog` queryset merged with the matching
+    events stored in read buckets, newest first. Supports iteration, slicing,
+    `first()` and `count()`. Queryset methods which return a queryset, such
+    as `actions()` or `between()`, return merged entries again.
+    """
+    def __init__(self, queryset):
+        self.queryset = queryset.order_by('-timestamp')
+        self.collection = ReadBucket.get_collection(queryset._alias, queryset._read_preference)
+        self.pipeline = get_events_pipeline(queryset._query)
+        self.limit = None
+
+    def _iter_events(self, limit=None):
+        if self.pipeline is None:
+            return iter([])
+        pipeline = self.pipeline + [{'$sort': {'timestamp': -1}}]
+        if limit is not None:
+            pipeline.append({'$limit': limit})
+        cursor = self.collection.aggregate(pipeline, allowDiskUse=True)
+        return (ObjectAccessLog._from_son(son) for son in cursor)
+
+    def _merge(self, entries, events):
+        entry, event = next(entries, None), next(events, None)
+        while entry is not None or event is not None:
+            if event is None or (entry is not None and entry.timestamp >= event.timestamp):
+                yield entry
+                entry = next(entries, None)
+            else:
+                yield event
+                event = next(events, None)
+
+    def __iter__(self):
+        if self.limit is None:
+            return self._merge(iter(self.queryset), self._iter_events())
+        # The newest `limit` entries are among the newest `limit` of each source.
+        return itertools.islice(self._merge(iter(self.queryset[:self.limit]), self._iter_events(self.limit)),
+                                self.limit)
+
+    def __getitem__(self, key):
+        """
+        Return the newest entries lazily for slices from the start, such as [:10].
+        """
+        if not isinstance(key, slice) or key.step is not None or key.start not in (None, 0) or key.stop is None:
+            raise TypeError('Only slices from the start, such as [:10], are supported.')
+        entries = BucketedEntries(self.queryset)
+        entries.limit = key.stop if self.limit is None else min(key.stop, self.limit)
+        return entries
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        attr = getattr(self.queryset, name)
+        if not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return BucketedEntries(result) if isinstance(result, QuerySet) else result
+        return method
+
+    def with_read_buckets(self):
+        return self
+
+    def first(self):
+        return next(iter(self[:1]), None)
+
+    def count(self):
+        count = self.queryset.count()
+        if self.pipeline is not None:
+            pipeline = self.pipeline + [{'$group': {'_id': None, 'count': {'$sum': 1}}}]
+            result = list(self.collection.aggregate(pipeline, allowDiskUse=True))
+            count += result[0]['count'] if result else 0
+        return count
@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 
-from django.contrib.admin.options import get_content_type_for_model
 from django.utils.encoding import force_text
 
-from timberjack.documents import ObjectAccessLog
+from timberjack import audit
 from timberjack.mixins import MethodActionMap, BaseObjectAccessLogMixin
+from timberjack.utils import get_client_ip
 
 
 class AccessLogModelViewMixin(BaseObjectAccessLogMixin):
@@ -15,20 +15,66 @@ class AccessLogModelViewMixin(BaseObjectAccessLogMixin):
     default_log_level = 20
     method_action_map_class = MethodActionMap
     write_admin_log = False
+    # Audit the objects returned by `list()`; 'entries' writes one entry per
+    # object and 'bulk' writes a single entry listing the object pks. Either
+    # way, each page is written with one insert.
+    list_audit_mode = None
 
     def log_object_action(self, request, obj, message):
         action_flag = self.get_method_action(request)
 
-        if not action_flag:
-            # Unsupported HTTP method; do nothing.
+        if not action_flag or not self.is_audited(request, obj, action_flag):
+            # Unsupported HTTP method or not audited; do nothing.
             return
 
-        ObjectAccessLog.objects.log_action(user=request.user, content_type=get_content_type_for_model(obj),
+        from django.contrib.contenttypes.models import ContentType
+        from timberjack.documents import ObjectAccessLog
+
+        content_type = ContentType.objects.get_for_model(obj, for_concrete_model=False)
+        ObjectAccessLog.objects.log_record(user=request.user, content_type=content_type,
                                            object_pk=obj.pk, object_repr=repr(obj), action_flag=action_flag,
                                            message=message, log_level=self.default_log_level,
-                                           ip_address=request.META.get('HTTP_X_FORWARDED_FOR') or
-                                                      request.META.get('REMOTE_ADDR'),
-                                           write_admin_log=self.write_admin_log)
+                                           ip_address=get_client_ip(request),
+                                           write_admin_log=self.write_admin_log, hints={'request': request})
+
+    def log_list_action(self, request, objects):
+        from timberjack.documents import ObjectAccessLog
+
+        if not objects or not self.is_audited(request, objects[0], ObjectAccessLog.READ_ACTION):
+            return
+
+        from django.contrib.contenttypes.models import ContentType
+
+        content_type = ContentType.objects.get_for_model(objects[0], for_concrete_model=False)
+        ObjectAccessLog.objects.log_actions(user=request.user, content_type=content_type, objects=objects,
+                                            action_flag=ObjectAccessLog.READ_ACTION,
+                                            log_level=self.default_log_level,
+                                            ip_address=get_client_ip(request),
+                                            single_entry=self.list_audit_mode == 'bulk',
+                                            hints={'request': request})
+
+    def dispatch(self, request, *args, **kwargs):
+        # Bulk operations are attributed to the user once authenticated.
+        with audit.request_actor(request):
+            return super(AccessLogModelViewMixin, self).dispatch(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if self.list_audit_mode is None:
+            return super(AccessLogModelViewMixin, self).list(request, *args, **kwargs)
+        if self.list_audit_mode not in ('entries', 'bulk'):
+            raise ValueError('Invalid list_audit_mode %r.' % self.list_audit_mode)
+
+        from rest_framework.response import Response
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = list(page if page is not None else queryset)
+        serializer = self.get_serializer(objects, many=True)
+        if request.user.is_authenticated():
+            self.log_list_action(request, objects)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -51,12 +97,15 @@ class AccessLogModelViewMixin(BaseObjectAccessLogMixin):
 
     def perform_update(self, serializer):
         super(AccessLogModelViewMixin, self).perform_update(serializer)
-        if self.request.user.is_authenticated():
+        if self.request.user.is_authenticated() and self.is_audited(self.request, serializer.instance):
+            changed_fields = self.get_changed_fields(serializer.instance) if self.track_changes else None
+            if changed_fields is None:
+                changed_fields = list(serializer.validated_data.keys())
             self.log_object_action(self.request, serializer.instance,
                                    message=[{'changed': {
                                        'name': force_text(serializer.instance._meta.verbose_name),
                                        'object': force_text(serializer.instance),
-                                       'fields': list(serializer.validated_data.keys())
+                                       'fields': changed_fields
                                    }}])
 
     def perform_destroy(self, instance):
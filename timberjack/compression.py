@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import zlib
+
+from bson import Binary
+
+from timberjack.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# User defined BSON binary subtype used to tag compressed values.
+BINARY_SUBTYPE = 0x80
+
+ZLIB = 1
+ZSTD = 2
+ALGORITHMS = {
+    'zlib': ZLIB,
+    'zstd': ZSTD,
+}
+
+_local = threading.local()
+_dictionaries = {}
+
+
+def get_config():
+    """
+    Return the `COMPRESSION` setting with defaults applied,
+    or None if compression is disabled.
+    """
+    config = settings.COMPRESSION
+    if not config:
+        return None
+    config = dict({'algorithm': 'zlib', 'threshold': 1024, 'level': None, 'dictionary': None}, **config)
+    if config['algorithm'] not in ALGORITHMS:
+        raise ValueError('Unsupported compression algorithm %r.' % config['algorithm'])
+    if config['algorithm'] == 'zstd' and zstandard is None:
+        raise ValueError('The zstd compression algorithm requires the zstandard package.')
+    return config
+
+
+def get_dictionary(path):
+    """
+    Return the contents of a shared, pre-trained compression dictionary.
+    """
+    if path not in _dictionaries:
+        with open(path, 'rb') as f:
+            _dictionaries[path] = f.read()
+    return _dictionaries[path]
+
+
+def _zstd(kind, dictionary, level=None):
+    # zstandard (de)compressors aren't thread safe, so keep one per thread.
+    cache = _local.__dict__.setdefault('zstd', {})
+    key = (kind, dictionary, level)
+    if key not in cache:
+        dict_data = zstandard.ZstdCompressionDict(get_dictionary(dictionary)) if dictionary else None
+        if kind == 'compress':
+            cache[key] = zstandard.ZstdCompressor(level=level or 3, dict_data=dict_data)
+        else:
+            cache[key] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return cache[key]
+
+
+def compress(data, config=None):
+    """
+    Compress `data` if compression is enabled and the data is at least
+    `threshold` bytes. Returns a tagged `bson.Binary`, or None if the data
+    should be stored uncompressed.
+    """
+    config = config or get_config()
+    if config is None or len(data) < config['threshold']:
+        return None
+
+    algorithm = ALGORITHMS[config['algorithm']]
+    if algorithm == ZSTD:
+        payload = _zstd('compress', config['dictionary'], config['level']).compress(data)
+    else:
+        level = config['level'] if config['level'] is not None else zlib.Z_DEFAULT_COMPRESSION
+        if config['dictionary']:
+            compressor = zlib.compressobj(level, zdict=get_dictionary(config['dictionary']))
+        else:
+            compressor = zlib.compressobj(level)
+        payload = compressor.compress(data) + compressor.flush()
+
+    if len(payload) + 1 >= len(data):
+        return None
+    return Binary(bytes(bytearray([algorithm])) + payload, BINARY_SUBTYPE)
+
+
+def is_compressed(value):
+    return isinstance(value, Binary) and value.subtype == BINARY_SUBTYPE
+
+
+def decompress(value):
+    """
+    Decompress a value returned by `compress()`.
+    """
+    algorithm, payload = bytearray(value[:1])[0], bytes(value[1:])
+    dictionary = (get_config() or {}).get('dictionary')
+    if algorithm == ZSTD:
+        if zstandard is None:
+            raise ValueError('Decompressing zstd values requires the zstandard package.')
+        return _zstd('decompress', dictionary).decompress(payload)
+    elif algorithm == ZLIB:
+        if dictionary:
+            decompressor = zlib.decompressobj(zdict=get_dictionary(dictionary))
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+    raise ValueError('Unknown compression algorithm %r.' % algorithm)
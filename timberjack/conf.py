@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings as django_settings
+
+DEFAULTS = {
+    # Maximum number of rendered change messages kept in memory.
+    'MESSAGE_CACHE_SIZE': 2048,
+    # Addresses or networks of reverse proxies trusted to set the X-Forwarded-For
+    # header. If None, the first address in the header is trusted as the client.
+    'TRUSTED_PROXIES': None,
+    # Alias in MONGO_CONNECTIONS used for the access log.
+    'DB_ALIAS': 'default',
+    # Let timberjack register lazily connected clients for its aliases, which
+    # are discarded and recreated in child processes after a fork. Aliases the
+    # project registered already keep their settings and clients. Enable this
+    # with preforking servers, unless the project connects in each worker.
+    'MANAGE_CONNECTION': False,
+    # Extra pymongo client options, such as `maxPoolSize`,
+    # `serverSelectionTimeoutMS` or `socketTimeoutMS`.
+    'CONNECTION_OPTIONS': {},
+    # Read preferences per read path; 'history', 'export' and 'aggregation'.
+    # Each value is either a read preference mode, such as 'secondaryPreferred',
+    # or a dict with the keys 'mode', 'max_staleness', 'tag_sets' and 'alias'.
+    # The 'content_object' path takes the django database alias used to look
+    # up content objects.
+    'READ_PREFERENCES': {},
+    # Store a compact `routing_key` on every entry and use (routing_key, timestamp)
+    # as the shard key. Run `manage.py timberjack_shard` after enabling.
+    'SHARDING': False,
+    # Warm up content types, serializers and form classes for
+    # logged models when the app registry is ready.
+    'WARMUP': False,
+    # Additional models to warm up, as 'app_label.ModelName' labels.
+    'WARMUP_MODELS': [],
+    # Store each distinct state of a user once in the `user_snapshot` collection,
+    # and only embed the user pk and username in the log entries.
+    'DEDUPLICATE_USERS': False,
+    # Number of user snapshot hashes remembered as stored.
+    'USER_SNAPSHOT_CACHE_SIZE': 4096,
+    # Compress `message` values and serialized model fields larger than a threshold.
+    # A dict with the keys 'algorithm' ('zlib' or 'zstd', which requires the
+    # zstandard package), 'threshold' in bytes, 'level' and 'dictionary', the
+    # path to a shared pre-trained dictionary, which must not change once values
+    # have been stored with it. None disables compression. Structured change
+    # messages are never compressed, so `changed_fields()` can query them.
+    'COMPRESSION': None,
+    # Alias in CACHES used for the rendered admin history, or None to disable.
+    'HISTORY_CACHE': 'default',
+    # Seconds the rendered admin history is cached. A newer entry for the
+    # object invalidates it immediately.
+    'HISTORY_CACHE_TIMEOUT': 3600,
+    # Directory for the local spool, which receives entries while MongoDB is slow
+    # or unavailable. Replay it with `manage.py timberjack_replay`. None disables it.
+    'SPOOL_DIR': None,
+    # Seconds a write may take before its entries are spooled instead, or None
+    # to wait for the write. Only used with a SPOOL_DIR.
+    'WRITE_TIMEOUT': None,
+    # Consecutive failed or slow writes before writes go straight to the spool.
+    'BREAKER_THRESHOLD': 5,
+    # Seconds before a write to MongoDB is tried again once the breaker opened.
+    'BREAKER_RESET_TIMEOUT': 30,
+    # Maximum seconds between syncs of the spool file to disk.
+    'SPOOL_FSYNC_INTERVAL': 1.0,
+    # Size in bytes at which the spool file is rotated.
+    'SPOOL_MAX_BYTES': 64 * 1024 * 1024,
+    # Seconds between attempts to replay the spool in the background,
+    # or None to only replay with the management command.
+    'SPOOL_REPLAY_INTERVAL': 60,
+    # Audit policies by model label, 'app_label.*' or '*'. Each value is a dict
+    # with the keys 'enabled', 'actions' (names such as 'create' or 'read'),
+    # 'level', 'sample_rate', 'exclude_users' (usernames), 'admin_log' and
+    # 'bucket_reads', which stores read events in hourly buckets instead of
+    # one entry each. Models without a policy are audited as before.
+    'POLICIES': {},
+    # Routers which pick the Mongo alias of an entry, as dotted paths to classes
+    # with `db_for_write()` and `db_for_read()` methods, like django's
+    # DATABASE_ROUTERS. The first alias returned is used, defaulting to DB_ALIAS.
+    'ROUTERS': [],
+    # Alias in CACHES used for the admin dashboard statistics, or None to disable.
+    'DASHBOARD_CACHE': 'default',
+    # Seconds the admin dashboard statistics are cached.
+    'DASHBOARD_CACHE_TIMEOUT': 60,
+    # Maximum number of read events stored in one bucket, for models
+    # with a policy which sets 'bucket_reads'.
+    'READ_BUCKET_SIZE': 1000,
+    # Username bulk operations on audited models are attributed to outside of
+    # an `audit.actor()` block or for anonymous requests, or None to not log them.
+    'AUDIT_ACTOR': 'system',
+}
+
+
+class TimberjackSettings(object):
+    """
+    Lazy access to timberjack settings. Any setting can be overridden in
+    the django settings module by prefixing its name with `TIMBERJACK_`.
+    """
+    prefix = 'TIMBERJACK_'
+
+    def __getattr__(self, name):
+        if name not in DEFAULTS:
+            raise AttributeError('Invalid timberjack setting: %r' % name)
+        return getattr(django_settings, self.prefix + name, DEFAULTS[name])
+
+
+settings = TimberjackSettings()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import threading
+
+from django.conf import settings as django_settings
+from mongoengine import connection
+from pymongo import read_preferences
+
+from timberjack.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Aliases whose clients are discarded after a fork.
+_registered = set()
+# Aliases registered from MONGO_CONNECTIONS by timberjack itself.
+_created = set()
+_after_fork_callbacks = []
+_pid = os.getpid()
+
+READ_PREFERENCE_MODES = {
+    'primary': read_preferences.Primary,
+    'primaryPreferred': read_preferences.PrimaryPreferred,
+    'secondary': read_preferences.Secondary,
+    'secondaryPreferred': read_preferences.SecondaryPreferred,
+    'nearest': read_preferences.Nearest,
+}
+
+
+def register_after_fork(callback):
+    """
+    Register a callable which is called in a child process after a fork,
+    once the inherited Mongo clients have been discarded. Used to reset
+    per-process state such as cached collections and background threads.
+    """
+    if callback not in _after_fork_callbacks:
+        _after_fork_callbacks.append(callback)
+    return callback
+
+
+def register(alias=None):
+    """
+    Register the connection settings for `alias` with mongoengine, using the
+    timberjack `CONNECTION_OPTIONS` and, for aliases which aren't registered
+    yet, the `MONGO_CONNECTIONS` setting. The client isn't connected before it
+    is first used, so registering before a preforking server forks its workers
+    is safe. Aliases registered by the project keep their settings, and their
+    clients are never disconnected.
+    """
+    alias = alias or settings.DB_ALIAS
+
+    with _lock:
+        if alias in connection._connection_settings and alias not in _created:
+            if alias in connection._connections:
+                # The project is using this client already; leave it alone.
+                logger.debug('Mongo alias %r is connected already; not registering it.', alias)
+                _registered.add(alias)
+                return
+            kwargs = dict(connection._connection_settings[alias], **settings.CONNECTION_OPTIONS)
+            kwargs.setdefault('connect', False)
+        else:
+            # A client created from our own settings belongs to this
+            # process only and can be replaced.
+            if alias in _created:
+                connection.disconnect(alias)
+            options = getattr(django_settings, 'MONGO_CONNECTIONS', {}).get(alias, {})
+            kwargs = dict((key.lower(), value) for key, value in options.items())
+            kwargs.setdefault('tz_aware', django_settings.USE_TZ)
+            kwargs.update(settings.CONNECTION_OPTIONS)
+            kwargs.setdefault('connect', False)
+            _created.add(alias)
+        connection.register_connection(alias, **kwargs)
+        _registered.add(alias)
+
+
+def get_read_options(path):
+    """
+    Return a `(read_preference, alias)` tuple for the read `path`, as
+    configured in the `READ_PREFERENCES` setting. Both may be None.
+    """
+    options = settings.READ_PREFERENCES.get(path)
+    if not options:
+        return None, None
+    if not isinstance(options, dict):
+        options = {'mode': options}
+
+    mode = options.get('mode')
+    if mode is None:
+        return None, options.get('alias')
+    if mode not in READ_PREFERENCE_MODES:
+        raise ValueError('Invalid read preference mode %r for %r.' % (mode, path))
+
+    kwargs = {}
+    if mode != 'primary':
+        if options.get('tag_sets') is not None:
+            kwargs['tag_sets'] = options['tag_sets']
+        if options.get('max_staleness') is not None:
+            kwargs['max_staleness'] = options['max_staleness']
+    return READ_PREFERENCE_MODES[mode](**kwargs), options.get('alias')
+
+
+def get_read_aliases():
+    """
+    Return the Mongo aliases configured for any read path.
+    """
+    return {options['alias'] for options in settings.READ_PREFERENCES.values()
+            if isinstance(options, dict) and options.get('alias')}
+
+
+def check_fork():
+    """
+    Discard clients inherited from a parent process. This is a fallback for
+    platforms where `os.register_at_fork()` is unavailable, and cheap enough
+    to be called before every collection lookup.
+    """
+    if os.getpid() != _pid:
+        _after_fork()
+
+
+def _after_fork():
+    global _lock, _pid
+    if os.getpid() == _pid:
+        return
+    # Another thread of the parent may have held the lock during the
+    # fork, so it is replaced instead of acquired.
+    _lock = threading.Lock()
+    _pid = os.getpid()
+    for alias in list(_registered):
+        # Never close the inherited clients; their sockets are shared with the parent.
+        connection._connections.pop(alias, None)
+        connection._dbs.pop(alias, None)
+
+    for callback in _after_fork_callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception('Error in timberjack after fork callback %r.', callback)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from django.utils.translation import ugettext_lazy as _
+
+# Action flags. Create, update and delete are equal to the
+# `django.contrib.admin.models` ADDITION, CHANGE and DELETION flags.
+CREATE_ACTION = 1
+UPDATE_ACTION = 2
+DELETE_ACTION = 3
+READ_ACTION = 4
+
+ACTIONS = (
+    (CREATE_ACTION, _('Created')),
+    (UPDATE_ACTION, _('Updated')),
+    (DELETE_ACTION, _('Deleted')),
+    (READ_ACTION, _('Read'))
+)
+
+ACTION_NAMES = {
+    'create': CREATE_ACTION,
+    'update': UPDATE_ACTION,
+    'delete': DELETE_ACTION,
+    'read': READ_ACTION,
+}
+
+LOG_LEVEL = (
+    (0, _('NOTSET')),
+    (10, _('DEBUG')),
+    (20, _('INFO')),
+    (30, _('WARNING')),
+    (40, _('ERROR')),
+    (50, _('CRITICAL'))
+)
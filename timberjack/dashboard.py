@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from timberjack.buckets import ReadBucket, get_events_pipeline
+from timberjack.conf import settings
+from timberjack.documents import ObjectAccessLog, get_username_path
+
+# Number of rows in the per user and per object rankings.
+TOP_LIMIT = 10
+
+
+def get_total(queryset):
+    """
+    Return the number of entries in the collection from its metadata,
+    without scanning the collection or an index. Reads stored in buckets
+    are added up from the bucket counts.
+    """
+    collection = queryset._collection
+    if hasattr(collection, 'estimated_document_count'):
+        total = collection.estimated_document_count()
+    else:
+        total = collection.count()
+    buckets = ReadBucket.get_collection(queryset._alias, queryset._read_preference)
+    for row in buckets.aggregate([{'$group': {'_id': None, 'count': {'$sum': '$count'}}}]):
+        total += row['count']
+    return total
+
+
+def get_match(start, username=None, content_type=None):
+    # Every combination is served by one of the timestamp compound indexes.
+    match = {'timestamp': {'$gte': start}}
+    if username:
+        match[get_username_path()] = username
+    if content_type is not None:
+        match['content_type.pk'] = content_type.pk
+    return match
+
+
+def _aggregate(queryset, match, *pipeline):
+    return list(queryset.aggregate({'$match': match}, *pipeline))
+
+
+def _aggregate_events(queryset, match, *pipeline):
+    """
+    Run `pipeline` on the read events stored in buckets, unwound into entries.
+    """
+    events_pipeline = get_events_pipeline(match)
+    if events_pipeline is None:
+        return []
+    buckets = ReadBucket.get_collection(queryset._alias, queryset._read_preference)
+    return list(buckets.aggregate(events_pipeline + list(pipeline), allowDiskUse=True))
+
+
+# Entries, and the reads stored in buckets, are aggregated separately.
+SOURCES = (_aggregate, _aggregate_events)
+
+
+def _get_key(value):
+    return tuple(sorted(value.items())) if isinstance(value, dict) else value
+
+
+def _add_counts(counts, rows):
+    for row in rows:
+        key = _get_key(row['_id'])
+        counts[key] = counts.get(key, 0) + row['count']
+    return counts
+
+
+def _count(queryset, match, group):
+    counts = {}
+    for aggregate in SOURCES:
+        _add_counts(counts, aggregate(queryset, match, {'$group': {'_id': group, 'count': {'$sum': 1}}}))
+    return counts
+
+
+def _rank(queryset, match, group, get_keys_match, limit):
+    """
+    Return the `limit` keys of `group` with the most entries as (key, count)
+    pairs. The candidates are the top keys of either source; their counts are
+    completed from the source which didn't rank them.
+    """
+    pipeline = ({'$group': {'_id': group, 'count': {'$sum': 1}}}, {'$sort': {'count': -1}}, {'$limit': limit})
+    ranked = [aggregate(queryset, match, *pipeline) for aggregate in SOURCES]
+    counts = {}
+    for rows in ranked:
+        _add_counts(counts, rows)
+    for aggregate, rows in zip(SOURCES, ranked):
+        missing = set(counts) - set(_get_key(row['_id']) for row in rows)
+        if missing and len(rows) == limit:
+            _add_counts(counts, aggregate(queryset, dict(match, **get_keys_match(missing)), pipeline[0]))
+    return sorted(counts.items(), key=lambda item: -item[1])[:limit]
+
+
+def count_by_action(queryset, match):
+    return sorted(_count(queryset, match, '$action_flag').items())
+
+
+def count_by_user(queryset, match, limit=TOP_LIMIT):
+    path = get_username_path()
+    return _rank(queryset, match, '$' + path, lambda usernames: {path: {'$in': list(usernames)}}, limit)
+
+
+def count_by_model(queryset, match):
+    return sorted(_count(queryset, match, '$content_type.pk').items(), key=lambda item: -item[1])
+
+
+def count_by_hour(queryset, match):
+    return sorted(_count(queryset, match, {'$dateToString': {'format': '%Y-%m-%d %H:00', 'date': '$timestamp'}})
+                  .items())
+
+
+def _get_objects_match(keys):
+    return {'$or': [{'content_type.pk': dict(key)['content_type'], 'object_pk': dict(key)['object_pk']}
+                    for key in keys]}
+
+
+def top_objects(queryset, match, limit=TOP_LIMIT):
+    group = {'content_type': '$content_type.pk', 'object_pk': '$object_pk'}
+    objects = _rank(queryset, match, group, _get_objects_match, limit)
+    # Look up the latest representation of the top objects only.
+    latest = {}
+    if objects:
+        pipeline = ({'$sort': {'timestamp': 1}},
+                    {'$group': {'_id': group, 'object_repr': {'$last': '$object_repr'},
+                                'timestamp': {'$last': '$timestamp'}}})
+        for aggregate in SOURCES:
+            for row in aggregate(queryset, dict(match, **_get_objects_match(key for key, count in objects)),
+                                 *pipeline):
+                key = _get_key(row['_id'])
+                if key not in latest or latest[key]['timestamp'] < row['timestamp']:
+                    latest[key] = row
+    return [(dict(key)['content_type'], dict(key)['object_pk'], latest[key]['object_repr'], count)
+            for key, count in objects]
+
+
+def get_cache_key(alias, days, username, content_type):
+    key = ':'.join(force_text(value) for value in (
+        alias, days, username or '', content_type.pk if content_type is not None else ''))
+    return 'timberjack:dashboard:%s' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def get_stats(queryset, days=1, username=None, content_type=None):
+    """
+    Return the dashboard statistics for the entries of the last `days` days,
+    optionally limited to a username and content type. Results are cached for
+    `DASHBOARD_CACHE_TIMEOUT` seconds. Content types are returned as pks.
+    """
+    cache = caches[settings.DASHBOARD_CACHE] if settings.DASHBOARD_CACHE else None
+    cache_key = get_cache_key(queryset._alias, days, username, content_type)
+    stats = cache.get(cache_key) if cache is not None else None
+    if stats is None:
+        start = timezone.now() - timedelta(days=days)
+        match = get_match(start, username, content_type)
+        stats = {
+            'total': get_total(queryset),
+            'start': start,
+            'by_action': count_by_action(queryset, match),
+            'by_user': count_by_user(queryset, match),
+            'by_model': count_by_model(queryset, match),
+            'by_hour': count_by_hour(queryset, match),
+            'top_objects': top_objects(queryset, match),
+        }
+        if cache is not None:
+            cache.set(cache_key, stats, settings.DASHBOARD_CACHE_TIMEOUT)
+    return stats
+
+
+def get_queryset(request=None):
+    """
+    Return the queryset the dashboard aggregates, routed for `request` and
+    using the 'aggregation' read preference.
+    """
+    return ObjectAccessLog.objects.route(None, request=request).for_read('aggregation')
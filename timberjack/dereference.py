@@ -2,7 +2,6 @@
 
 import json
 from django.db.models import Model
-from django.core import serializers
 
 from mongoengine.dereference import DeReference
 
@@ -14,6 +13,7 @@ class DjangoModelDereference(DeReference):
     def __call__(self, items, max_depth=1, instance=None, name=None):
         self.max_depth = max_depth
         if isinstance(items, Model):
+            from django.core import serializers
             serialized = serializers.serialize('json', [items])
             serialized = json.loads(serialized[1:-1])
 
@@ -1,77 +1,695 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import json
 import logging
+import warnings
+from concurrent.futures import TimeoutError
 
-from django.contrib.admin.models import ADDITION, CHANGE, DELETION, LogEntry
-from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db.models import Model
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.encoding import smart_text, force_text
 from django.utils.text import get_text_list
-from django.utils.translation import ugettext, ugettext_lazy as _
+from django.utils.translation import get_language, ugettext
 
+from bson import DBRef, ObjectId
 from mongoengine import *
+from mongoengine import signals
 from mongoengine.queryset import QuerySet
+from pymongo.errors import PyMongoError
 
-from timberjack.fields import ModelField
+from timberjack import connection, policy, routers, spool
+from timberjack.conf import settings
+from timberjack.constants import ACTIONS, CREATE_ACTION, DELETE_ACTION, LOG_LEVEL, READ_ACTION, UPDATE_ACTION
+from timberjack.fields import CompressedStringField, ModelField
+from timberjack.utils import LRUCache, get_routing_key, pack_ip_address, pack_ip_network
 from timberjack.validators import validate_ip_address
 
-LOG_LEVEL = (
-    (0, _('NOTSET')),
-    (10, _('DEBUG')),
-    (20, _('INFO')),
-    (30, _('WARNING')),
-    (40, _('ERROR')),
-    (50, _('CRITICAL'))
-)
-
 logger = logging.getLogger(__name__)
-USER_MODEL = get_user_model()
+
+# Translated message templates, keyed by language.
+_message_templates = {}
+# Rendered change messages, keyed by (message payload, language).
+_message_cache = LRUCache(maxsize=lambda: settings.MESSAGE_CACHE_SIZE)
+# Hashes of user snapshots known to be stored.
+_user_snapshot_cache = LRUCache(maxsize=lambda: settings.USER_SNAPSHOT_CACHE_SIZE)
+
+
+def get_message_templates(language=None):
+    """
+    Return the message templates translated to `language`, defaulting
+    to the active language. Templates are only translated once per language.
+    """
+    language = language or get_language()
+    templates = _message_templates.get(language)
+    if templates is None:
+        templates = _message_templates[language] = {
+            ('added', True): ugettext('Added {name} "{object}".'),
+            ('added', False): ugettext('Added.'),
+            ('changed', True): ugettext('Changed {fields} for {name} "{object}".'),
+            ('changed', False): ugettext('Changed {fields}.'),
+            ('deleted', True): ugettext('Deleted {name} "{object}".'),
+            ('deleted', False): ugettext('Deleted.'),
+            ('read', True): ugettext('Read {name} "{object}".'),
+            ('read', False): ugettext('Read.'),
+            'and': ugettext('and'),
+            'no_changes': ugettext('No fields changed.')
+        }
+    return templates
+
+
+def render_sub_messages(sub_messages):
+    """
+    Render a list of sub messages to a single translated string. Results
+    are cached per message payload and active language.
+    """
+    language = get_language()
+    key = (tuple(sub_message.payload for sub_message in sub_messages), language)
+    message = _message_cache.get(key)
+    if message is None:
+        templates = get_message_templates(language)
+        messages = [msg for msg in (sub_message.render(templates) for sub_message in sub_messages) if msg]
+        message = ' '.join(msg[0].upper() + msg[1:] for msg in messages) or templates['no_changes']
+        _message_cache.set(key, message)
+    return message
+
+
+def get_action_message(action_flag, object_repr, log_message=''):
+    """
+    Return the translated description of an action on `object_repr`.
+    """
+    if action_flag == CREATE_ACTION:
+        return ugettext('Added "%(object)s".') % {'object': object_repr}
+    elif action_flag == UPDATE_ACTION:
+        return ugettext('Changed "%(object)s - %(changes)s".') % {'object': object_repr, 'changes': log_message}
+    elif action_flag == DELETE_ACTION:
+        return ugettext('Deleted "%(object)s".') % {'object': object_repr}
+    elif action_flag == READ_ACTION:
+        return ugettext('Read "%(object)s".') % {'object': object_repr}
+    return ugettext('ObjectAccessLog Object')
+
+
+def format_human_message(username, action_message, timestamp, ip_address, context=None):
+    """
+    Format the human readable log message of an entry, followed by the
+    JSON `context` on a new line if given.
+    """
+    message = 'User "{username}" {str_action} at {timestamp}{ip_addr}.'.format(
+        username=username,
+        str_action=(action_message[0].lower() + action_message[1:]).rstrip('.'),
+        timestamp='{:%B %d, %Y %H:%M:%S}'.format(timestamp),
+        ip_addr=' from IP-address %s' % ip_address if ip_address else '')
+    if context is not None:
+        message = '{message}\n{context}'.format(message=message, context=json.dumps(context))
+    return message
+
+
+def get_content_object_db():
+    """
+    Return the database alias used for content object lookups,
+    or None to let the database routers decide.
+    """
+    return settings.READ_PREFERENCES.get('content_object')
+
+
+@receiver(setting_changed)
+def clear_message_cache(**kwargs):
+    if kwargs['setting'] in ('LANGUAGE_CODE', 'LANGUAGES', 'LOCALE_PATHS'):
+        _message_templates.clear()
+        _message_cache.clear()
+
+
+class SubMessage(EmbeddedDocument):
+    """
+    A single part of a structured change message.
+    """
+    ACTIONS = ('added', 'changed', 'deleted', 'read')
+    ACTION_ALIASES = {
+        'created': 'added',
+        'updated': 'changed'
+    }
+    ACTION_FLAGS = {
+        CREATE_ACTION: 'added',
+        UPDATE_ACTION: 'changed',
+        DELETE_ACTION: 'deleted',
+        READ_ACTION: 'read'
+    }
+
+    action = StringField(choices=ACTIONS, required=True)
+    name = StringField()
+    object = StringField()
+    fields = ListField(StringField(), default=None)
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Parse the `{action: {context}}` format used by `django.contrib.admin.models.LogEntry`
+        into a dict of the sub message fields which are set. Returns None if the
+        value isn't a recognized sub message.
+        """
+        if not isinstance(value, dict) or len(value) != 1:
+            return None
+        action, context = next(iter(value.items()))
+        action = cls.ACTION_ALIASES.get(action, action)
+        if action not in cls.ACTIONS:
+            return None
+
+        context = context or {}
+        parsed = {'action': action}
+        for key in ('name', 'object'):
+            if key in context:
+                parsed[key] = force_text(context[key])
+        if context.get('fields') is not None:
+            parsed['fields'] = [force_text(field) for field in context['fields']]
+        return parsed
+
+    @classmethod
+    def from_dict(cls, value):
+        """
+        Create a sub message from the `{action: {context}}` format used by
+        `django.contrib.admin.models.LogEntry`. Returns None if the value
+        isn't a recognized sub message.
+        """
+        parsed = cls.parse(value)
+        return cls(**parsed) if parsed is not None else None
+
+    def to_dict(self):
+        """
+        Return the sub message in the `django.contrib.admin.models.LogEntry` format.
+        """
+        context = {}
+        if self.name is not None:
+            context['name'] = self.name
+        if self.object is not None:
+            context['object'] = self.object
+        if self.fields is not None or self.action == 'changed':
+            context['fields'] = list(self.fields or [])
+        return {self.action: context}
+
+    @property
+    def payload(self):
+        """
+        Hashable representation of the sub message.
+        """
+        return self.action, self.name, self.object, tuple(self.fields or ())
+
+    def render(self, templates=None):
+        """
+        Return the sub message as a translated string.
+        """
+        templates = templates or get_message_templates()
+        template = templates.get((self.action, bool(self.name)))
+        if template is None:
+            return ''
+        return template.format(name=ugettext(self.name) if self.name else '', object=self.object,
+                               fields=get_text_list(list(self.fields or []), templates['and']))
+
+
+class UserSnapshot(Document):
+    """
+    Serialized user, stored once per distinct state of the user and
+    referenced by its content hash from the log entries.
+    """
+    id = StringField(primary_key=True)
+    snapshot = ModelField(required=True)
+    timestamp = DateTimeField(required=True, default=timezone.now)
+
+    meta = {
+        'db_alias': settings.DB_ALIAS,
+        'collection': 'user_snapshot'
+    }
+
+    @classmethod
+    def store(cls, user, using=None):
+        """
+        Store a snapshot of `user` unless an identical snapshot exists, in the
+        database of the Mongo alias `using` if given. Returns the hash of the
+        snapshot and a compact copy of the serialized user, which only includes
+        the username field. The snapshot is written within the latency budget
+        of the spooling writer of the alias; if it can't be written, None and
+        the full serialized user are returned, so the entry stays complete.
+        """
+        serialized = ModelField().to_mongo(user)
+        uncompressed = ModelField.decompress(serialized) if ModelField.COMPRESSED_KEY in serialized else serialized
+        digest = hashlib.sha1(json.dumps(uncompressed, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        key = digest if using is None else (using, digest)
+        if _user_snapshot_cache.get(key) is None:
+            queryset = cls.objects if using is None else QuerySet(cls, routers.get_collection(cls, using))
+            try:
+                spool.call(queryset(pk=digest).update_one, upsert=True, set_on_insert__snapshot=serialized,
+                           set_on_insert__timestamp=timezone.now(), alias=using)
+            except spool.CircuitOpenError:
+                return None, serialized
+            except (PyMongoError, TimeoutError) as e:
+                logger.warning('Could not store a user snapshot, embedding the user: %r', e)
+                return None, serialized
+            _user_snapshot_cache.set(key, True)
+
+        username_field = user.USERNAME_FIELD
+        compact = {
+            'model': serialized['model'],
+            'pk': serialized['pk'],
+            'fields': {username_field: serialized['fields'].get(username_field)}
+        }
+        return digest, compact
+
+
+class CollectionScanWarning(UserWarning):
+    pass
+
+
+def get_plan_stages(plan):
+    """
+    Return the set of stages in the winning plan of an explain result.
+    """
+    stages = set()
+    pending = [plan.get('queryPlanner', {}).get('winningPlan', {})]
+    while pending:
+        stage = pending.pop()
+        if 'stage' in stage:
+            stages.add(stage['stage'])
+        for key in ('inputStage', 'queryPlan'):
+            if isinstance(stage.get(key), dict):
+                pending.append(stage[key])
+        for key in ('inputStages', 'shards'):
+            pending.extend(stage.get(key) or [])
+        if isinstance(stage.get('winningPlan'), dict):
+            pending.append(stage['winningPlan'])
+    return stages
 
 
 class ObjectAccessLogQuerySet(QuerySet):
 
+    _prefetch_related = ()
+    # Mongo alias chosen with `using()`, which takes precedence over the routers.
+    _alias = None
+
+    def clone_into(self, cls):
+        cls = super(ObjectAccessLogQuerySet, self).clone_into(cls)
+        cls._prefetch_related = self._prefetch_related
+        cls._alias = self._alias
+        return cls
+
+    def using(self, alias):
+        # Reuse the collection of the alias instead of creating one per call.
+        queryset = self.clone_into(self.__class__(self._document, routers.get_collection(self._document, alias)))
+        queryset._alias = alias
+        return queryset
+
+    def route(self, content_type, **hints):
+        """
+        Use the alias picked by the `ROUTERS` for reading entries for `content_type`,
+        unless an alias was chosen with `using()`.
+        """
+        if self._alias is None:
+            alias = routers.db_for_read(content_type, **hints)
+            if alias:
+                return self.using(alias)
+        return self
+
+    def _populate_cache(self):
+        start = len(self._result_cache or [])
+        super(ObjectAccessLogQuerySet, self)._populate_cache()
+        if self._prefetch_related:
+            entries = [entry for entry in self._result_cache[start:] if isinstance(entry, self._document)]
+            for lookup in self._prefetch_related:
+                getattr(self, '_prefetch_%s' % lookup)(entries)
+
+    def _add_prefetch(self, lookup):
+        queryset = self.clone()
+        if lookup not in queryset._prefetch_related:
+            queryset._prefetch_related += (lookup,)
+        return queryset
+
+    def prefetch_content_objects(self):
+        """
+        Resolve the content objects of the entries with one query
+        per content type when the queryset is evaluated.
+        """
+        return self._add_prefetch('content_objects')
+
+    def prefetch_admin_logs(self):
+        """
+        Resolve the `admin.LogEntry` objects of the entries with a
+        single query when the queryset is evaluated.
+        """
+        return self._add_prefetch('admin_logs')
+
+    def prefetch_referrers(self):
+        """
+        Resolve the referrers of the entries with a single query
+        when the queryset is evaluated.
+        """
+        return self._add_prefetch('referrers')
+
+    def _prefetch_content_objects(self, entries):
+        grouped = {}
+        for entry in entries:
+            if entry.is_bulk_entry:
+                continue
+            grouped.setdefault(entry.content_type.pk, (entry.content_type, []))[1].append(entry)
+
+        for content_type, group in grouped.values():
+            model = content_type.model_class()
+            if model is None:
+                continue
+            pk_field = model._meta.pk
+            objects = model._base_manager.db_manager(get_content_object_db()).in_bulk({pk_field.to_python(entry.object_pk) for entry in group})
+            for entry in group:
+                entry._content_object_cache = objects.get(pk_field.to_python(entry.object_pk))
+
+    def _prefetch_admin_logs(self, entries):
+        from django.contrib.admin.models import LogEntry
+
+        entries = [entry for entry in entries if entry.admin_log_pk]
+        objects = LogEntry.objects.in_bulk({entry.admin_log_pk for entry in entries})
+        for entry in entries:
+            entry._admin_log_cache = objects.get(entry.admin_log_pk)
+
+    def _prefetch_referrers(self, entries):
+        references = {}
+        for entry in entries:
+            value = entry._data.get('referrer')
+            if isinstance(value, DBRef):
+                references.setdefault(value.id, []).append(entry)
+
+        if references:
+            # Referrers are read from the alias of the entries, without their filters.
+            queryset = self._document.objects
+            if self._alias is not None:
+                queryset = queryset.using(self._alias)
+            if self._read_preference is not None:
+                queryset = queryset.read_preference(self._read_preference)
+            for pk, referrer in queryset.in_bulk(list(references)).items():
+                for entry in references[pk]:
+                    entry._data['referrer'] = referrer
+
+    def _get_write_alias(self, content_type, user, hints=None):
+        if self._alias is not None:
+            return self._alias
+        return routers.db_for_write(content_type, user=user, **(hints or {}))
+
+    def _write_records(self, records, write_admin_log=False, using=None, bucket=False, validate=True):
+        for record in records:
+            if validate:
+                record.validate()
+            if logger.isEnabledFor(record.log_level):
+                logger.log(record.log_level, msg=record.get_human_message())
+            if write_admin_log:
+                record.admin_log_pk = record.to_document().create_admin_log()
+
+        if bucket:
+            from timberjack.buckets import ReadBucket
+
+            # Reads which can't be added to a bucket are written, or
+            # spooled, as single entries instead.
+            records = ReadBucket.add(records, using=using)
+            if not records:
+                return
+
+        collection = self._collection if using is None else routers.get_collection(self._document, using)
+        spool.write(collection, [record.to_mongo() for record in records], alias=using)
+
     def log_action(self, user, content_type, object_pk, object_repr,
-                   action_flag, message='', log_level=20, ip_address=None, write_admin_log=False):
+                   action_flag, message='', log_level=20, ip_address=None, write_admin_log=False, hints=None):
+        """
+        Write a single entry and return it as an `ObjectAccessLog` document,
+        sending `post_save`. Returns None if the audit policy of the model
+        skips the action. See `log_record()` for the other arguments.
+        """
+        record = self.log_record(user, content_type, object_pk, object_repr, action_flag, message=message,
+                                 log_level=log_level, ip_address=ip_address, write_admin_log=write_admin_log,
+                                 hints=hints)
+        if record is None:
+            return None
+        document = record.to_document()
+        signals.post_save.send(self._document, document=document, created=True)
+        return document
+
+    def log_record(self, user, content_type, object_pk, object_repr,
+                   action_flag, message='', log_level=20, ip_address=None, write_admin_log=False, hints=None):
+        """
+        Write a single entry like `log_action()`, but return it as an `AccessRecord`
+        without building a document or sending signals. Returns None if the audit
+        policy of the model skips the action. The entry is written to the alias
+        chosen with `using()`, or else the one picked by the `ROUTERS`, which
+        receive `hints`.
+        """
+        from timberjack.records import AccessRecord
+
+        bucket = False
+        if hasattr(content_type, 'model_class'):
+            model_policy = policy.get_policy(content_type)
+            if not model_policy.allows(action_flag, user):
+                return None
+            log_level = model_policy.get_level(log_level)
+            write_admin_log = model_policy.get_admin_log(write_admin_log)
+            bucket = model_policy.bucket_reads and action_flag == READ_ACTION
+
+        using = self._get_write_alias(content_type, user, hints)
+
+        change_message = None
         if isinstance(message, list):
-            message = json.dumps(message)
-        return self._document(
-            user=user,
-            content_type=content_type,
-            object_pk=object_pk,
-            object_repr=object_repr[:200],
-            action_flag=action_flag,
-            message=message,
-            log_level=log_level,
-            ip_address=ip_address
-        ).save(write_admin_log=write_admin_log)
+            change_message, message = message, ''
+
+        user_snapshot = None
+        if settings.DEDUPLICATE_USERS and isinstance(user, Model):
+            user_snapshot, user = UserSnapshot.store(user, using=using)
+
+        record = AccessRecord(user=user, content_type=content_type, object_pk=object_pk,
+                              object_repr=object_repr, action_flag=action_flag, message=message,
+                              change_message=change_message, log_level=log_level,
+                              ip_address=ip_address, user_snapshot=user_snapshot)
+        self._write_records([record], write_admin_log=write_admin_log, using=using, bucket=bucket)
+        return record
+
+    def log_actions(self, user, content_type, objects, action_flag, message=None,
+                    log_level=20, ip_address=None, single_entry=False, hints=None):
+        """
+        Log `action_flag` for each of `objects` with a single insert, and return
+        the ids of the new entries. `objects` are model instances or `(pk, repr)`
+        pairs. Each sub message in `message` is completed with the name and
+        representation of the object. If `single_entry` is True, one entry with
+        a list of all the object pks is written instead. Entries are routed
+        like those of `log_action()`.
+        """
+        from timberjack.records import AccessRecord, serialize_model
+
+        model_policy = policy.get_policy(content_type)
+        if not model_policy.allows(action_flag, user):
+            return []
+        log_level = model_policy.get_level(log_level)
+
+        objects = [(obj.pk, force_text(obj)) if isinstance(obj, Model) else obj for obj in objects]
+        if not objects:
+            return []
+
+        model = content_type.model_class()
+        name = force_text(model._meta.verbose_name) if model else content_type.model
+        if single_entry:
+            name = force_text(model._meta.verbose_name_plural) if model else name
+            objects = [([pk for pk, _ in objects], '%d %s' % (len(objects), name))]
+        if message is None:
+            message = [{SubMessage.ACTION_FLAGS[action_flag]: {}}]
+        message = [next(iter(sub_message.items())) for sub_message in message
+                   if isinstance(sub_message, dict) and len(sub_message) == 1]
+
+        using = self._get_write_alias(content_type, user, hints)
+
+        # Serialize the user and content type once for all entries.
+        user_snapshot = None
+        if settings.DEDUPLICATE_USERS and isinstance(user, Model):
+            user_snapshot, user = UserSnapshot.store(user, using=using)
+        user, content_type = serialize_model(user), serialize_model(content_type)
+
+        records = []
+        for object_pk, object_repr in objects:
+            change_message = [{action: dict({'name': name, 'object': object_repr}, **(context or {}))}
+                              for action, context in message]
+            records.append(AccessRecord(user=user, content_type=content_type, object_pk=object_pk,
+                                        object_repr=object_repr, action_flag=action_flag,
+                                        change_message=change_message, log_level=log_level,
+                                        ip_address=ip_address, user_snapshot=user_snapshot))
+        self._write_records(records, using=using,
+                            bucket=model_policy.bucket_reads and action_flag == READ_ACTION and not single_entry)
+        return [record.id for record in records]
+
+    def with_read_buckets(self):
+        """
+        Return the entries merged with the matching read events stored in
+        buckets, newest first, as a `BucketedEntries` object. `history()`
+        and `for_object()` do so for models which bucket reads; other
+        helpers, such as `for_model()`, `for_user()` or `between()`, only
+        return entries unless this is called.
+        """
+        from timberjack.buckets import BucketedEntries
+        return BucketedEntries(self)
+
+    def for_read(self, path):
+        """
+        Apply the read preference and database alias configured for the
+        read `path` in the `READ_PREFERENCES` setting, such as 'history',
+        'export' or 'aggregation'. An alias chosen with `using()` or
+        `route()` takes precedence over the alias of the read path.
+        """
+        read_preference, alias = connection.get_read_options(path)
+        queryset = self
+        if alias and self._alias is None:
+            queryset = queryset.using(alias)
+        if read_preference is not None:
+            queryset = queryset.read_preference(read_preference)
+        return queryset
+
+    def aggregate(self, *pipeline, **kwargs):
+        # Make aggregations respect the read preference of the queryset.
+        if self._read_preference is None:
+            return super(ObjectAccessLogQuerySet, self).aggregate(*pipeline, **kwargs)
+        queryset = self.clone()
+        queryset._collection_obj = self._collection.with_options(read_preference=self._read_preference)
+        return super(ObjectAccessLogQuerySet, queryset).aggregate(*pipeline, **kwargs)
+
+    def history(self, content_type, object_pk):
+        """
+        Filter entries for a single object. Includes the shard key when
+        sharding is enabled, so the query is routed to a single shard.
+        Returns `with_read_buckets()` if the policy of the model sets
+        'bucket_reads', so bucketed reads are included.
+        """
+        queryset = self.route(content_type).filter(content_type__pk=content_type.pk, object_pk=object_pk)
+        if settings.SHARDING:
+            queryset = queryset.filter(routing_key=get_routing_key(content_type.pk, object_pk))
+        if policy.get_policy(content_type).bucket_reads:
+            return queryset.with_read_buckets()
+        return queryset
+
+    def in_network(self, network):
+        """
+        Filter entries with an IP address within `network`, given
+        in CIDR notation. Works for both IPv4 and IPv6 networks.
+        """
+        first, last = pack_ip_network(network)
+        return self.filter(ip_address_packed__gte=first, ip_address_packed__lte=last)
+
+    def changed_fields(self, *fields):
+        """
+        Filter update entries which changed any of the given field names.
+        """
+        return self.filter(action_flag=self._document.UPDATE_ACTION,
+                           change_message__fields__in=fields)
+
+    def for_object(self, obj):
+        """
+        Filter entries for the model instance `obj`, newest first. See
+        `history()`.
+        """
+        from django.contrib.contenttypes.models import ContentType
+
+        content_type = ContentType.objects.get_for_model(obj, for_concrete_model=False)
+        return self.history(content_type, obj.pk).order_by('-timestamp')
+
+    def for_model(self, *models):
+        """
+        Filter entries for any of the given model classes or
+        content types, newest first.
+        """
+        from django.contrib.contenttypes.models import ContentType
+
+        content_types = [model if isinstance(model, ContentType)
+                         else ContentType.objects.get_for_model(model, for_concrete_model=False)
+                         for model in models]
+        pks = [content_type.pk for content_type in content_types]
+        if len(pks) == 1:
+            queryset = self.route(content_types[0]).filter(content_type__pk=pks[0])
+        else:
+            queryset = self.route(None, content_types=content_types).filter(content_type__pk__in=pks)
+        return queryset.order_by('-timestamp')
+
+    def for_user(self, user):
+        """
+        Filter entries by `user`, newest first. Takes either a user
+        instance or a username.
+        """
+        if isinstance(user, Model):
+            queryset = self.route(None, user=user).filter(user__pk=user.pk)
+        else:
+            from django.contrib.auth import get_user_model
+            queryset = self.route(None, username=user).filter(
+                **{'user__fields__%s' % get_user_model().USERNAME_FIELD: user})
+        return queryset.order_by('-timestamp')
+
+    def between(self, start=None, end=None):
+        """
+        Filter entries logged from `start` up to, but not including, `end`.
+        """
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(timestamp__gte=start)
+        if end is not None:
+            queryset = queryset.filter(timestamp__lt=end)
+        return queryset.order_by('-timestamp')
+
+    def actions(self, *flags):
+        """
+        Filter entries with any of the given action flags.
+        """
+        if len(flags) == 1:
+            return self.filter(action_flag=flags[0])
+        return self.filter(action_flag__in=flags)
+
+    def explain(self, format=False):
+        """
+        Return the query plan, warning with a `CollectionScanWarning`
+        if the query isn't served by an index.
+        """
+        plan = super(ObjectAccessLogQuerySet, self).explain(format=format)
+        if isinstance(plan, dict) and 'COLLSCAN' in get_plan_stages(plan):
+            warnings.warn('Query %r on %r does a collection scan.' % (self._query, self._document._get_collection_name()),
+                          CollectionScanWarning, stacklevel=2)
+        return plan
+
+    def is_indexed(self):
+        """
+        Return True if the query is served by an index.
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', CollectionScanWarning)
+            return 'COLLSCAN' not in get_plan_stages(self.explain())
+
+
+# Replaced by the path of the `USERNAME_FIELD` in `update_username_index()`.
+USERNAME_INDEX_PATH = 'user.fields.username'
 
 
 class ObjectAccessLog(Document):
     """
     Store log entries.
     """
-    CREATE_ACTION = ADDITION
-    UPDATE_ACTION = CHANGE
-    DELETE_ACTION = DELETION
-    READ_ACTION = 4
-    ACTIONS = (
-        (CREATE_ACTION, _('Created')),
-        (UPDATE_ACTION, _('Updated')),
-        (DELETE_ACTION, _('Deleted')),
-        (READ_ACTION, _('Read'))
-    )
+    CREATE_ACTION = CREATE_ACTION
+    UPDATE_ACTION = UPDATE_ACTION
+    DELETE_ACTION = DELETE_ACTION
+    READ_ACTION = READ_ACTION
+    ACTIONS = ACTIONS
 
     meta = {
+        'db_alias': settings.DB_ALIAS,
         'queryset_class': ObjectAccessLogQuerySet,
+        'shard_key': ('routing_key', 'timestamp') if settings.SHARDING else (),
         'indexes': [
-            '*user.pk',
-            '*user.fields.username',
-            '*content_type.pk',
+            ('content_type.pk', 'object_pk', '-timestamp'),
+            ('content_type.pk', '-timestamp'),
+            ('user.pk', '-timestamp'),
+            (USERNAME_INDEX_PATH, '-timestamp'),
+            '-timestamp',
+            'change_message.fields',
+            ('ip_address_packed', '-timestamp'),
         ]
     }
 
-    message = StringField(default='')
+    message = CompressedStringField(default='')
+    # Kept uncompressed, as `changed_fields()` queries the changed field names.
+    change_message = ListField(EmbeddedDocumentField(SubMessage), default=None)
     action_flag = IntField(min_value=1, max_value=4, choices=ACTIONS, required=True)
     log_level = IntField(choices=LOG_LEVEL, default=20)
     object_pk = DynamicField(required=True)
@@ -79,27 +697,24 @@ class ObjectAccessLog(Document):
     object_repr = StringField(max_length=200, required=True)
     user = ModelField(required=True)
     ip_address = StringField(validation=validate_ip_address)
+    ip_address_packed = BinaryField(max_bytes=16)
     admin_log_pk = IntField(default=None)
     referrer = ReferenceField('self', default=None)
+    routing_key = LongField()
+    user_snapshot = StringField()
     timestamp = DateTimeField(required=True, default=timezone.now)
 
     def __repr__(self):
         return smart_text(self.timestamp)
 
+    @classmethod
+    def _get_collection(cls):
+        connection.check_fork()
+        return super(ObjectAccessLog, cls)._get_collection()
+
     def __str__(self):
-        if self.is_create_action:
-            return ugettext('Added "%(object)s".') % {'object': self.object_repr}
-        elif self.is_update_action:
-            return ugettext('Changed "%(object)s - %(changes)s".') % {
-                'object': self.object_repr,
-                'changes': self.get_log_message()
-            }
-        elif self.is_delete_action:
-            return ugettext('Deleted "%(object)s".') % {'object': self.object_repr}
-        elif self.is_read_action:
-            return ugettext('Read "%(object)s".') % {'object': self.object_repr}
-
-        return ugettext('ObjectAccessLog Object')
+        return get_action_message(self.action_flag, self.object_repr,
+                                  self.get_log_message() if self.is_update_action else '')
 
     @property
     def is_create_action(self):
@@ -121,6 +736,14 @@ class ObjectAccessLog(Document):
     def is_json_message(self):
         return self.message and self.message[0] == '['
 
+    @property
+    def has_change_message(self):
+        return bool(self.change_message) or bool(self.is_json_message)
+
+    @property
+    def is_bulk_entry(self):
+        return isinstance(self.object_pk, list)
+
     def get_human_message(self, include_fullname=False, include_context=False):
         """
         Get a human readable log message.
@@ -131,80 +754,76 @@ class ObjectAccessLog(Document):
                                 the context will be separated from the string message by a
                                 new line character(\n).
         """
+        action_message = self.get_log_message() if self.has_change_message else str(self)
+        username = self.user.get_username()
+        if include_fullname and self.user.get_full_name():
+            username = '{username} ({fullname})'.format(username=username, fullname=self.user.get_full_name())
+        return format_human_message(username, action_message, self.timestamp, self.ip_address,
+                                    self.get_context() if include_context else None)
+
+    def get_context(self):
+        """
+        Return a machine readable, JSON serializable context for the entry.
+        """
+        referrer = self._data.get('referrer')
+        return {
+            'pk': str(self.pk),
+            'action_flag': self.action_flag,
+            'content_type': '{app_label}.{model}'.format(app_label=self.content_type.app_label,
+                                                         model=self.content_type.model),
+            'user_pk': self.user.pk,
+            'object_pk': self.object_pk,
+            'timestamp': str(self.timestamp),
+            'ip_address': self.ip_address,
+            'referrer': str(getattr(referrer, 'id', referrer)) if referrer else None,
+        }
+
+    def get_sub_messages(self):
+        """
+        Return the change message as a list of `SubMessage` instances. Legacy
+        entries which stored the change message as a JSON string in `message`
+        are parsed on the fly. Raises ValueError for malformed legacy messages.
+        """
+        if self.change_message:
+            return list(self.change_message)
         if self.is_json_message:
-            _log_message = self.get_log_message()
-            parsed_message = _log_message[0].lower() + _log_message[1:]
-        else:
-            parsed_message = str(self)[0].lower() + str(self)[1:]
-
-        message = 'User "{username}" {str_action} at {timestamp}{ip_addr}.'.format(
-            username=''.join((self.user.get_username(), ' ({fullname})'.format(fullname=self.user.get_full_name())
-                              if include_fullname and self.user.get_full_name() else '')),
-            str_action=parsed_message.rstrip('.'),
-            timestamp='{:%B %d, %Y %H:%M:%S}'.format(self.timestamp),
-            ip_addr=' from IP-address %s' % self.ip_address if self.ip_address else '')
-        if include_context:
-            message = '{message}\n{context}'.format(
-                message=message,
-                context=json.dumps({
-                    'pk': str(self.pk),
-                    'action_flag': self.action_flag,
-                    'content_type': '{app_label}.{model}'.format(app_label=self.content_type.app_label,
-                                                                 model=self.content_type.model),
-                    'user_pk': self.user.pk,
-                    'object_pk': self.object_pk,
-                    'timestamp': str(self.timestamp),
-                    'ip_address': self.ip_address,
-                    'referrer': str(self.referrer.pk) if self.referrer else None,
-                }))
-        return message
+            return [sub_message for sub_message in map(SubMessage.from_dict, json.loads(self.message))
+                    if sub_message]
+        return []
 
     def get_log_message(self):
         """
-        (Copied from `django.contrib.admin.models.LogEntry.get_change_message()`)
-        If self.message is a JSON structure, interpret it as a change string, properly translated.
+        (Adapted from `django.contrib.admin.models.LogEntry.get_change_message()`)
+        If the entry has a structured change message, interpret it as a change string,
+        properly translated.
         """
-        if self.is_json_message:
+        if not self.has_change_message:
+            return self.message
+        try:
+            sub_messages = self.get_sub_messages()
+        except ValueError:
+            return self.message
+
+        return render_sub_messages(sub_messages)
+
+    def get_raw_message(self):
+        """
+        Return the change message in the JSON string format used by
+        `django.contrib.admin.models.LogEntry`.
+        """
+        if self.change_message:
+            return json.dumps([sub_message.to_dict() for sub_message in self.change_message])
+        return self.message
+
+    def clean(self):
+        if (settings.SHARDING and self.routing_key is None and self.content_type and
+                self.object_pk is not None and not self.is_bulk_entry):
+            self.routing_key = get_routing_key(self.content_type.pk, self.object_pk)
+        if self.ip_address and not self.ip_address_packed:
             try:
-                message = json.loads(self.message)
+                self.ip_address_packed = pack_ip_address(self.ip_address)
             except ValueError:
-                return self.message
-            messages = []
-            for sub_message in message:
-                if 'added' in sub_message:
-                    if sub_message['added']:
-                        sub_message['added']['name'] = ugettext(sub_message['added']['name'])
-                        messages.append(ugettext('Added {name} "{object}".').format(**sub_message['added']))
-                    else:
-                        messages.append(ugettext('Added.'))
-
-                elif 'changed' in sub_message:
-                    sub_message['changed']['fields'] = get_text_list(
-                        sub_message['changed']['fields'], ugettext('and')
-                    )
-                    if 'name' in sub_message['changed']:
-                        sub_message['changed']['name'] = ugettext(sub_message['changed']['name'])
-                        messages.append(ugettext('Changed {fields} for {name} "{object}".').format(
-                            **sub_message['changed']
-                        ))
-                    else:
-                        messages.append(ugettext('Changed {fields}.').format(**sub_message['changed']))
-
-                elif 'deleted' in sub_message:
-                    sub_message['deleted']['name'] = ugettext(sub_message['deleted']['name'])
-                    messages.append(ugettext('Deleted {name} "{object}".').format(**sub_message['deleted']))
-
-                elif 'read' in sub_message:
-                    if sub_message['read']:
-                        sub_message['read']['name'] = ugettext(sub_message['read']['name'])
-                        messages.append(ugettext('Read {name} "{object}".').format(**sub_message['read']))
-                    else:
-                        messages.append(ugettext('Read.'))
-
-            message = ' '.join(msg[0].upper() + msg[1:] for msg in messages)
-            return message or ugettext('No fields changed.')
-        else:
-            return self.message
+                pass  # Reported by the `ip_address` field validation.
 
     def get_admin_log_object(self):
         """
@@ -213,26 +832,122 @@ class ObjectAccessLog(Document):
         """
         if not self.admin_log_pk:
             return None
+        if hasattr(self, '_admin_log_cache'):
+            return self._admin_log_cache
+
+        from django.contrib.admin.models import LogEntry
         try:
             return LogEntry.objects.get(pk=self.admin_log_pk)
         except LogEntry.DoesNotExist:
             return None
 
     def get_content_object(self):
-        return self.content_type.get_object_for_this_type(pk=self.object_pk)
+        if self.is_bulk_entry:
+            raise ValueError('Bulk entries refer to several objects, use get_content_objects().')
+        if hasattr(self, '_content_object_cache'):
+            if self._content_object_cache is None:
+                model = self.content_type.model_class()
+                raise model.DoesNotExist('%s matching query does not exist.' % model._meta.object_name)
+            return self._content_object_cache
+        return self.content_type.model_class()._base_manager.db_manager(
+            get_content_object_db()).get(pk=self.object_pk)
+
+    def get_content_objects(self):
+        """
+        Return a queryset of the content objects of the entry.
+        """
+        object_pks = self.object_pk if self.is_bulk_entry else [self.object_pk]
+        return self.content_type.model_class()._base_manager.db_manager(
+            get_content_object_db()).filter(pk__in=object_pks)
+
+    def get_user_snapshot(self, using=None):
+        """
+        Return the user as it was when the entry was written. Entries written
+        without deduplicated user snapshots embed the full user. Pass the Mongo
+        alias of the entry as `using` if it was routed to another database.
+        """
+        if not self.user_snapshot:
+            return self.user
+        queryset = UserSnapshot.objects if using is None else QuerySet(UserSnapshot, routers.get_collection(
+            UserSnapshot, using))
+        snapshot = queryset.with_id(self.user_snapshot)
+        return snapshot.snapshot if snapshot else self.user
 
     def save(self, *args, **kwargs):
+        """
+        Save the entry. New entries are inserted like those of `log_action()`,
+        to the alias picked by the `ROUTERS` through the spooling writer within
+        the latency budget. Updates of stored entries, and saves with mongoengine
+        options, write directly to the database of the document.
+        """
+        write_admin_log = kwargs.pop('write_admin_log', False)
+        alias = None
+        if self._created and not args and not kwargs:
+            alias = routers.db_for_write(self.content_type, user=self._data.get('user'))
+        if settings.DEDUPLICATE_USERS and isinstance(self._data.get('user'), Model):
+            self.user_snapshot, self.user = UserSnapshot.store(self._data['user'], using=alias)
+
         logger.log(self.log_level, msg=self.get_human_message(include_context=True))
-        if kwargs.get('write_admin_log', False) is True:
-            if self.is_read_action:
-                logger.debug('Read actions are not written to the `admin.LogEntry` table due '
-                             'to missing support for read actions.')
-            else:
-                self.admin_log_pk = LogEntry.objects.create(user_id=self.user.pk, content_type_id=self.content_type.pk,
-                                                            object_id=self.object_pk,
-                                                            object_repr=force_text(
-                                                                self.content_type.get_object_for_this_type(
-                                                                    pk=self.object_pk))[:200],
-                                                            action_flag=self.action_flag,
-                                                            change_message=self.message).pk
-        return super(ObjectAccessLog, self).save(*args, **kwargs)
+        if write_admin_log is True:
+            self.admin_log_pk = self.create_admin_log()
+        if not self._created or args or kwargs:
+            return super(ObjectAccessLog, self).save(*args, **kwargs)
+
+        signals.pre_save.send(self.__class__, document=self)
+        self.validate()
+        doc = self.to_mongo()
+        if '_id' not in doc:
+            # Spooled copies are replayed by id.
+            doc['_id'] = ObjectId()
+        signals.pre_save_post_validation.send(self.__class__, document=self, created=True)
+        collection = self._get_collection() if alias is None else routers.get_collection(self.__class__, alias)
+        spool.write(collection, [doc], alias=alias)
+        self.id = doc['_id']
+        signals.post_save.send(self.__class__, document=self, created=True)
+        self._clear_changed_fields()
+        self._created = False
+        return self
+
+    def create_admin_log(self):
+        """
+        Write a matching `admin.LogEntry` and return its pk, or None for
+        read actions, which `admin.LogEntry` doesn't support.
+        """
+        from django.contrib.admin.models import LogEntry
+
+        if self.is_read_action:
+            logger.debug('Read actions are not written to the `admin.LogEntry` table due '
+                         'to missing support for read actions.')
+            return None
+        return LogEntry.objects.create(user_id=self.user.pk, content_type_id=self.content_type.pk,
+                                       object_id=self.object_pk,
+                                       object_repr=force_text(
+                                           self.content_type.get_object_for_this_type(pk=self.object_pk))[:200],
+                                       action_flag=self.action_flag,
+                                       change_message=self.get_raw_message()).pk
+
+
+def get_username_path():
+    """
+    Return the path of the username in the stored user fields.
+    """
+    from django.contrib.auth import get_user_model
+    return 'user.fields.%s' % get_user_model().USERNAME_FIELD
+
+
+def update_username_index():
+    """
+    Index the `USERNAME_FIELD` of the user model instead of 'username',
+    which is declared as the user model isn't known at import time.
+    Called once the app registry is ready.
+    """
+    path = get_username_path()
+    for spec in ObjectAccessLog._meta['index_specs']:
+        spec['fields'] = [(path if key == USERNAME_INDEX_PATH else key, direction)
+                          for key, direction in spec['fields']]
+
+
+@connection.register_after_fork
+def reset_collections():
+    ObjectAccessLog._collection = None
+    UserSnapshot._collection = None
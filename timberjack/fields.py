@@ -1,20 +1,16 @@
 # -*- coding: utf-8 -*-
 
-import re
 import json
 import operator
 from functools import reduce
 
-from django.core import serializers
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
-from django.contrib.contenttypes.models import ContentType
-from django.core.serializers.base import DeserializationError
 from django.db.models import Model
-from django.utils import six
 from django.utils.translation import ugettext_lazy as _
 from mongoengine import fields
 
+from timberjack import compression
 from timberjack.dereference import DjangoModelDereferenceMixin
 
 
@@ -58,18 +54,81 @@ class UserPKField(fields.DynamicField):
             self.error(message)
 
 
+class CompressedStringField(fields.StringField):
+    """
+    String field which is stored compressed when it exceeds the
+    `COMPRESSION` threshold. Values are decompressed on first access.
+    """
+    def __get__(self, instance, owner):
+        if instance is not None and compression.is_compressed(instance._data.get(self.name)):
+            value = compression.decompress(instance._data[self.name]).decode('utf-8')
+            instance._data[self.name] = value
+        return super(CompressedStringField, self).__get__(instance, owner)
+
+    def to_python(self, value):
+        if compression.is_compressed(value):
+            return value
+        return super(CompressedStringField, self).to_python(value)
+
+    def to_mongo(self, value):
+        if compression.is_compressed(value):
+            return value
+        value = self.to_python(value)
+        if value:
+            return compression.compress(value.encode('utf-8')) or value
+        return value
+
+    def validate(self, value):
+        if not compression.is_compressed(value):
+            super(CompressedStringField, self).validate(value)
+
+
 class ModelField(DjangoModelDereferenceMixin, fields.DictField):
     """
     Store a serialized model instance.
+
+    When compression is enabled, large serialized field values are stored
+    compressed, except the username field which is kept queryable.
     """
+    COMPRESSED_KEY = '_compressed'
+
     default_error_messages = {
         'required': _('Field is required and cannot be empty'),
         'non_model_instance': _('Value %(value)r is not a django.db.models.Model instance.')
     }
 
+    def __get__(self, instance, owner):
+        if instance is not None:
+            value = instance._data.get(self.name)
+            if isinstance(value, dict) and self.COMPRESSED_KEY in value:
+                instance._data[self.name] = self.decompress(value)
+        return super(ModelField, self).__get__(instance, owner)
+
+    @classmethod
+    def compress(cls, value, username_field=None):
+        config = compression.get_config()
+        if config is None or not isinstance(value.get('fields'), dict):
+            return value
+        data = compression.compress(json.dumps(value['fields'], sort_keys=True).encode('utf-8'), config)
+        if data is None:
+            return value
+        fields = {key: val for key, val in value['fields'].items() if key == username_field}
+        return dict(value, fields=fields, **{cls.COMPRESSED_KEY: data})
+
+    @classmethod
+    def decompress(cls, value):
+        value = dict(value)
+        fields = json.loads(compression.decompress(value.pop(cls.COMPRESSED_KEY)).decode('utf-8'))
+        value['fields'] = fields
+        return value
+
     def to_python(self, value):
+        if isinstance(value, dict) and self.COMPRESSED_KEY in value:
+            return value  # Decompressed lazily on access
         value = super(ModelField, self).to_python(value)
         if isinstance(value, dict) and all(key in value for key in ('fields', 'model', 'pk')):
+            from django.core import serializers
+            from django.core.serializers.base import DeserializationError
             try:
                 deserialized = next(serializers.deserialize('json', '[{value}]'.format(value=json.dumps(value)),
                                                             ignorenonexistent=True), None)
@@ -79,9 +138,14 @@ class ModelField(DjangoModelDereferenceMixin, fields.DictField):
         return value
 
     def to_mongo(self, value, use_db_field=True, fields=None, **options):
+        if isinstance(value, dict) and self.COMPRESSED_KEY in value:
+            return value
         if isinstance(value, Model):
+            from django.core import serializers
+            username_field = getattr(value, 'USERNAME_FIELD', None)
             value = serializers.serialize('json', [value], **options)
             value = json.loads(value[1:-1])  # Trim off square brackets!
+            value = self.compress(value, username_field)
         return super(ModelField, self).to_mongo(value, use_db_field, fields)
 
     def validate(self, value):
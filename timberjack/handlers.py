@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler
+
+from django.db.models import Model
+
+from timberjack.constants import ACTION_NAMES, ACTIONS
+
+logger = logging.getLogger(__name__)
+
+_action_flags = frozenset(flag for flag, label in ACTIONS)
+_sentinel = object()
+
+
+def get_action_flag(value):
+    """
+    Return the action flag for an action flag or action name, or None.
+    """
+    if value in _action_flags:
+        return value
+    return ACTION_NAMES.get(str(value).lower())
+
+
+class BatchListener(object):
+    """
+    Consume log records from a queue in a background thread, and write
+    them as access log entries in batches of up to `batch_size` records,
+    at least every `flush_interval` seconds.
+    """
+    def __init__(self, queue, batch_size=100, flush_interval=1.0):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # The thread doesn't survive a fork, so start one per process.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._thread = threading.Thread(target=self._monitor, name='timberjack-handler')
+                    self._thread.daemon = True
+                    self._thread.start()
+                    self._pid = os.getpid()
+
+    def stop(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self.queue.put(_sentinel)
+            self._thread.join()
+        self._pid = None
+
+    def _monitor(self):
+        batch, deadline, stopped = [], None, False
+        while not stopped:
+            timeout = max(deadline - time.time(), 0) if deadline is not None else None
+            try:
+                record = self.queue.get(timeout=timeout)
+                if record is _sentinel:
+                    stopped = True
+                else:
+                    batch.append(record)
+                    if deadline is None:
+                        deadline = time.time() + self.flush_interval
+            except queue.Empty:
+                pass
+            if batch and (stopped or len(batch) >= self.batch_size or time.time() >= deadline):
+                self.write(batch)
+                batch, deadline = [], None
+
+    def write(self, log_records):
+        from django.contrib.contenttypes.models import ContentType
+        from timberjack import policy, routers
+        from timberjack.conf import settings
+        from timberjack.documents import ObjectAccessLog, UserSnapshot
+        from timberjack.records import AccessRecord
+
+        # Records keyed by the Mongo alias picked by the routers, and
+        # whether they are reads stored in buckets.
+        records = {}
+        for log_record in log_records:
+            try:
+                obj = getattr(log_record, 'object', None)
+                content_type = getattr(log_record, 'content_type', None)
+                if content_type is None:
+                    content_type = ContentType.objects.get_for_model(obj, for_concrete_model=False)
+                object_pk = getattr(log_record, 'object_pk', None)
+                user, user_snapshot = log_record.user, None
+                action_flag = get_action_flag(log_record.action)
+                model_policy = policy.get_policy(content_type)
+                if not model_policy.allows(action_flag, user):
+                    continue
+                bucket = model_policy.bucket_reads and action_flag == ObjectAccessLog.READ_ACTION
+                alias = routers.db_for_write(content_type, user=user, request=getattr(log_record, 'request', None))
+                if settings.DEDUPLICATE_USERS and isinstance(user, Model):
+                    user_snapshot, user = UserSnapshot.store(user, using=alias)
+                changes = getattr(log_record, 'changes', None)
+                record = AccessRecord(
+                    user=user, content_type=content_type,
+                    object_pk=object_pk if object_pk is not None else obj.pk,
+                    object_repr=getattr(log_record, 'object_repr', None) or str(obj),
+                    action_flag=action_flag,
+                    message=log_record.getMessage(),
+                    change_message=[{'changed': {'fields': list(changes)}}] if changes is not None else None,
+                    log_level=model_policy.get_level(min(log_record.levelno // 10 * 10, 50)),
+                    ip_address=getattr(log_record, 'ip_address', None),
+                    user_snapshot=user_snapshot)
+                # Reject invalid records one by one, so they can't fail the batch.
+                record.validate()
+                records.setdefault((alias, bucket), []).append(record)
+            except Exception:
+                logger.exception('Could not convert log record %r to an access log entry.', log_record)
+
+        for (alias, bucket), routed in records.items():
+            try:
+                ObjectAccessLog.objects._write_records(routed, using=alias, bucket=bucket, validate=False)
+            except Exception:
+                logger.exception('Could not write %d access log entries.', len(routed))
+
+
+class TimberjackHandler(QueueHandler):
+    """
+    Logging handler which writes records carrying `user`, `object` and
+    `action` extras to the access log. Records are queued without blocking
+    and written in batches by a background thread; other records are ignored.
+
+    The object may also be given as `content_type` and `object_pk` extras,
+    optionally with `object_repr`. `ip_address` and `changes`, a list of
+    changed field names, are optional. A `request` extra is passed to the
+    `ROUTERS` as a hint. The audit policy of the model applies as it does
+    for `log_action()`.
+
+        LOGGING = {
+            'handlers': {
+                'timberjack': {
+                    'class': 'timberjack.handlers.TimberjackHandler',
+                    'batch_size': 100,
+                },
+            },
+            ...
+        }
+    """
+    def __init__(self, batch_size=100, flush_interval=1.0, queue_size=10000, level=logging.NOTSET):
+        super(TimberjackHandler, self).__init__(queue.Queue(queue_size))
+        self.setLevel(level)
+        self.listener = BatchListener(self.queue, batch_size=batch_size, flush_interval=flush_interval)
+        self.dropped = 0
+
+    def filter(self, record):
+        # Users are model instances, or serialized models written by `ModelField`.
+        if not isinstance(getattr(record, 'user', None), (Model, dict)):
+            return False
+        if get_action_flag(getattr(record, 'action', None)) is None:
+            return False
+        if getattr(record, 'object', None) is None and (getattr(record, 'content_type', None) is None or
+                                                         getattr(record, 'object_pk', None) is None):
+            return False
+        return super(TimberjackHandler, self).filter(record)
+
+    def prepare(self, record):
+        # Keep the extras, including model instances, as they are; the
+        # message is formatted when the entry is written.
+        return record
+
+    def enqueue(self, record):
+        self.listener.ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning('Timberjack handler queue is full; %d records dropped.', self.dropped)
+
+    def flush(self):
+        self.listener.stop()
+
+    def close(self):
+        self.listener.stop()
+        super(TimberjackHandler, self).close()
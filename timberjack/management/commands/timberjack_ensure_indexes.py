@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import PyMongoError
+
+from timberjack import routers
+from timberjack.buckets import ReadBucket
+from timberjack.documents import ObjectAccessLog, UserSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Create the indexes of the access log collections in MongoDB.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', action='append', dest='aliases', default=None,
+                            help='Mongo alias to create the indexes in, defaults to TIMBERJACK_DB_ALIAS. '
+                                 'May be given more than once.')
+
+    def handle(self, *args, **options):
+        try:
+            for alias in options['aliases'] or [None]:
+                for document in (ObjectAccessLog, UserSnapshot, ReadBucket):
+                    if alias is None:
+                        document.ensure_indexes()
+                    else:
+                        routers.ensure_indexes(document, routers.get_collection(document, alias))
+                    self.stdout.write('Created the indexes of %s%s.' % (
+                        document._get_collection_name(), ' in %s' % alias if alias else ''))
+        except PyMongoError as e:
+            raise CommandError('Could not create the indexes: %s' % e)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import PyMongoError
+
+from timberjack import routers, spool
+from timberjack.conf import settings
+from timberjack.documents import ObjectAccessLog
+
+
+class Command(BaseCommand):
+    help = 'Write access log entries from the local spool to MongoDB.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=500,
+                            help='Number of entries inserted per batch.')
+        parser.add_argument('--include-active', action='store_true', dest='include_active', default=False,
+                            help='Also replay files which are still open, and files left claimed by '
+                                 'replays which did not finish. Only use this when no process is '
+                                 'writing to or replaying the spool.')
+        parser.add_argument('--directory', dest='directory', default=None,
+                            help='Spool directory, defaults to the spool directory of the alias.')
+        parser.add_argument('--alias', dest='alias', default=None,
+                            help='Mongo alias to replay the entries into, defaults to TIMBERJACK_DB_ALIAS.')
+
+    def handle(self, *args, **options):
+        alias = options['alias']
+        if options['directory']:
+            directory = options['directory']
+        elif settings.SPOOL_DIR:
+            directory = spool.get_spool_dir(alias)
+        else:
+            raise CommandError('Set TIMBERJACK_SPOOL_DIR or pass --directory.')
+
+        if alias is None or alias == settings.DB_ALIAS:
+            collection = ObjectAccessLog._get_collection()
+        else:
+            collection = routers.get_collection(ObjectAccessLog, alias)
+
+        try:
+            if options['include_active']:
+                spool.recover_claimed_files(directory)
+            count = spool.replay(collection, directory,
+                                 batch_size=options['batch_size'], include_active=options['include_active'])
+        except (PyMongoError, OSError) as e:
+            raise CommandError('Replay stopped: %s. Entries which were not written remain in the spool.' % e)
+        self.stdout.write('Replayed %d entries.' % count)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from bson import SON
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+from timberjack.conf import settings
+from timberjack.documents import ObjectAccessLog
+from timberjack.utils import get_routing_key
+
+SHARD_KEY = SON([('routing_key', ASCENDING), ('timestamp', ASCENDING)])
+
+
+class Command(BaseCommand):
+    help = 'Set up the shard key and supporting indexes for the access log collection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', dest='backfill', default=False,
+                            help='Compute the routing key for existing entries which are missing it.')
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=1000,
+                            help='Number of entries updated per batch when backfilling.')
+        parser.add_argument('--no-shard', action='store_false', dest='shard', default=True,
+                            help='Only create the indexes, without sharding the collection.')
+
+    def handle(self, *args, **options):
+        if not settings.SHARDING:
+            raise CommandError('Set TIMBERJACK_SHARDING = True before setting up the shard key.')
+
+        collection = ObjectAccessLog._get_collection()
+        if options['backfill']:
+            self.backfill(collection, options['batch_size'])
+
+        collection.create_index(list(SHARD_KEY.items()))
+        self.stdout.write('Created index on %s.' % ', '.join(SHARD_KEY))
+
+        if options['shard']:
+            admin = collection.database.client.admin
+            try:
+                admin.command('enableSharding', collection.database.name)
+            except OperationFailure as e:
+                if 'already' not in str(e):
+                    raise CommandError('Could not enable sharding: %s' % e)
+            try:
+                admin.command('shardCollection', collection.full_name, key=SHARD_KEY)
+            except OperationFailure as e:
+                if 'already' not in str(e):
+                    raise CommandError('Could not shard %s: %s' % (collection.full_name, e))
+            self.stdout.write('Collection %s is sharded on %s.' % (collection.full_name, ', '.join(SHARD_KEY)))
+
+    def backfill(self, collection, batch_size):
+        cursor = collection.find({'routing_key': {'$exists': False}}, {'content_type.pk': 1, 'object_pk': 1})
+        count, requests = 0, []
+        for document in cursor:
+            routing_key = get_routing_key(document['content_type']['pk'], document['object_pk'])
+            requests.append(UpdateOne({'_id': document['_id']}, {'$set': {'routing_key': routing_key}}))
+            if len(requests) >= batch_size:
+                count += collection.bulk_write(requests, ordered=False).modified_count
+                requests = []
+        if requests:
+            count += collection.bulk_write(requests, ordered=False).modified_count
+        self.stdout.write('Set the routing key for %d entries.' % count)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from bson import json_util
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from timberjack.constants import ACTION_NAMES
+from timberjack.documents import ObjectAccessLog
+from timberjack.tail import tail
+
+
+class Command(BaseCommand):
+    help = 'Print new access log entries as newline delimited JSON as they are written.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--action', action='append', dest='actions', choices=sorted(ACTION_NAMES),
+                            help='Only print entries for this action. May be given multiple times.')
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Only print entries for this model, as app_label.ModelName. '
+                                 'May be given multiple times.')
+        parser.add_argument('--user', dest='username', help='Only print entries for this username.')
+        parser.add_argument('--resume-after', dest='resume_after',
+                            help='Resume after the position of a previously printed entry.')
+        parser.add_argument('--poll-interval', type=float, dest='poll_interval', default=1.0,
+                            help='Seconds between polls when change streams are unavailable.')
+
+    def get_queryset(self, options):
+        queryset = ObjectAccessLog.objects.all()
+        if options['actions']:
+            queryset = queryset.actions(*[ACTION_NAMES[action] for action in options['actions']])
+        if options['models']:
+            try:
+                models = [apps.get_model(label) for label in options['models']]
+            except (LookupError, ValueError) as e:
+                raise CommandError(str(e))
+            queryset = queryset.for_model(*models)
+        if options['username']:
+            queryset = queryset.for_user(options['username'])
+        return queryset
+
+    def handle(self, *args, **options):
+        resume_after = json_util.loads(options['resume_after']) if options['resume_after'] else None
+        entries = tail(self.get_queryset(options), resume_after=resume_after,
+                       poll_interval=options['poll_interval'])
+        try:
+            for position, entry in entries:
+                record = entry.get_context()
+                record.update(position=json.loads(json_util.dumps(position)),
+                              object_repr=entry.object_repr,
+                              message=entry.get_log_message() or str(entry))
+                self.stdout.write(json.dumps(record))
+                self.stdout.flush()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from timberjack import audit
+
+
+class AuditActorMiddleware(object):
+    """
+    Attribute bulk operations on audited models to the user and client IP
+    of the request. Place it after `AuthenticationMiddleware`.
+    """
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with audit.request_actor(request):
+            return self.get_response(request)
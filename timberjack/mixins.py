@@ -1,10 +1,69 @@
 # -*- coding: utf-8 -*-
 
-from django.apps import apps
-from django.core.exceptions import FieldDoesNotExist
-from django.db import models
-from django.forms import modelform_factory, ALL_FIELDS
-from timberjack.documents import ObjectAccessLog
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from timberjack import policy
+from timberjack.constants import CREATE_ACTION, DELETE_ACTION, READ_ACTION, UPDATE_ACTION
+
+ALL_FIELDS = '__all__'  # Same as `django.forms.models.ALL_FIELDS`
+
+# ModelForm classes, keyed by (concrete model, fields).
+_form_classes = {}
+
+
+def get_form_class(model, fields=ALL_FIELDS):
+    """
+    Return a cached ModelForm class for the concrete model of `model`, so
+    deferred and proxy model classes share the form class of their model.
+    """
+    model = model._meta.concrete_model
+    key = (model, fields if isinstance(fields, str) else tuple(fields))
+    if not is_registered(model):
+        # Replaced in the app registry, as after `apps.clear_cache()`; don't
+        # keep the form class of a stale model class.
+        _form_classes.pop(key, None)
+        from django.forms import modelform_factory
+        return modelform_factory(model, fields=fields)
+
+    form_class = _form_classes.get(key)
+    if form_class is None:
+        from django.forms import modelform_factory
+        form_class = _form_classes[key] = modelform_factory(model, fields=fields)
+    return form_class
+
+
+def is_registered(model):
+    """
+    Return True if `model` is the class the app registry has for its label.
+    """
+    from django.apps import apps
+    try:
+        return apps.get_registered_model(model._meta.app_label, model._meta.model_name) is model
+    except LookupError:
+        return False
+
+
+@receiver(setting_changed)
+def clear_form_classes(**kwargs):
+    # Stale model classes are also caught by `get_form_class()`.
+    if kwargs.get('setting', 'INSTALLED_APPS') == 'INSTALLED_APPS':
+        _form_classes.clear()
+
+
+def take_snapshot(instance):
+    """
+    Return a snapshot of the concrete field values of `instance`.
+    """
+    return {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields}
+
+
+def get_changed_fields(instance, snapshot):
+    """
+    Return the names of the fields of `instance` which differ from `snapshot`.
+    """
+    return [field.name for field in instance._meta.concrete_fields
+            if field.attname in snapshot and snapshot[field.attname] != field.value_from_object(instance)]
 
 
 class MethodActionMap(object):
@@ -12,11 +71,11 @@ class MethodActionMap(object):
     Class which maps HTTP methods to user actions.
     """
     action_map = {
-        "GET": ObjectAccessLog.READ_ACTION,
-        "POST": ObjectAccessLog.CREATE_ACTION,
-        "PUT": ObjectAccessLog.UPDATE_ACTION,
-        "PATCH": ObjectAccessLog.UPDATE_ACTION,
-        "DELETE": ObjectAccessLog.DELETE_ACTION,
+        "GET": READ_ACTION,
+        "POST": CREATE_ACTION,
+        "PUT": UPDATE_ACTION,
+        "PATCH": UPDATE_ACTION,
+        "DELETE": DELETE_ACTION,
     }
 
     def __init__(self, request):
@@ -32,6 +91,27 @@ class BaseObjectAccessLogMixin(object):
     Some docstring here..
     """
     method_action_map_class = MethodActionMap
+    track_changes = False
+
+    def get_object(self, *args, **kwargs):
+        """
+        If `track_changes` is enabled, take a snapshot of the instance
+        which is used to figure out changed fields without validating a form.
+        """
+        instance = super(BaseObjectAccessLogMixin, self).get_object(*args, **kwargs)
+        if self.track_changes and instance is not None:
+            instance._timberjack_snapshot = take_snapshot(instance)
+        return instance
+
+    def get_changed_fields(self, obj):
+        """
+        Return the changed field names of `obj` compared to the snapshot
+        taken when it was loaded, or None if no snapshot exists.
+        """
+        snapshot = getattr(obj, '_timberjack_snapshot', None)
+        if snapshot is None:
+            return None
+        return get_changed_fields(obj, snapshot)
 
     def get_method_action_map_class(self):
         assert self.method_action_map_class is not None, (
@@ -45,9 +125,17 @@ class BaseObjectAccessLogMixin(object):
         method_action_class = self.get_method_action_map_class()
         return method_action_class(request).method
 
+    def is_audited(self, request, obj, action_flag=None):
+        """
+        Return True if the audit policy of the model of `obj` logs `action_flag`,
+        defaulting to the action of the request, by the user.
+        """
+        if action_flag is None:
+            action_flag = self.get_method_action(request)
+        return policy.get_policy(obj).audits(action_flag, getattr(request, 'user', None))
+
     def get_form(self, request, obj):
-        return modelform_factory(apps.get_model(obj._meta.app_label, obj._meta.model_name),
-                                 fields=ALL_FIELDS)
+        return get_form_class(obj._meta.model)
 
     def construct_message(self, request, obj=None):
         """
@@ -56,32 +144,28 @@ class BaseObjectAccessLogMixin(object):
         """
         action_flag = self.get_method_action(request)
 
-        ModelForm = self.get_form(request, obj)
-        if request.method == 'POST':
-            form = ModelForm(request.POST, request.FILES, instance=obj)
-        else:
-            # NOTE: Do we need to care about this one?
-            if action_flag is ObjectAccessLog.CREATE_ACTION:
-                initial = dict(request.GET.items())
-                for key in initial:
-                    try:
-                        field = obj._meta.model._meta.get_field(key)
-                    except FieldDoesNotExist:
-                        continue
-                    if isinstance(field, models.ManyToManyField):
-                        initial[key] = initial[key].split(',')
-                form = ModelForm(initial=initial)
-            else:
-                form = ModelForm(instance=obj)
-
         message = []
-        if action_flag is ObjectAccessLog.CREATE_ACTION:
+        if action_flag is CREATE_ACTION:
             message.append({'created': {}})
-        elif action_flag is ObjectAccessLog.READ_ACTION:
+        elif action_flag is READ_ACTION:
             message.append({'read': {}})
-        elif action_flag is ObjectAccessLog.UPDATE_ACTION:
-            message.append({'updated': {'fields': form.changed_data}})
-        elif action_flag is ObjectAccessLog.DELETE_ACTION:
+        elif action_flag is UPDATE_ACTION:
+            changed_fields = self.get_changed_fields(obj) if self.track_changes else None
+            if changed_fields is None:
+                changed_fields = self.get_form_changed_data(request, obj)
+            message.append({'updated': {'fields': changed_fields}})
+        elif action_flag is DELETE_ACTION:
             message.append({'deleted': {}})
 
         return message
+
+    def get_form_changed_data(self, request, obj):
+        """
+        Figure out changed data by binding the request data to a form.
+        """
+        ModelForm = self.get_form(request, obj)
+        if request.method == 'POST':
+            form = ModelForm(request.POST, request.FILES, instance=obj)
+        else:
+            form = ModelForm(instance=obj)
+        return form.changed_data
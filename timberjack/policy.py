@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db.models import Model
+from django.dispatch import receiver
+
+from timberjack.conf import settings
+from timberjack.constants import ACTION_NAMES, ACTIONS
+
+ALL = '*'
+
+_registered = {}
+# The compiled (table, default) pair, replaced as a whole.
+_compiled = None
+_lock = threading.Lock()
+
+
+class Policy(object):
+    """
+    Compiled audit policy for a model.
+    """
+    __slots__ = ('enabled', 'actions', 'level', 'sample_rate', 'exclude_users', 'admin_log', 'bucket_reads')
+
+    def __init__(self, enabled=True, actions=None, level=None, sample_rate=1.0, exclude_users=(), admin_log=None,
+                 bucket_reads=False):
+        self.enabled = enabled
+        self.actions = frozenset(ACTION_NAMES.get(action, action) for action in actions) if actions is not None \
+            else frozenset(flag for flag, _ in ACTIONS)
+        self.level = level
+        self.sample_rate = sample_rate
+        self.exclude_users = frozenset(exclude_users)
+        self.admin_log = admin_log
+        self.bucket_reads = bucket_reads
+
+    def audits(self, action_flag, user=None):
+        """
+        Return True if `action_flag` by `user` is audited, before sampling.
+        """
+        if not self.enabled or action_flag not in self.actions:
+            return False
+        if self.exclude_users and isinstance(user, Model) and user.get_username() in self.exclude_users:
+            return False
+        return True
+
+    def allows(self, action_flag, user=None):
+        """
+        Return True if `action_flag` by `user` should be logged, after sampling.
+        """
+        if not self.audits(action_flag, user):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def get_level(self, default):
+        return self.level if self.level is not None else default
+
+    def get_admin_log(self, default):
+        return self.admin_log if self.admin_log is not None else default
+
+
+def register(enabled=True, actions=None, level=None, sample_rate=1.0, exclude_users=(), admin_log=None,
+             bucket_reads=False):
+    """
+    Class decorator which sets the audit policy of a model. Policies in the
+    `POLICIES` setting take precedence.
+
+        @policy.register(actions=('create', 'update', 'delete'), level=30)
+        class Invoice(models.Model):
+            ...
+    """
+    options = dict(enabled=enabled, actions=actions, level=level, sample_rate=sample_rate,
+                   exclude_users=exclude_users, admin_log=admin_log, bucket_reads=bucket_reads)
+
+    def decorator(model):
+        _registered['%s.%s' % (model._meta.app_label, model._meta.model_name)] = options
+        invalidate()
+        return model
+    return decorator
+
+
+def compile_policy(label, options):
+    """
+    Return the `Policy` for the `options` of `label`. Raises
+    ImproperlyConfigured for unknown options and action names.
+    """
+    flags = frozenset(flag for flag, _ in ACTIONS)
+    for action in options.get('actions') or ():
+        if action not in ACTION_NAMES and action not in flags:
+            raise ImproperlyConfigured('Unknown action %r in the audit policy of %r; use one of %s.' % (
+                action, label, ', '.join(sorted(ACTION_NAMES))))
+    try:
+        return Policy(**options)
+    except TypeError as e:
+        raise ImproperlyConfigured('Invalid audit policy of %r: %s' % (label, e))
+
+
+def compile_policies():
+    """
+    Resolve the policy of every installed model into a lookup table keyed by
+    `(app_label, model_name)`. An exact model label takes precedence over an
+    'app_label.*' wildcard, which takes precedence over '*'.
+    """
+    from django.apps import apps
+
+    configured = dict((label.lower(), options) for label, options in _registered.items())
+    configured.update((label.lower(), options) for label, options in settings.POLICIES.items())
+    compiled = dict((label, compile_policy(label, options)) for label, options in configured.items())
+
+    default = compiled.get(ALL, Policy())
+    table = {}
+    for model in apps.get_models():
+        app_label, model_name = model._meta.app_label, model._meta.model_name
+        table[app_label, model_name] = compiled.get('%s.%s' % (app_label, model_name),
+                                                    compiled.get('%s.%s' % (app_label, ALL), default))
+    return table, default
+
+
+def load():
+    """
+    Compile the policies unless they are compiled already, and return
+    the `(table, default)` pair.
+    """
+    global _compiled
+    with _lock:
+        if _compiled is None:
+            _compiled = compile_policies()
+        return _compiled
+
+
+def get_policy(model):
+    """
+    Return the policy for a content type, or a model class or instance.
+    """
+    # Read the pair once; `invalidate()` may reset it meanwhile.
+    compiled = _compiled
+    table, default = compiled if compiled is not None else load()
+    if hasattr(model, 'model_class'):
+        key = (model.app_label, model.model)
+    else:
+        key = (model._meta.app_label, model._meta.model_name)
+    return table.get(key, default)
+
+
+def invalidate():
+    global _compiled
+    with _lock:
+        _compiled = None
+
+
+@receiver(setting_changed)
+def clear_policies(**kwargs):
+    if kwargs['setting'] in ('TIMBERJACK_POLICIES', 'INSTALLED_APPS'):
+        invalidate()
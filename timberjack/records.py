@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+from bson import BSON, Binary, ObjectId
+from django.db.models import Model
+from django.utils import timezone
+from django.utils.encoding import force_text
+from mongoengine import ValidationError
+
+from timberjack import compression
+from timberjack.conf import settings
+from timberjack.constants import ACTIONS, LOG_LEVEL
+from timberjack.fields import ModelField
+from timberjack.utils import get_routing_key, pack_ip_address
+from timberjack.validators import validate_ip_address
+
+_action_flags = frozenset(flag for flag, _ in ACTIONS)
+_log_levels = frozenset(level for level, _ in LOG_LEVEL)
+
+
+def serialize_model(value):
+    """
+    Serialize a model instance the way `ModelField` stores it. Already
+    serialized values are returned as is.
+    """
+    if isinstance(value, Model):
+        return ModelField().to_mongo(value)
+    return value
+
+
+class AccessRecord(object):
+    """
+    A flat, slotted access log entry for the write path. Converts straight to
+    the stored format of `ObjectAccessLog`, without building a document.
+    """
+    __slots__ = ('id', 'user', 'content_type', 'object_pk', 'object_repr', 'action_flag', 'message',
+                 'change_message', 'log_level', 'ip_address', 'ip_address_packed', 'admin_log_pk',
+                 'routing_key', 'user_snapshot', 'timestamp')
+
+    def __init__(self, user, content_type, object_pk, object_repr, action_flag, message='',
+                 change_message=None, log_level=20, ip_address=None, user_snapshot=None,
+                 timestamp=None, id=None):
+        from timberjack.documents import SubMessage
+
+        self.id = id or ObjectId()
+        self.user = serialize_model(user)
+        self.content_type = serialize_model(content_type)
+        self.object_pk = object_pk
+        self.object_repr = force_text(object_repr)[:200]
+        self.action_flag = action_flag
+        self.message = message
+        self.change_message = None
+        if change_message is not None:
+            self.change_message = [sub_message for sub_message in map(SubMessage.parse, change_message)
+                                   if sub_message]
+        self.log_level = log_level
+        self.ip_address = ip_address
+        self.ip_address_packed = None
+        self.admin_log_pk = None
+        self.routing_key = None
+        self.user_snapshot = user_snapshot
+        # MongoDB stores milliseconds; truncate so the record equals the stored entry.
+        timestamp = timestamp or timezone.now()
+        self.timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+    @property
+    def pk(self):
+        return self.id
+
+    def validate(self):
+        """
+        Check the values which the `ObjectAccessLog` fields would reject,
+        and set the derived `routing_key` and `ip_address_packed` values.
+        Raises `mongoengine.ValidationError`.
+        """
+        errors = {}
+        for name in ('user', 'content_type', 'object_pk', 'object_repr'):
+            if getattr(self, name) in (None, '', {}):
+                errors[name] = 'Field is required'
+            elif name in ('user', 'content_type') and not isinstance(getattr(self, name), dict):
+                errors[name] = 'Value must be a model instance or a serialized model'
+        if self.action_flag not in _action_flags:
+            errors['action_flag'] = 'Value must be one of %r' % sorted(_action_flags)
+        if self.log_level not in _log_levels:
+            errors['log_level'] = 'Value must be one of %r' % sorted(_log_levels)
+        if self.ip_address:
+            try:
+                validate_ip_address(self.ip_address)
+                self.ip_address_packed = pack_ip_address(self.ip_address)
+            except (ValidationError, ValueError) as e:
+                errors['ip_address'] = str(e)
+        if errors:
+            raise ValidationError('ValidationError (ObjectAccessLog:%s)' % self.id, errors=errors)
+
+        if settings.SHARDING and self.routing_key is None and not isinstance(self.object_pk, list):
+            self.routing_key = get_routing_key(self.content_type['pk'], self.object_pk)
+
+    def _get_fields(self, value):
+        if ModelField.COMPRESSED_KEY in value:
+            value = ModelField.decompress(value)
+        return value.get('fields') or {}
+
+    def get_context(self):
+        """
+        Return the context of `ObjectAccessLog.get_context()` for the record.
+        """
+        content_type = self._get_fields(self.content_type)
+        return {
+            'pk': str(self.id),
+            'action_flag': self.action_flag,
+            'content_type': '{app_label}.{model}'.format(app_label=content_type.get('app_label'),
+                                                         model=content_type.get('model')),
+            'user_pk': self.user.get('pk'),
+            'object_pk': self.object_pk,
+            'timestamp': str(self.timestamp),
+            'ip_address': self.ip_address,
+            'referrer': None,
+        }
+
+    def get_human_message(self):
+        """
+        Return the message of `ObjectAccessLog.get_human_message(include_context=True)`
+        for the record, without building a document.
+        """
+        from django.contrib.auth import get_user_model
+        from timberjack.documents import (SubMessage, format_human_message, get_action_message,
+                                          render_sub_messages)
+
+        if self.change_message:
+            action_message = render_sub_messages([SubMessage(**sub_message) for sub_message in self.change_message])
+        elif self.message and self.message[0] == '[':
+            # Legacy JSON messages are parsed by the document.
+            return self.to_document().get_human_message(include_context=True)
+        else:
+            action_message = get_action_message(self.action_flag, self.object_repr, self.message)
+        # The username field is kept uncompressed.
+        username = self.user.get('fields', {}).get(get_user_model().USERNAME_FIELD)
+        return format_human_message(username, action_message, self.timestamp, self.ip_address, self.get_context())
+
+    def to_mongo(self):
+        """
+        Return the record as a dict in the stored format of `ObjectAccessLog`.
+        """
+        data = {'_id': self.id}
+        for name in self.__slots__[1:]:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        if self.message:
+            data['message'] = compression.compress(self.message.encode('utf-8')) or self.message
+        if self.ip_address_packed is not None:
+            data['ip_address_packed'] = Binary(self.ip_address_packed)
+        return data
+
+    def to_bson(self):
+        return BSON.encode(self.to_mongo())
+
+    def to_document(self):
+        """
+        Return the record as an `ObjectAccessLog` document.
+        """
+        from timberjack.documents import ObjectAccessLog
+        return ObjectAccessLog._from_son(self.to_mongo())
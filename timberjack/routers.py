@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from concurrent.futures import TimeoutError
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from mongoengine.connection import get_db
+from pymongo.errors import PyMongoError
+
+from timberjack import connection, spool
+from timberjack.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_routers = None
+# Collections keyed by (document class, alias).
+_collections = {}
+_lock = threading.Lock()
+
+
+class BaseRouter(object):
+    """
+    Base class for access log routers. Both methods return a Mongo alias
+    from `MONGO_CONNECTIONS`, or None to let the next router decide.
+    `content_type` is None for reads which aren't limited to one model.
+    Hints may include `user` and `request`, `username` for reads by a
+    username, and `content_types` for reads of several models.
+
+        class TenantRouter(BaseRouter):
+            def db_for_write(self, content_type, **hints):
+                request = hints.get('request')
+                return request.tenant.mongo_alias if request is not None else None
+
+            db_for_read = db_for_write
+    """
+    def db_for_write(self, content_type, **hints):
+        return None
+
+    def db_for_read(self, content_type, **hints):
+        return None
+
+
+def get_routers():
+    global _routers
+    if _routers is None:
+        _routers = [import_string(router)() if isinstance(router, str) else router
+                    for router in settings.ROUTERS]
+    return _routers
+
+
+def _route(method, content_type, hints):
+    for router in get_routers():
+        alias = getattr(router, method)(content_type, **hints)
+        if alias:
+            return alias
+    return None
+
+
+def db_for_write(content_type, **hints):
+    """
+    Return the alias the routers pick for writing entries for `content_type`,
+    or None for the default `DB_ALIAS`.
+    """
+    return _route('db_for_write', content_type, hints)
+
+
+def db_for_read(content_type, **hints):
+    """
+    Return the alias the routers pick for reading entries for `content_type`,
+    or None for the default `DB_ALIAS`.
+    """
+    return _route('db_for_read', content_type, hints)
+
+
+def get_collection(document, alias):
+    """
+    Return the collection of `document` in the database of `alias`. Collections
+    are created, and their indexes ensured, once per alias and process; the
+    clients behind them are shared by mongoengine. Indexes are created within
+    the latency budget of the spooling writer of the alias, and retried on the
+    next call if that fails.
+    """
+    collection = _collections.get((document, alias))
+    if collection is None:
+        with _lock:
+            collection = _collections.get((document, alias))
+            if collection is None:
+                if settings.MANAGE_CONNECTION and alias not in connection._registered:
+                    connection.register(alias)
+                # Never switch the database of the document class, which other
+                # threads keep using for the default alias meanwhile.
+                collection = get_db(alias)[document._get_collection_name()]
+                if document._meta.get('auto_create_index', True):
+                    try:
+                        spool.call(ensure_indexes, document, collection, alias=alias)
+                    except spool.CircuitOpenError:
+                        return collection
+                    except (PyMongoError, TimeoutError) as e:
+                        logger.warning('Could not create the indexes of %s in %s: %r',
+                                       collection.name, alias, e)
+                        return collection
+                _collections[document, alias] = collection
+    return collection
+
+
+def ensure_indexes(document, collection):
+    """
+    Create the indexes declared by `document` on `collection`, like
+    `Document.ensure_indexes()` does for the collection of the document.
+    """
+    background = document._meta.get('index_background', False)
+    index_opts = document._meta.get('index_opts') or {}
+    for spec in document._meta['index_specs']:
+        spec = spec.copy()
+        fields = spec.pop('fields')
+        opts = dict(index_opts, **spec)
+        opts.pop('cls', None)
+        collection.create_index(fields, background=background, **opts)
+
+
+@connection.register_after_fork
+def reset_collections():
+    global _lock
+    _lock = threading.Lock()
+    _collections.clear()
+
+
+@receiver(setting_changed)
+def clear_routers(**kwargs):
+    global _routers
+    if kwargs['setting'] == 'TIMBERJACK_ROUTERS':
+        _routers = None
+    elif kwargs['setting'] == 'MONGO_CONNECTIONS':
+        _collections.clear()
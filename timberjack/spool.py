@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import glob
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from bson import BSON, decode_file_iter
+from bson.errors import InvalidBSON
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from timberjack import connection
+from timberjack.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_SUFFIX = '.active.bson'
+READY_SUFFIX = '.bson'
+# Suffix of ready files claimed by a replay.
+REPLAYING_SUFFIX = '.replaying'
+DUPLICATE_KEY_ERROR = 11000
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised by `SpoolingWriter.call()` while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Open after `threshold` consecutive failures, and let a single
+    trial call through once `reset_timeout` seconds have passed.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    logger.warning('Timberjack circuit breaker opened after %d failures.', self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+
+class Spool(object):
+    """
+    Append-only local file of BSON documents, synced to disk at most once
+    per `fsync_interval` seconds. The active file is renamed to a ready file
+    when it grows beyond `max_bytes` or the process exits, and ready files
+    are replayed by `replay()`.
+    """
+    def __init__(self, directory, max_bytes, fsync_interval):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._synced_at = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        name = '%s-%d-%d%s' % (socket.gethostname(), os.getpid(), int(time.time() * 1000), ACTIVE_SUFFIX)
+        self._file = open(os.path.join(self.directory, name), 'ab')
+
+    def append(self, documents):
+        """
+        Append `documents`, or log and drop them if the spool can't be
+        written, so a full disk never fails the request being logged.
+        """
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._open()
+                self._file.write(b''.join(BSON.encode(document) for document in documents))
+                self._file.flush()
+                if time.time() - self._synced_at >= self.fsync_interval:
+                    os.fsync(self._file.fileno())
+                    self._synced_at = time.time()
+                if self._file.tell() >= self.max_bytes:
+                    self._rotate()
+            except OSError as e:
+                logger.error('Dropping %d timberjack entries, the spool can not be written: %r', len(documents), e)
+                self._abandon()
+
+    def _rotate(self):
+        path = self._file.name
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.rename(path, path[:-len(ACTIVE_SUFFIX)] + READY_SUFFIX)
+
+    def _abandon(self):
+        # Hand the file over to the replay as is; a partly written
+        # entry at its end is skipped when it is replayed.
+        file, self._file = self._file, None
+        if file is None:
+            return
+        try:
+            file.close()
+        except OSError:
+            pass
+        try:
+            os.rename(file.name, file.name[:-len(ACTIVE_SUFFIX)] + READY_SUFFIX)
+        except OSError:
+            pass
+
+    def rotate(self):
+        with self._lock:
+            if self._file is not None:
+                self._rotate()
+
+    def discard(self):
+        """
+        Forget the active file without closing it; used in forked children,
+        where the file belongs to the parent process.
+        """
+        self._file = None
+        self._lock = threading.Lock()
+
+
+def get_ready_files(directory, include_active=False):
+    files = []
+    for path in glob.glob(os.path.join(directory, '*' + READY_SUFFIX)):
+        if include_active or not path.endswith(ACTIVE_SUFFIX):
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                pass  # Claimed by another replay meanwhile.
+    return [path for mtime, path in sorted(files)]
+
+
+def recover_claimed_files(directory):
+    """
+    Release the files claimed by replays which didn't finish, such as those
+    of killed processes. Only call this when no replay is running.
+    """
+    for path in glob.glob(os.path.join(directory, '*' + READY_SUFFIX + REPLAYING_SUFFIX)):
+        os.rename(path, path[:-len(REPLAYING_SUFFIX)])
+
+
+def insert(collection, documents):
+    """
+    Insert `documents`, ignoring those which were inserted before.
+    """
+    try:
+        if len(documents) == 1:
+            collection.insert_one(documents[0])
+        else:
+            collection.insert_many(documents, ordered=False)
+    except DuplicateKeyError:
+        pass
+    except BulkWriteError as e:
+        if any(error['code'] != DUPLICATE_KEY_ERROR for error in e.details.get('writeErrors', [])):
+            raise
+        if e.details.get('writeConcernErrors'):
+            raise
+
+
+def _replay_file(collection, path, batch_size):
+    count = 0
+    with open(path, 'rb') as f:
+        batch = []
+        try:
+            for document in decode_file_iter(f):
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    insert(collection, batch)
+                    count += len(batch)
+                    batch = []
+        except InvalidBSON as e:
+            logger.error('Skipping the partly written end of timberjack spool file %s: %r', path, e)
+        if batch:
+            insert(collection, batch)
+            count += len(batch)
+    return count
+
+
+def replay(collection, directory=None, batch_size=500, include_active=False):
+    """
+    Insert the spooled entries in batches and remove each file once it has been
+    replayed. Each file is first claimed by renaming it, so concurrent replays
+    never replay the same file; a file which fails is released again. Entries
+    keep their ids, so replaying a file twice is harmless. Returns the number
+    of replayed entries.
+    """
+    directory = directory or settings.SPOOL_DIR
+    count = 0
+    for path in get_ready_files(directory, include_active=include_active):
+        claimed = path + REPLAYING_SUFFIX
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            continue  # Claimed by another replay.
+        try:
+            count += _replay_file(collection, claimed, batch_size)
+        except Exception:
+            os.rename(claimed, path)
+            raise
+        os.remove(claimed)
+        logger.info('Replayed timberjack spool file %s.', path)
+    return count
+
+
+def get_spool_dir(alias=None):
+    """
+    Return the spool directory for entries of the Mongo `alias`. Entries for
+    aliases other than `DB_ALIAS` are spooled in a subdirectory named after
+    the alias, so they are replayed into the right database.
+    """
+    if alias is None or alias == settings.DB_ALIAS:
+        return settings.SPOOL_DIR
+    return os.path.join(settings.SPOOL_DIR, alias)
+
+
+class SpoolingWriter(object):
+    """
+    Write entries to MongoDB within a latency budget, behind a circuit breaker.
+    Entries which can't be written in time are appended to the spool instead.
+    """
+    def __init__(self, alias=None):
+        self.breaker = CircuitBreaker(settings.BREAKER_THRESHOLD, settings.BREAKER_RESET_TIMEOUT)
+        self.spool = Spool(get_spool_dir(alias), settings.SPOOL_MAX_BYTES, settings.SPOOL_FSYNC_INTERVAL)
+        self.write_timeout = settings.WRITE_TIMEOUT
+        self.replay_interval = settings.SPOOL_REPLAY_INTERVAL
+        self._executor = None
+        self._replay_thread = None
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call `func` within the latency budget, behind the circuit breaker.
+        Raises `CircuitOpenError` while the breaker is open, and
+        `concurrent.futures.TimeoutError` if the call takes too long.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError()
+        try:
+            if self.write_timeout is None:
+                result = func(*args, **kwargs)
+            else:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=4)
+                result = self._executor.submit(func, *args, **kwargs).result(timeout=self.write_timeout)
+        except (PyMongoError, TimeoutError):
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        return result
+
+    def write(self, collection, documents):
+        try:
+            # A write which times out may still complete; the spooled
+            # copy has the same id and is skipped when replayed.
+            self.call(insert, collection, documents)
+            return
+        except CircuitOpenError:
+            pass
+        except (PyMongoError, TimeoutError) as e:
+            logger.warning('Spooling %d timberjack entries: %r', len(documents), e)
+
+        self.spool.append(documents)
+        self._start_replay(collection)
+
+    def _start_replay(self, collection):
+        interval = self.replay_interval
+        if interval is None or (self._replay_thread is not None and self._replay_thread.is_alive()):
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                if not self.breaker.allow():
+                    continue
+                try:
+                    self.spool.rotate()
+                    replay(collection, self.spool.directory)
+                    self.breaker.success()
+                    return
+                except (PyMongoError, OSError):
+                    logger.exception('Error replaying the timberjack spool.')
+                    self.breaker.failure()
+
+        self._replay_thread = threading.Thread(target=run, name='timberjack-replay')
+        self._replay_thread.daemon = True
+        self._replay_thread.start()
+
+    def close(self):
+        self.spool.rotate()
+
+
+# Spooling writers of the process, keyed by Mongo alias.
+_writers = {}
+_writer_lock = threading.Lock()
+
+
+def get_writer(alias=None):
+    """
+    Return the spooling writer of the process for the Mongo `alias`,
+    or None if no `SPOOL_DIR` is set.
+    """
+    if not settings.SPOOL_DIR:
+        return None
+    alias = alias or settings.DB_ALIAS
+    writer = _writers.get(alias)
+    if writer is None:
+        with _writer_lock:
+            writer = _writers.get(alias)
+            if writer is None:
+                writer = _writers[alias] = SpoolingWriter(alias)
+    return writer
+
+
+def write(collection, documents, alias=None):
+    """
+    Insert `documents`, spooling them locally if MongoDB is slow or unavailable
+    and a `SPOOL_DIR` is configured. `alias` is the Mongo alias of `collection`.
+    """
+    writer = get_writer(alias)
+    if writer is None:
+        if len(documents) == 1:
+            collection.insert_one(documents[0])
+        else:
+            collection.insert_many(documents)
+    else:
+        writer.write(collection, documents)
+
+
+def call(func, *args, alias=None, **kwargs):
+    """
+    Call `func` like `SpoolingWriter.call()` with the spooling writer of the
+    Mongo `alias`, or directly if no `SPOOL_DIR` is set.
+    """
+    writer = get_writer(alias)
+    if writer is None:
+        return func(*args, **kwargs)
+    return writer.call(func, *args, **kwargs)
+
+
+@atexit.register
+def _close():
+    for writer in list(_writers.values()):
+        writer.close()
+
+
+@connection.register_after_fork
+def _reset_writer():
+    global _writer_lock
+    _writer_lock = threading.Lock()
+    for writer in list(_writers.values()):
+        writer.spool.discard()
+    _writers.clear()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import time
+from collections import deque
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from timberjack.documents import ObjectAccessLog
+
+
+def _prefix_query(query, prefix):
+    """
+    Rewrite the field names of a Mongo `query` so it can be used to match
+    against the `prefix` sub document, i.e. `fullDocument` in change events.
+    """
+    prefixed = {}
+    for key, value in query.items():
+        if key in ('$and', '$or', '$nor'):
+            prefixed[key] = [_prefix_query(sub_query, prefix) for sub_query in value]
+        elif key.startswith('$'):
+            prefixed[key] = value
+        else:
+            prefixed['%s.%s' % (prefix, key)] = value
+    return prefixed
+
+
+def _watch(collection, query, resume_after, batch_size):
+    match = dict(_prefix_query(query, 'fullDocument'), operationType='insert')
+    with collection.watch([{'$match': match}], resume_after=resume_after, batch_size=batch_size) as stream:
+        for change in stream:
+            yield change['_id'], ObjectAccessLog._from_son(change['fullDocument'])
+
+
+def _poll(collection, query, resume_after, poll_interval, batch_size, lag):
+    # Object ids are generated by the clients, so entries may be inserted
+    # slightly out of order. Look back `lag` seconds from the last seen
+    # entry, and skip the entries which have already been yielded.
+    seen, seen_order = set(), deque()
+    if resume_after is None:
+        latest = next(collection.find(query, {'_id': 1}).sort('_id', -1).limit(1), None)
+        resume_after = latest['_id'] if latest else ObjectId()
+    start = last = ObjectId(resume_after)
+
+    while True:
+        since = ObjectId.from_datetime(last.generation_time - datetime.timedelta(seconds=lag))
+        found = False
+        cursor = collection.find(dict(query, _id={'$gt': since}), batch_size=batch_size).sort('_id', 1)
+        for document in cursor:
+            if document['_id'] <= start or document['_id'] in seen:
+                continue
+            found = True
+            seen.add(document['_id'])
+            seen_order.append(document['_id'])
+            if len(seen_order) > 10000:
+                seen.discard(seen_order.popleft())
+            last = max(last, document['_id'])
+            yield document['_id'], ObjectAccessLog._from_son(document)
+        if not found:
+            time.sleep(poll_interval)
+
+
+def tail(queryset=None, resume_after=None, poll_interval=1.0, batch_size=100, lag=5, use_change_stream=True):
+    """
+    Yield `(position, entry)` tuples for new entries matching `queryset` as
+    they are written. Pass a previously yielded position as `resume_after`
+    to continue where a previous tail left off.
+
+    Change streams are used if the server supports them, in which case the
+    positions are resume tokens. Otherwise the collection is polled every
+    `poll_interval` seconds for entries with a greater `_id`, and the positions
+    are ObjectIds.
+    """
+    queryset = queryset if queryset is not None else ObjectAccessLog.objects
+    collection, query = queryset._collection, queryset._query
+
+    if use_change_stream and hasattr(collection, 'watch') and not isinstance(resume_after, ObjectId):
+        try:
+            for item in _watch(collection, query, resume_after, batch_size):
+                yield item
+            return
+        except OperationFailure as e:
+            # Change streams require a replica set or sharded cluster.
+            if resume_after is not None or e.code not in (40573, 40324):
+                raise
+    for item in _poll(collection, query, resume_after, poll_interval, batch_size, lag):
+        yield item
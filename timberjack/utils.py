@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import ipaddress
+import threading
+from collections import OrderedDict
+
+from timberjack.conf import settings
+
+
+class LRUCache(object):
+    """
+    Thread safe mapping which evicts the least recently used
+    entries when growing beyond `maxsize`. The `maxsize` may be
+    a callable, in which case it is evaluated on every insert.
+    """
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def maxsize(self):
+        return self._maxsize() if callable(self._maxsize) else self._maxsize
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        maxsize = self.maxsize
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def get_routing_key(content_type_pk, object_pk):
+    """
+    Return a signed 64 bit hash of (content type, object pk), used to
+    distribute the history of each object evenly across shards.
+    """
+    value = '{}:{}'.format(content_type_pk, object_pk).encode('utf-8')
+    return int.from_bytes(hashlib.md5(value).digest()[:8], 'big', signed=True)
+
+
+def pack_ip_address(value):
+    """
+    Return `value` as a fixed width, 16 byte big endian representation
+    which sorts in address order. IPv4 addresses are stored as IPv4-mapped
+    IPv6 addresses. Raises ValueError for invalid addresses.
+    """
+    address = ipaddress.ip_address(value)
+    if address.version == 4:
+        return b'\x00' * 10 + b'\xff' * 2 + address.packed
+    return address.packed
+
+
+def pack_ip_network(value):
+    """
+    Return the first and last packed addresses of the network `value`,
+    which may be given in CIDR notation.
+    """
+    network = ipaddress.ip_network(value, strict=False)
+    return pack_ip_address(network.network_address), pack_ip_address(network.broadcast_address)
+
+
+_trusted_proxies = {}
+
+
+def get_trusted_proxies():
+    """
+    Return the `TRUSTED_PROXIES` setting as a tuple of networks,
+    or None if the X-Forwarded-For header should be trusted blindly.
+    """
+    value = settings.TRUSTED_PROXIES
+    if value is None:
+        return None
+    key = tuple(value)
+    if key not in _trusted_proxies:
+        _trusted_proxies[key] = tuple(ipaddress.ip_network(network, strict=False) for network in key)
+    return _trusted_proxies[key]
+
+
+def _is_trusted(address, proxies):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in proxies)
+
+
+def get_client_ip(request):
+    """
+    Return the IP address of the client which made `request`. If the
+    request came through trusted proxies, the X-Forwarded-For chain is
+    walked from the right, and the first untrusted address is returned.
+    """
+    remote_addr = request.META.get('REMOTE_ADDR')
+    forwarded_for = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+                     if address.strip()]
+    proxies = get_trusted_proxies()
+    if proxies is None:
+        return forwarded_for[0] if forwarded_for else remote_addr
+
+    if not forwarded_for or not _is_trusted(remote_addr, proxies):
+        return remote_addr
+    for address in reversed(forwarded_for):
+        if not _is_trusted(address, proxies):
+            return address
+    return forwarded_for[0]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from django.apps import apps
+from django.db import DatabaseError
+
+from timberjack.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        for child in _subclasses(subclass):
+            yield child
+
+
+def get_warmup_models():
+    """
+    Return the models logged through `TimberjackMixin` admins, through
+    imported subclasses of `BaseObjectAccessLogMixin` and the models
+    listed in the `WARMUP_MODELS` setting.
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.contenttypes.models import ContentType
+    from timberjack.mixins import BaseObjectAccessLogMixin
+
+    models = {get_user_model(), ContentType}
+    if apps.is_installed('django.contrib.admin'):
+        from django.contrib import admin
+        from timberjack.admin import TimberjackMixin
+        models.update(model for model, model_admin in admin.site._registry.items()
+                      if isinstance(model_admin, TimberjackMixin))
+
+    for view_class in _subclasses(BaseObjectAccessLogMixin):
+        queryset = getattr(view_class, 'queryset', None)
+        model = getattr(queryset, 'model', None) or getattr(view_class, 'model', None)
+        if model is not None:
+            models.add(model)
+
+    models.update(apps.get_model(label) for label in settings.WARMUP_MODELS)
+    return models
+
+
+def warm_up(models=None):
+    """
+    Prepare everything needed to log access to `models`, so the first
+    request for each model doesn't pay for it: content types, serializer
+    and field metadata and ModelForm classes. It doesn't connect to MongoDB,
+    so it is safe in a preforking master; use the `timberjack_ensure_indexes`
+    command to create the indexes.
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from django.core import serializers
+    from timberjack.mixins import get_form_class
+
+    start = time.time()
+    models = get_warmup_models() if models is None else set(models)
+
+    serializers.get_serializer('json')
+    for model in models:
+        # Prime the cached field lists used by the serializers.
+        model._meta.get_fields()
+        get_form_class(model)
+
+    try:
+        ContentType.objects.get_for_models(*models, for_concrete_models=False)
+    except DatabaseError:
+        logger.warning('Could not warm up content types; is the database migrated?', exc_info=True)
+
+    logger.info('Timberjack warm-up of %d models took %.1f ms.', len(models), (time.time() - start) * 1000)
+    return models